@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List
+
+import pandas as pd
+
+from db.profile_cache import ProfileCache
+from db.read_only_engine import create_read_only_engine
+from flex_metric_config import Config
+from flex_metrics import FlexMetrics
+from flex_metrics_results import Results
+
+
+class AsyncFlexMetrics():
+    '''
+    asyncio API of FlexMetrics. The scenarios are evaluated in a bounded pool of threads that share one read-only engine
+    and one profile cache, so the event loop is never blocked by the database.
+
+    Work of overlapping requests is shared at two levels: identical requests that arrive while one is in flight wait for
+    its result instead of being evaluated again, and profile lookups that are in flight for another scenario are
+    coalesced by the cache (see ProfileCache.load_many).
+    '''
+
+    def __init__(self, db_file: Path, workers: int = 8, cache: ProfileCache = None, use_scenario_aggregates: bool = True) -> None:
+        '''
+        Args:
+            workers: amount of scenarios that are evaluated concurrently, every worker can use its own database connection.
+            cache: cache for the profiles fetched from the database. By default the cache that is shared by all users of the database file.
+        '''
+        if not db_file.exists():
+            raise FileNotFoundError(f"Database file '{db_file}' is missing")
+        self.db_file = db_file
+        self.cache = cache if cache is not None else ProfileCache.shared(db_file)
+        self.use_scenario_aggregates = use_scenario_aggregates
+        self.engine = create_read_only_engine(db_file, pool_size=workers)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="async-flex-metrics")
+        self.__in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    async def determine_flex_power(self, config: Config) -> Results:
+        return await self.__single_flight(('determine_flex_power', repr(config)), lambda: self.__flex_metrics(config).determine_flex_power())
+
+    async def determine_flex_power_many(self, configs: List[Config]) -> List[Results]:
+        '''Determine the flex power of many scenarios with bulk lookups, see FlexMetrics.determine_flex_power_many'''
+        if not configs:
+            return []
+        return await self.__single_flight(('determine_flex_power_many', repr(configs)), lambda: self.__flex_metrics(configs[0]).determine_flex_power_many(configs))
+
+    async def fetch_baselines(self, config: Config) -> pd.DataFrame:
+        return await self.__single_flight(('fetch_baselines', repr(config)), lambda: self.__flex_metrics(config).fetch_baselines())
+
+    async def close(self) -> None:
+        '''Wait for the requests in flight and release the threads and database connections'''
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+        self.engine.dispose()
+
+    async def __aenter__(self) -> AsyncFlexMetrics:
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def __flex_metrics(self, config: Config) -> FlexMetrics:
+        return FlexMetrics(config, self.db_file, self.cache, self.use_scenario_aggregates, engine=self.engine)
+
+    async def __single_flight(self, key: Hashable, evaluate: Callable[[], Any]) -> Any:
+        '''Run evaluate in the thread pool, unless a request with the same key is in flight, then wait for that result'''
+        future = self.__in_flight.get(key)
+        if future is not None:
+            # The results are mutable, every waiting request gets its own copy
+            return deepcopy(await asyncio.shield(future))
+        future = asyncio.ensure_future(asyncio.get_running_loop().run_in_executor(self.executor, evaluate))
+        self.__in_flight[key] = future
+        future.add_done_callback(lambda _: self.__in_flight.pop(key, None))
+        return await asyncio.shield(future)
@@ -0,0 +1,83 @@
+import random
+import tempfile
+from argparse import ArgumentParser
+from datetime import time
+from pathlib import Path
+from time import perf_counter
+from typing import List
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from db.flex_devices_dao import FlexDevicesDao
+from db.models import FlexMetric
+from db.profile_codec import encode_profile
+from experiment.device_type import DeviceType
+
+'''
+Benchmark of the flex metric lookup latency for a growing flexible_devices table, with and without the lookup index.
+
+Usage (from the repository root): PYTHONPATH=src python -m benchmark.db_lookup [-s 10000 100000 1000000]
+'''
+
+CONG_STARTS: List[time] = [time(h, m) for h in range(24) for m in (0, 15, 30, 45)]
+CONG_DURATIONS: List[int] = list(range(1, 33))
+TYPICAL_DAYS: List[str] = ["workday", "weekendday"]
+
+
+def fill_table(engine, size: int) -> List[tuple]:
+    groups = [f"{g:04d}" for g in range(max(1, size // (len(CONG_STARTS) * len(CONG_DURATIONS) * len(TYPICAL_DAYS))) + 1)]
+    keys = []
+    rows = []
+    profile = encode_profile(np.linspace(0, 1, 8))
+    for i in range(size):
+        key = (DeviceType.EV, groups[i % len(groups)], TYPICAL_DAYS[(i // len(groups)) % 2],
+               CONG_STARTS[(i // (2 * len(groups))) % len(CONG_STARTS)], CONG_DURATIONS[(i // (2 * len(groups) * len(CONG_STARTS))) % len(CONG_DURATIONS)])
+        keys.append(key)
+        rows.append({"id": str(i), "device_type": key[0], "group": key[1], "typical_day": key[2], "cong_start": key[3], "cong_duration": key[4], "flex_metric": profile})
+        if len(rows) == 50000:
+            with engine.begin() as conn:
+                conn.execute(insert(FlexMetric), rows)
+            rows = []
+    if rows:
+        with engine.begin() as conn:
+            conn.execute(insert(FlexMetric), rows)
+    return keys
+
+
+def measure_lookups(engine, keys: List[tuple], lookups: int) -> float:
+    sample = random.sample(keys, min(lookups, len(keys)))
+    with Session(engine) as session:
+        dao = FlexDevicesDao(session)
+        t = perf_counter()
+        for device_type, group, typical_day, cong_start, cong_dur in sample:
+            dao.get_flex_metrics(device_type, cong_start, cong_dur, group, typical_day)
+        return (perf_counter() - t) / len(sample)
+
+
+def main():
+    parser = ArgumentParser(prog="benchmark.db_lookup", description="Flex metric lookup latency benchmark")
+    parser.add_argument('-s', '--sizes', type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="table sizes (amount of experiments)")
+    parser.add_argument('-l', '--lookups', type=int, default=200, help="amount of lookups per measurement")
+    args = parser.parse_args()
+
+    print(f"{'experiments':>12} {'no index [ms]':>14} {'index [ms]':>11}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            engine = create_engine(f"sqlite:///{Path(tmp_dir) / 'benchmark.db'}", echo=False)
+            FlexMetric.metadata.create_all(engine)
+            for index in FlexMetric.__table__.indexes:
+                index.drop(engine)
+            keys = fill_table(engine, size)
+            # Scanning the full table is slow, so use less lookups without index
+            no_index = measure_lookups(engine, keys, max(1, args.lookups // 10))
+            for index in FlexMetric.__table__.indexes:
+                index.create(engine)
+            with_index = measure_lookups(engine, keys, args.lookups)
+            engine.dispose()
+        print(f"{size:>12} {no_index * 1000:>14.3f} {with_index * 1000:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
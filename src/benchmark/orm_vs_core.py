@@ -0,0 +1,74 @@
+import random
+import tempfile
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, List
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from benchmark.db_lookup import fill_table
+from db.baselines_dao import BaselineDao
+from db.core_lookups import CoreBaselineDao, CoreFlexDevicesDao
+from db.flex_devices_dao import FlexDevicesDao
+from db.lookup_keys import BaselineKey, FlexMetricKey
+from db.models import Baseline, FlexMetric
+from db.profile_codec import encode_profile
+
+'''
+Benchmark of the profile lookups per second through the ORM (FlexDevicesDao, BaselineDao) and through core SQL
+on the DB-API connection (CoreFlexDevicesDao, CoreBaselineDao), without profile cache.
+
+Usage (from the repository root): PYTHONPATH=src python -m benchmark.orm_vs_core [-s 100000] [-l 2000]
+'''
+
+
+def fill_baselines(engine, keys: List[tuple]) -> List[BaselineKey]:
+    baseline_keys = list(dict.fromkeys(BaselineKey(*k[:3]) for k in keys))
+    profile = encode_profile(np.linspace(0, 1, 96))
+    with engine.begin() as conn:
+        conn.execute(insert(Baseline), [{"id": str(i), "device_type": k.device_type, "group": k.group, "typical_day": k.typical_day, "mean_power": profile}
+                                        for i, k in enumerate(baseline_keys)])
+    return baseline_keys
+
+
+def lookups_per_second(lookup: Callable[[], None], lookups: int) -> float:
+    t = perf_counter()
+    lookup()
+    return lookups / (perf_counter() - t)
+
+
+def main():
+    parser = ArgumentParser(prog="benchmark.orm_vs_core", description="ORM versus core SQL profile lookup benchmark")
+    parser.add_argument('-s', '--size', type=int, default=100_000, help="table size (amount of experiments)")
+    parser.add_argument('-l', '--lookups', type=int, default=2000, help="amount of lookups per measurement")
+    parser.add_argument('-b', '--bulk-size', type=int, default=20, help="amount of keys per bulk lookup, about the amount of devices of a scenario")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{Path(tmp_dir) / 'benchmark.db'}", echo=False)
+        FlexMetric.metadata.create_all(engine)
+        keys = [FlexMetricKey(*k) for k in fill_table(engine, args.size)]
+        baseline_keys = fill_baselines(engine, keys)
+        flex_sample = random.choices(keys, k=args.lookups)
+        baseline_sample = random.choices(baseline_keys, k=args.lookups)
+        bulks = [flex_sample[i:i + args.bulk_size] for i in range(0, len(flex_sample), args.bulk_size)]
+
+        print(f"{'lookup':<24} {'orm [1/s]':>10} {'core [1/s]':>11} {'speedup':>8}")
+        with Session(engine) as session:
+            daos = [(FlexDevicesDao(session), BaselineDao(session)), (CoreFlexDevicesDao(session), CoreBaselineDao(session))]
+            measurements = [
+                ("flex metric", lambda flex_dao, _: [flex_dao.get_flex_metrics(k.device_type, k.cong_start, k.cong_duration, k.group, k.typical_day) for k in flex_sample]),
+                ("baseline", lambda _, baseline_dao: [baseline_dao.get_baseline_mean(k.device_type, k.typical_day, k.group) for k in baseline_sample]),
+                (f"flex metric bulk ({args.bulk_size})", lambda flex_dao, _: [flex_dao.get_flex_metrics_bulk(b) for b in bulks]),
+            ]
+            for name, lookup in measurements:
+                orm, core = [lookups_per_second(lambda: lookup(*d), args.lookups) for d in daos]
+                print(f"{name:<24} {orm:>10.0f} {core:>11.0f} {core / orm:>7.1f}x")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from dataclasses import asdict, dataclass
+from datetime import datetime, time
+from multiprocessing import get_context
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmark.synthetic_data import MONTHS, SyntheticDataSpec, generate
+
+'''
+Benchmark suite of the whole pipeline on synthetic data (see benchmark/synthetic_data.py): loading the experiment files,
+writing the data to the database with to_database.py, the DAO lookups and FlexMetrics.determine_flex_power.
+
+Every benchmark runs in a new process, so its peak RSS is its own. The results of a run are written to a JSON file named
+after the time and the git commit, compare them with the results of another commit with --compare.
+
+Usage (from the repository root): PYTHONPATH=src python -m benchmark.pipeline [--scale small] [--compare OLD.json]
+'''
+
+SCALES: Dict[str, SyntheticDataSpec] = {
+    'small': SyntheticDataSpec(ev_groups=5, hp_groups=2),
+    'medium': SyntheticDataSpec(ev_groups=50, hp_groups=10, cong_starts=[time(8), time(17)], cong_durations=[4, 8, 12]),
+    'large': SyntheticDataSpec(ev_groups=200, hp_groups=30, hp_houses=20, hhp_groups=10, cong_starts=[time(8), time(12), time(17), time(20)], cong_durations=[4, 8, 12, 16]),
+}
+
+
+@dataclass
+class BenchmarkResult():
+    name: str
+    seconds: float
+    items: int
+    unit: str
+    '''What the items are, e.g. experiments'''
+    peak_rss_mb: Optional[float] = None
+    '''Peak resident memory of the process of the benchmark, None if the platform doesn't report it'''
+
+    def throughput(self) -> float:
+        return self.items / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), 'throughput_per_s': self.throughput()}
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux
+    return max_rss / 2**20 if sys.platform == 'darwin' else max_rss / 2**10
+
+
+def ev_data_source(ev_source: str):
+    from experiment.experiment_loader import DataSource
+    return DataSource.GO_E if ev_source == 'go-e' else DataSource.ELAAD_AGG
+
+
+def bench_load_experiments(data_dir: Path, ev_source: str, workers: int) -> List[BenchmarkResult]:
+    from experiment.experiment_loader import DataSource, ExperimentLoader
+
+    results = []
+    for name, baselines_dir, shifted_dir, data_source in [
+        ("load_experiments ev", data_dir / 'ev-elaad/ev/baselines', data_dir / 'ev-elaad/ev/shifted', ev_data_source(ev_source)),
+        ("load_experiments hp", data_dir / 'hp/baselines', data_dir / 'hp/shifted-12', DataSource.GO_E),
+    ]:
+        t = perf_counter()
+        container = ExperimentLoader(baselines_dir, shifted_dir, data_source).load_experiments(workers=workers)
+        results.append(BenchmarkResult(name, perf_counter() - t, len(container.exp), "experiments"))
+    return results
+
+
+def bench_to_database(work_dir: Path, ev_source: str, workers: int) -> List[BenchmarkResult]:
+    '''Write all asset types and the scenario aggregates to a new database, to_database.py reads 'data' in the working directory'''
+    os.chdir(work_dir)
+    Path("flex-metrics.db").unlink(missing_ok=True)
+    import to_database
+    from db.models import FlexMetric
+    from experiment.device_type import DeviceType
+    from sqlalchemy import func, select
+
+    t = perf_counter()
+    with redirect_stdout(io.StringIO()):
+        to_database.create_database_tables()
+        to_database.ev_from_file_to_db(ev_data_source(ev_source), workers)
+        to_database.hp_from_file_to_db(workers)
+        to_database.gm_types()
+        to_database.jrc_pvgis_file_to_db()
+        to_database.hhp_from_file_to_db()
+        to_database.scenario_aggregates_to_db(DeviceType.EV)
+        to_database.scenario_aggregates_to_db(DeviceType.HP)
+        to_database.finish_load()
+    seconds = perf_counter() - t
+    with to_database.engine.connect() as conn:
+        experiments = conn.execute(select(func.count()).select_from(FlexMetric)).scalar()
+    return [BenchmarkResult("to_database", seconds, experiments, "experiments")]
+
+
+def bench_dao_lookups(db_file: Path, lookups: int, seed: int) -> List[BenchmarkResult]:
+    '''Single flex metric and baseline lookups through the ORM and the core DAOs, and bulk lookups of 20 keys, without cache'''
+    from db.baselines_dao import BaselineDao
+    from db.core_lookups import CoreBaselineDao, CoreFlexDevicesDao
+    from db.flex_devices_dao import FlexDevicesDao
+    from db.lookup_keys import BaselineKey, FlexMetricKey
+    from db.models import Baseline, FlexMetric
+    from sqlalchemy import create_engine, select
+    from sqlalchemy.orm import Session
+
+    rng = random.Random(seed)
+    engine = create_engine(f"sqlite:///{db_file}", echo=False)
+    results = []
+    with Session(engine) as session:
+        flex_keys = [FlexMetricKey(*r) for r in session.execute(select(FlexMetric.device_type, FlexMetric.group, FlexMetric.typical_day, FlexMetric.cong_start, FlexMetric.cong_duration))]
+        baseline_keys = [BaselineKey(*r) for r in session.execute(select(Baseline.device_type, Baseline.group, Baseline.typical_day))]
+        flex_sample = rng.choices(flex_keys, k=lookups)
+        baseline_sample = rng.choices(baseline_keys, k=lookups)
+        bulks = [flex_sample[i:i + 20] for i in range(0, len(flex_sample), 20)]
+        for variant, flex_dao, baseline_dao in [("orm", FlexDevicesDao(session), BaselineDao(session)), ("core", CoreFlexDevicesDao(session), CoreBaselineDao(session))]:
+            for name, lookup in [
+                ("flex metric", lambda: [flex_dao.get_flex_metrics(k.device_type, k.cong_start, k.cong_duration, k.group, k.typical_day) for k in flex_sample]),
+                ("baseline", lambda: [baseline_dao.get_baseline_mean(k.device_type, k.typical_day, k.group) for k in baseline_sample]),
+                ("flex metric bulk", lambda: [flex_dao.get_flex_metrics_bulk(b) for b in bulks]),
+            ]:
+                t = perf_counter()
+                lookup()
+                results.append(BenchmarkResult(f"dao {name} {variant}", perf_counter() - t, lookups, "lookups"))
+    engine.dispose()
+    return results
+
+
+def scenarios(db_file: Path, amount: int, seed: int) -> List:
+    '''Random scenarios with EV, HP, HHP, PV and SJV of the data in the database'''
+    from db.lookup_keys import BaselineKey, FlexMetricKey
+    from db.models import Baseline, FlexMetric
+    from experiment.device_type import DeviceType
+    from flex_metric_config import BaseloadConfig, Config, EvConfig, HhpConfig, HouseTypeConfig, HpConfig, PvConfig, SjvConfig
+    from sqlalchemy import create_engine, select
+    from sqlalchemy.orm import Session
+
+    rng = random.Random(seed)
+    engine = create_engine(f"sqlite:///{db_file}", echo=False)
+    with Session(engine) as session:
+        flex_keys = [FlexMetricKey(*r) for r in session.execute(select(FlexMetric.device_type, FlexMetric.group, FlexMetric.typical_day, FlexMetric.cong_start, FlexMetric.cong_duration))]
+        baseline_keys = [BaselineKey(*r) for r in session.execute(select(Baseline.device_type, Baseline.group, Baseline.typical_day))]
+    engine.dispose()
+    hhp_groups = sorted({k.group for k in baseline_keys if k.device_type is DeviceType.HHP})
+    sjv_groups = sorted({k.group for k in baseline_keys if k.device_type is DeviceType.SJV})
+    windows = sorted({(k.cong_start, k.cong_duration) for k in flex_keys})
+
+    configs = []
+    for _ in range(amount):
+        cong_start, cong_duration = rng.choice(windows)
+        ev_keys = [k for k in flex_keys if k.device_type is DeviceType.EV and (k.cong_start, k.cong_duration) == (cong_start, cong_duration)]
+        month = rng.choice(MONTHS)
+        hp_groups = sorted({k.group for k in flex_keys if k.device_type is DeviceType.HP and (k.typical_day, k.cong_start, k.cong_duration) == (month, cong_start, cong_duration)})
+        configs.append(Config(cong_start, cong_duration,
+                              ev=[EvConfig(k.typical_day, k.group, rng.randint(1, 50)) for k in rng.sample(ev_keys, min(2, len(ev_keys)))] or None,
+                              hp=HpConfig(month, [HouseTypeConfig(g, rng.randint(1, 50)) for g in rng.sample(hp_groups, min(2, len(hp_groups)))]) if hp_groups else None,
+                              hhp=HhpConfig(f"{month}_avg", [HouseTypeConfig(rng.choice(hhp_groups), rng.randint(1, 50))]) if hhp_groups else None,
+                              pv=PvConfig(month, 5000.0),
+                              non_flexible_load=BaseloadConfig(f"{month}_workday", [SjvConfig(g, rng.randint(1, 200)) for g in rng.sample(sjv_groups, min(3, len(sjv_groups)))]) if sjv_groups else None))
+    return configs
+
+
+def bench_determine_flex_power(db_file: Path, amount: int, seed: int) -> List[BenchmarkResult]:
+    '''
+    Cold: every scenario with its own engine and cache, like a run of main.py.
+    Warm: all scenarios with one engine and one cache, like the scenario server.
+    '''
+    from db.profile_cache import ProfileCache
+    from db.read_only_engine import create_read_only_engine
+    from flex_metrics import FlexMetrics
+
+    configs = scenarios(db_file, amount, seed)
+    results = []
+    t = perf_counter()
+    for c in configs:
+        FlexMetrics(c, db_file, ProfileCache()).determine_flex_power()
+    results.append(BenchmarkResult("determine_flex_power cold", perf_counter() - t, len(configs), "scenarios"))
+    engine, cache = create_read_only_engine(db_file), ProfileCache(db_file)
+    t = perf_counter()
+    for c in configs:
+        FlexMetrics(c, db_file, cache, engine=engine).determine_flex_power()
+    results.append(BenchmarkResult("determine_flex_power warm", perf_counter() - t, len(configs), "scenarios"))
+    engine.dispose()
+    return results
+
+
+def run_isolated(benchmark: Callable[..., List[BenchmarkResult]], *args) -> List[BenchmarkResult]:
+    '''Run a benchmark in a new process and add the peak RSS of that process to its results'''
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(_with_peak_rss, benchmark, *args).result()
+
+
+def _with_peak_rss(benchmark: Callable[..., List[BenchmarkResult]], *args) -> List[BenchmarkResult]:
+    results = benchmark(*args)
+    rss = peak_rss_mb()
+    for r in results:
+        r.peak_rss_mb = rss
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: List[BenchmarkResult], previous: Dict[str, Dict[str, Any]]):
+    print(f"{'benchmark':<32} {'seconds':>9} {'throughput':>12} {'unit':<12} {'peak RSS [MB]':>14}" + (f" {'vs previous':>12}" if previous else ""))
+    for r in results:
+        line = f"{r.name:<32} {r.seconds:>9.3f} {r.throughput():>12.1f} {r.unit + '/s':<12} {r.peak_rss_mb if r.peak_rss_mb is not None else float('nan'):>14.1f}"
+        if r.name in previous and previous[r.name]['throughput_per_s'] > 0:
+            line += f" {r.throughput() / previous[r.name]['throughput_per_s']:>11.2f}x"
+        print(line)
+
+
+def main():
+    parser = ArgumentParser(prog="benchmark.pipeline", description="Flex Metrics Tool pipeline benchmark suite on synthetic data")
+    parser.add_argument('-s', '--scale', choices=SCALES.keys(), default='small', help="size of the synthetic data")
+    parser.add_argument('--ev-source', choices=['go-e', 'elaad'], default='go-e', help="naming and file format of the EV experiments")
+    parser.add_argument('-w', '--work-dir', help="directory for the synthetic data and the database. Existing data is reused, so runs of different commits use the same data. By default a temporary directory")
+    parser.add_argument('-j', '--workers', type=int, default=1, help="amount of processes used to load the experiment files")
+    parser.add_argument('-l', '--lookups', type=int, default=2000, help="amount of lookups per DAO benchmark")
+    parser.add_argument('-n', '--scenarios', type=int, default=200, help="amount of scenarios per determine_flex_power benchmark")
+    parser.add_argument('-o', '--output-dir', default="benchmark-results", help="directory of the JSON result files")
+    parser.add_argument('-c', '--compare', metavar='FILE', help="JSON result file of an earlier run to compare the throughput with")
+    args = parser.parse_args()
+
+    previous: Dict[str, Dict[str, Any]] = {}
+    if args.compare:
+        try:
+            with open(args.compare) as f:
+                previous = {r['name']: r for r in json.load(f)['results']}
+        except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
+            print(f"Cannot read result file '{args.compare}': {e}\nExiting...")
+            exit(1)
+
+    spec = SCALES[args.scale]
+    spec.ev_source = args.ev_source
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = Path(args.work_dir).resolve() if args.work_dir else Path(tmp_dir)
+        data_dir = work_dir / 'data'
+        generated = not data_dir.exists()
+        if generated:
+            print(f"Generating {args.scale} synthetic data in '{data_dir}'...")
+            generate(data_dir, spec)
+        print(f"Running benchmarks on {spec.ev_experiments()} EV and {spec.hp_experiments()} HP experiments...")
+        results = run_isolated(bench_load_experiments, data_dir, spec.ev_source, args.workers)
+        results += run_isolated(bench_to_database, work_dir, spec.ev_source, args.workers)
+        results += run_isolated(bench_dao_lookups, work_dir / 'flex-metrics.db', args.lookups, spec.seed)
+        results += run_isolated(bench_determine_flex_power, work_dir / 'flex-metrics.db', args.scenarios, spec.seed)
+
+    print_results(results, previous)
+    commit = git_commit()
+    created = datetime.now()
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_file = output_dir / f"{created.strftime('%Y-%m-%d_%H-%M')}{'_' + commit if commit else ''}.json"
+    with open(output_file, "w") as f:
+        json.dump({'commit': commit, 'created': created.isoformat(timespec='seconds'), 'python': platform.python_version(), 'platform': platform.platform(),
+                   'scale': args.scale, 'data': {**asdict(spec), 'cong_starts': [s.isoformat() for s in spec.cong_starts]}, 'data_generated': generated,
+                   'results': [r.to_dict() for r in results]}, f, indent=2)
+    print(f"Results written to '{output_file}'")
+
+
+if __name__ == "__main__":
+    main()
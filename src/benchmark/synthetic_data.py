@@ -0,0 +1,281 @@
+from argparse import ArgumentParser
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from experiment.experiment_description import ExperimentDescription
+
+'''
+Generator of synthetic input data for to_database.py and the benchmarks. The files are written in the directory layout
+that to_database.py reads (relative to its data directory) and with the file names that ExperimentDescription validates.
+The values are random with a plausible daily shape, only the size and the structure of the data are realistic.
+
+Usage (from the repository root): PYTHONPATH=src python -m benchmark.synthetic_data -o data [--ev-groups 20] [--ev-days 7]
+'''
+
+PTU_PER_DAY: int = 96
+PTU: timedelta = timedelta(minutes=15)
+
+RVO_TYPES: List[str] = ["vrij", "tussen", "hoek", "2onder1kap", "appartement"]
+CONSTRUCTION_YEARS: List[str] = ["1946-1964", "1965-1974", "1975-1991", "1992-2005", "2006-2012", "2012"]
+INHABITANTS: List[str] = ["one_person", "couple", "family"]
+GM_TYPES: List[str] = ["sjv500", "sjv1000", "sjv1500", "sjv2000", "sjv2500", "sjv3000", "sjv3500", "sjv4000", "sjv4500", "sjv5000", "sjv6000", "sjv7000", "sjv8000",
+                       "sjv9000", "sjv10000", "sjv15000", "PV"]
+MONTHS: List[str] = [date(2020, m, 1).strftime('%B').lower() for m in range(1, 13)]
+
+
+@dataclass
+class SyntheticDataSpec():
+    '''Scale of the generated data'''
+    ev_source: str = 'go-e'
+    '''Naming and file format of the EV experiments, 'go-e' or 'elaad' (to_database.py -t ev or -t ev-elaad)'''
+    ev_groups: int = 20
+    '''Amount of PC4 areas (GO-e) or charging location types (Elaad)'''
+    ev_days: int = 7
+    '''Amount of consecutive days with experiments per group, starting on a monday (GO-e only)'''
+    ev_devices: int = 20
+    '''Amount of EVs per experiment file (GO-e) or charging points (Elaad, at most 99)'''
+    hp_groups: int = 4
+    '''Amount of heat pump house types, every house type has experiments on the 15th of every month'''
+    hp_houses: int = 10
+    hhp_groups: int = 2
+    cong_starts: List[time] = field(default_factory=lambda: [time(17)])
+    cong_durations: List[int] = field(default_factory=lambda: [4, 8])
+    seed: int = 0
+
+    def ev_experiments(self) -> int:
+        days = self.ev_days if self.ev_source == 'go-e' else 2
+        return self.ev_groups * days * len(self.cong_starts) * len(self.cong_durations)
+
+    def hp_experiments(self) -> int:
+        return self.hp_groups * len(MONTHS) * len(self.cong_starts) * len(self.cong_durations)
+
+
+def house_types(amount: int) -> List[str]:
+    '''The first amount house types, formatted as [RVO-type]+[construction-year]+[inhabitants]'''
+    types = [f"{r}+{y}+{i}" for i in INHABITANTS for y in CONSTRUCTION_YEARS for r in RVO_TYPES]
+    if amount > len(types):
+        raise AssertionError(f"At most {len(types)} house types can be generated")
+    return types[:amount]
+
+
+def ev_groups(spec: SyntheticDataSpec) -> List[str]:
+    '''The groups of the EV experiments as stored in the database'''
+    if spec.ev_source == 'go-e':
+        return [f"{1000 + g}" for g in range(spec.ev_groups)]
+    return [f"public-loc{g:03d}-2030" for g in range(spec.ev_groups)]
+
+
+def generate(data_dir: Path, spec: SyntheticDataSpec) -> Dict[str, int]:
+    '''
+    Write the input data of all asset types of to_database.py to data_dir. Returns the amount of files per asset type.
+    '''
+    if spec.ev_source not in ['go-e', 'elaad']:
+        raise AssertionError(f"Unknown EV source '{spec.ev_source}'")
+    if spec.ev_source == 'elaad' and not 0 < spec.ev_devices < 100:
+        raise AssertionError("Elaad experiments have 1 to 99 charging points")
+    for start in spec.cong_starts:
+        for duration in spec.cong_durations:
+            if datetime.combine(date(2020, 1, 1), start) + duration * PTU > datetime(2020, 1, 2):
+                raise AssertionError(f"Congestion period starting at {start} with duration {duration} doesn't end on the same day")
+    rng = np.random.default_rng(spec.seed)
+    files = {}
+    files['ev'] = write_go_e_ev(data_dir / 'ev-elaad/ev', spec, rng) if spec.ev_source == 'go-e' else write_elaad_ev(data_dir / 'ev-elaad/ev', spec, rng)
+    files['hp'] = write_hp(data_dir / 'hp', spec, rng)
+    files['hhp'] = write_hhp(data_dir / 'hhp/baselines', spec, rng)
+    files['sjv'] = write_gm_types(data_dir / 'SJV-PV-GM-input', rng)
+    files['pv'] = write_jrc_pvgis(data_dir / 'jrc-pvgis-2015-residential.csv', rng)
+    return files
+
+
+def daily_shape(ptus: np.ndarray, peak_ptu: float, width: float) -> np.ndarray:
+    '''Relative power per PTU of the day, with a peak at peak_ptu'''
+    distance = np.minimum(np.abs(ptus - peak_ptu), PTU_PER_DAY - np.abs(ptus - peak_ptu))
+    return 0.15 + np.exp(-0.5 * (distance / width) ** 2)
+
+
+def profiles(rng: np.random.Generator, index: pd.DatetimeIndex, devices: int, peak_power: float, peak_ptu: float, width: float) -> np.ndarray:
+    '''Random positive power profiles of the devices (columns) with a daily shape'''
+    ptus = (index.hour * 4 + index.minute // 15).to_numpy()
+    return daily_shape(ptus, peak_ptu, width)[:, None] * rng.uniform(0.2, 1.0, (len(index), devices)) * peak_power
+
+
+def shift_congestion(rng: np.random.Generator, baseline: np.ndarray, start: int, duration: int) -> np.ndarray:
+    '''The baseline with the power in the congestion period reduced and the energy moved to the PTU after it'''
+    shifted = baseline.copy()
+    reduction = baseline[start:start + duration] * rng.uniform(0.2, 0.9, (duration, baseline.shape[1]))
+    shifted[start:start + duration] -= reduction
+    after = slice(start + duration, min(start + 2 * duration, len(baseline)))
+    if after.stop > after.start:
+        shifted[after] += reduction.sum(axis=0) / (after.stop - after.start)
+    return shifted
+
+
+def write_csv(values: np.ndarray, index: pd.Index, path: Path, sep: str = ';', decimal: str = ',', columns: List[str] = None):
+    pd.DataFrame(values, index=index, columns=columns).to_csv(path, sep=sep, decimal=decimal)
+
+
+def validated(name: str) -> str:
+    if not ExperimentDescription.validate_name(name):
+        raise AssertionError(f"Invalid experiment (file) name '{name}'")
+    return name
+
+
+def experiment_name(group: str, flexwindow_start: datetime, flexwindow_duration: int, cong_start: datetime, cong_duration: int) -> str:
+    dt_fmt = "%Y-%m-%dT%H%M"
+    return validated(f"{group}_flexwindowstart{flexwindow_start.strftime(dt_fmt)}_flexwindowduration{flexwindow_duration}_congestionstart{cong_start.strftime(dt_fmt)}_congestionduration{cong_duration}")
+
+
+def write_go_e_ev(ev_dir: Path, spec: SyntheticDataSpec, rng: np.random.Generator) -> int:
+    '''
+    One shifted and one baseline file of the congestion day per experiment, both named after the experiment.
+    '''
+    (ev_dir / 'baselines').mkdir(parents=True, exist_ok=True)
+    (ev_dir / 'shifted').mkdir(parents=True, exist_ok=True)
+    files = 0
+    for group in ev_groups(spec):
+        for day in range(spec.ev_days):
+            # 2020-01-06 is a monday
+            day_start = datetime(2020, 1, 6) + timedelta(days=day)
+            index = pd.date_range(day_start, periods=PTU_PER_DAY, freq=PTU)
+            baseline = profiles(rng, index, spec.ev_devices, 11000.0, 74.0, 10.0)
+            for cong_start in spec.cong_starts:
+                for cong_duration in spec.cong_durations:
+                    start = datetime.combine(day_start.date(), cong_start)
+                    name = experiment_name(f"pc4{group}", start - timedelta(hours=6), 40, start, cong_duration)
+                    offset = cong_start.hour * 4 + cong_start.minute // 15
+                    write_csv(baseline, index, ev_dir / 'baselines' / f"{name}.csv")
+                    write_csv(shift_congestion(rng, baseline, offset, cong_duration), index, ev_dir / 'shifted' / f"{name}.csv")
+                    files += 2
+    return files
+
+
+def write_elaad_ev(ev_dir: Path, spec: SyntheticDataSpec, rng: np.random.Generator) -> int:
+    '''
+    One baseline file per group and typical day, with 'none' instead of the congestion period, and one shifted file per experiment.
+    The files contain the average power in kW of all charging points per PTU of the day.
+    '''
+    (ev_dir / 'baselines').mkdir(parents=True, exist_ok=True)
+    (ev_dir / 'shifted').mkdir(parents=True, exist_ok=True)
+    index = pd.Index([f"{p // 4:02d}:{p % 4 * 15:02d}" for p in range(PTU_PER_DAY)])
+    files = 0
+    for g in range(spec.ev_groups):
+        for week in ['week', 'wknd']:
+            prefix = f"public-loc{g:03d}-{spec.ev_devices}-2030-11-2-17_25"
+            baseline = profiles(rng, pd.date_range(datetime(2020, 1, 6), periods=PTU_PER_DAY, freq=PTU), 1, 7.4 * spec.ev_devices, 74.0, 12.0)
+            write_csv(baseline, index, ev_dir / 'baselines' / f"{prefix}-none-20-{week}.csv", sep=',', decimal='.', columns=['Average'])
+            files += 1
+            for i, cong_start in enumerate(spec.cong_starts):
+                for cong_duration in spec.cong_durations:
+                    start = datetime.combine(date(2020, 1, 1), cong_start)
+                    name = validated(f"{prefix}-st-{i + 1}-{start:%H%M}-{start + cong_duration * PTU:%H%M}-20-{week}")
+                    offset = cong_start.hour * 4 + cong_start.minute // 15
+                    write_csv(shift_congestion(rng, baseline, offset, cong_duration), index, ev_dir / 'shifted' / f"{name}.csv", sep=',', decimal='.', columns=['Average'])
+                    files += 1
+    return files
+
+
+def write_hp(hp_dir: Path, spec: SyntheticDataSpec, rng: np.random.Generator) -> int:
+    '''
+    One baseline file per house type with the whole year, and one shifted file of the 15th of every month per experiment.
+    '''
+    (hp_dir / 'baselines').mkdir(parents=True, exist_ok=True)
+    (hp_dir / 'shifted-12').mkdir(parents=True, exist_ok=True)
+    year = pd.date_range(datetime(2020, 1, 1), datetime(2020, 12, 31, 23, 45), freq=PTU)
+    # Heat pumps use more power in winter
+    season = 1.0 + np.cos((year.dayofyear.to_numpy() - 15) / 366 * 2 * np.pi)
+    files = 0
+    for group in house_types(spec.hp_groups):
+        baseline = profiles(rng, year, spec.hp_houses, 2000.0, 30.0, 16.0) * season[:, None]
+        write_csv(baseline, year, hp_dir / 'baselines' / f"baselines+{group}.csv")
+        files += 1
+        for month in range(1, 13):
+            day_start = datetime(2020, month, 15)
+            day = slice(year.get_loc(day_start), year.get_loc(day_start) + PTU_PER_DAY)
+            for cong_start in spec.cong_starts:
+                for cong_duration in spec.cong_durations:
+                    name = experiment_name(group, day_start, PTU_PER_DAY, datetime.combine(day_start.date(), cong_start), cong_duration)
+                    offset = cong_start.hour * 4 + cong_start.minute // 15
+                    write_csv(shift_congestion(rng, baseline[day], offset, cong_duration), year[day], hp_dir / 'shifted-12' / f"{name}.csv")
+                    files += 1
+    return files
+
+
+def write_hhp(hhp_dir: Path, spec: SyntheticDataSpec, rng: np.random.Generator) -> int:
+    '''One baseline file per house type with the whole year, the inhabitants are prefixed with 'status' and contain spaces'''
+    hhp_dir.mkdir(parents=True, exist_ok=True)
+    year = pd.date_range(datetime(2020, 1, 1), datetime(2020, 12, 31, 23, 45), freq=PTU)
+    season = 1.0 + np.cos((year.dayofyear.to_numpy() - 15) / 366 * 2 * np.pi)
+    for group in house_types(spec.hhp_groups):
+        rvo, construction_year, inhabitants = group.split('+')
+        baseline = profiles(rng, year, 6, 1200.0, 30.0, 16.0) * season[:, None]
+        write_csv(baseline, year, hhp_dir / f"baselines+{rvo}+{construction_year}+status{inhabitants.replace('_', ' ')}.csv")
+    return spec.hhp_groups
+
+
+def write_gm_types(gm_dir: Path, rng: np.random.Generator) -> int:
+    '''The Gaussian mixture parameters of the SJV and PV types (see util/conflex.py) and the sunrise and sunset per month'''
+    gm_dir.mkdir(parents=True, exist_ok=True)
+    columns: Dict[str, np.ndarray] = {'Name': np.array(GM_TYPES)}
+    for k in range(1, 5):
+        columns[f"Average[{k}]"] = rng.uniform(-0.5, 2.5, len(GM_TYPES))
+        columns[f"Deviation[{k}]"] = rng.uniform(0.05, 1.5, len(GM_TYPES))
+        for day_type in ['Workday', 'Weekend']:
+            for ptu in range(1, PTU_PER_DAY + 1):
+                columns[f"{day_type}[{k},{ptu}]"] = rng.uniform(0, 1, len(GM_TYPES))
+        for month in range(1, 13):
+            columns[f"Month[{k},{month}]"] = rng.uniform(0.5, 1.5, len(GM_TYPES))
+    for day_type in ['Workday', 'Weekend']:
+        for ptu in range(1, PTU_PER_DAY + 1):
+            columns[f"Trend{day_type}[{ptu}]"] = rng.uniform(0, 60, len(GM_TYPES))
+    for month in range(1, 13):
+        columns[f"TrendMonth[{month}]"] = rng.uniform(0, 1, len(GM_TYPES))
+    pd.DataFrame(columns).to_excel(gm_dir / 'GM-types GO-e.xlsx', index=False)
+    sun = pd.DataFrame({'sunrise': [33, 30, 27, 25, 22, 21, 22, 24, 27, 30, 32, 34], 'sunset': [67, 71, 76, 82, 86, 88, 87, 83, 78, 72, 67, 65]}, index=MONTHS)
+    sun.to_csv(gm_dir / 'sunset-sunrise.csv', sep=';')
+    return 2
+
+
+def write_jrc_pvgis(path: Path, rng: np.random.Generator) -> int:
+    '''Hourly PV power in W of the year 2015 with UTC timestamps, like the JRC PVGIS export'''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    hours = pd.date_range(datetime(2015, 1, 1), datetime(2015, 12, 31, 23), freq='h', tz='UTC')
+    day_length = 12.0 - 4.0 * np.cos((hours.dayofyear.to_numpy() + 10) / 365 * 2 * np.pi)
+    sun = np.clip(np.cos((hours.hour.to_numpy() + 0.5 - 12.5) / day_length * np.pi), 0, None)
+    power = sun * rng.uniform(0.3, 1.0, len(hours)) * 1000.0
+    write_csv(power[:, None], hours, path, decimal='.', columns=['P'])
+    return 1
+
+
+def main():
+    parser = ArgumentParser(prog="benchmark.synthetic_data", description="Synthetic input data generator for to_database.py")
+    parser.add_argument('-o', '--output', default="data", help="data directory to write to, to_database.py reads 'data' in the working directory")
+    parser.add_argument('--ev-source', choices=['go-e', 'elaad'], default='go-e', help="naming and file format of the EV experiments")
+    parser.add_argument('--ev-groups', type=int, default=20, help="amount of PC4 areas (go-e) or charging location types (elaad)")
+    parser.add_argument('--ev-days', type=int, default=7, help="amount of days with experiments per PC4 area (go-e)")
+    parser.add_argument('--ev-devices', type=int, default=20, help="amount of EVs per experiment (go-e) or charging points (elaad)")
+    parser.add_argument('--hp-groups', type=int, default=4, help="amount of heat pump house types")
+    parser.add_argument('--hp-houses', type=int, default=10, help="amount of houses per heat pump house type")
+    parser.add_argument('--hhp-groups', type=int, default=2, help="amount of hybrid heat pump house types")
+    parser.add_argument('--cong-starts', nargs="+", default=["17:00"], help="congestion starts (HH:MM) of the experiments")
+    parser.add_argument('--cong-durations', type=int, nargs="+", default=[4, 8], help="congestion durations (PTU) of the experiments")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    try:
+        spec = SyntheticDataSpec(args.ev_source, args.ev_groups, args.ev_days, args.ev_devices, args.hp_groups, args.hp_houses, args.hhp_groups,
+                                 [time.fromisoformat(s) for s in args.cong_starts], args.cong_durations, args.seed)
+        files = generate(Path(args.output), spec)
+    except (ValueError, AssertionError) as e:
+        print(str(e) + "\nExiting...")
+        exit(1)
+    print(f"Written {sum(files.values())} files to '{args.output}': " + ", ".join(f"{n} {t}" for t, n in files.items()))
+    print(f"{spec.ev_experiments()} EV and {spec.hp_experiments()} HP experiments")
+
+
+if __name__ == "__main__":
+    main()
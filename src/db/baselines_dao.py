@@ -1,34 +1,69 @@
 
 
-import pickle
-from typing import List
+from typing import Any, Dict, List, Optional
 
-from sqlalchemy import delete, select
+import numpy as np
+from sqlalchemy import delete, select, text
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm import Session
 
+from db.data_not_found_exception import DataNotFoundException
+from db.lookup_keys import BaselineKey, matches_any_key
 from db.models import Baseline
+from db.profile_cache import ProfileCache
+from db.profile_codec import decode_profile, encode_profile
 from experiment.device_type import DeviceType
 from experiment.experiment import Experiment
 
 
 class BaselineDao():
+    # Keep the amount of bound parameters per query well below the sqlite limit
+    BULK_CHUNK_SIZE: int = 1000
+    # Amount of keys per bulk lookup query, see matches_any_key
+    LOOKUP_CHUNK_SIZE: int = 100
+    # Amount of rows per executemany of an upsert
+    UPSERT_BATCH_SIZE: int = 5000
 
-    def __init__(self, session: Session) -> None:
+    @classmethod
+    def to_db_values(cls, device_type: DeviceType, typical_day: str, group: str, mean_power) -> Dict[str, Any]:
+        assert len(mean_power) == 96, "Mean power array should contain 96 elements"
+        return dict(id=BaselineDao.to_db_id(device_type, typical_day, group), device_type=device_type, typical_day=typical_day, group=group, mean_power=encode_profile(mean_power))
+
+    @classmethod
+    def to_db_id(cls, device_type: DeviceType, typical_day: str, group: str) -> str:
+        return f"{device_type}+{group}+{typical_day}"
+
+    def __init__(self, session: Session, cache: ProfileCache = None) -> None:
         self.session = session
+        self.cache = cache
 
-    def save_experiment(self, experiment: Experiment) -> None:
-        desc = experiment.exp_des
-        self.save(desc.device_type, desc.typical_day, desc.group, experiment.get_baseline_profiles().mean(axis=1))
+    def save_experiment(self, experiment: Experiment, commit: bool = True) -> None:
+        self.save_experiments([experiment], commit)
+
+    def save_experiments(self, experiments: List[Experiment], commit: bool = True) -> None:
+        '''
+        Save the mean baselines of the experiments. Experiments of the same device type, group and typical day share one baseline,
+        as before the baseline of the last experiment is stored.
+        '''
+        last_experiments: Dict[BaselineKey, Experiment] = {}
+        for e in experiments:
+            last_experiments[BaselineKey(e.exp_des.device_type, e.exp_des.group, e.exp_des.typical_day)] = e
+        self.upsert([BaselineDao.to_db_values(k.device_type, k.typical_day, k.group, e.get_mean_baseline()) for k, e in last_experiments.items()], commit)
     
-    def save(self, device_type: DeviceType, typical_day: str, group: str, mean_power) -> None:
-        assert len(mean_power) == 96, "Mean power array should contain 96 elements"
-        power = pickle.dumps(mean_power)
-        exp_id = f"{device_type}+{group}+{typical_day}"
-        if self.session.get(Baseline, exp_id):
-            self.session.merge(Baseline(id=exp_id, device_type=device_type, typical_day=typical_day, group=group, mean_power=power))
-        else:
-            self.session.add(Baseline(id=exp_id, device_type=device_type, typical_day=typical_day, group=group, mean_power=power))
-        self.session.commit()
+    def save(self, device_type: DeviceType, typical_day: str, group: str, mean_power, commit: bool = True) -> None:
+        self.upsert([BaselineDao.to_db_values(device_type, typical_day, group, mean_power)], commit)
+
+    def upsert(self, rows: List[Dict[str, Any]], commit: bool = True) -> None:
+        '''
+        Insert or update baseline rows (see to_db_values) with a single INSERT ... ON CONFLICT statement per batch.
+        '''
+        stmt = insert(Baseline)
+        stmt = stmt.on_conflict_do_update(index_elements=[Baseline.id],
+                                          set_={c: stmt.excluded[c] for c in ['device_type', 'typical_day', 'group', 'mean_power']})
+        for batch_start in range(0, len(rows), self.UPSERT_BATCH_SIZE):
+            self.session.execute(stmt, rows[batch_start:batch_start + self.UPSERT_BATCH_SIZE])
+        if commit:
+            self.session.commit()
 
     def get_device_types(self) -> List[DeviceType]:
         stmt = select(Baseline.device_type).distinct()
@@ -52,23 +87,76 @@ class BaselineDao():
         stmt = stmt.distinct()
         return self.session.scalars(stmt).all()
 
-    def get_baseline_mean(self, device_type: DeviceType, typical_day: str, group: str) -> List[float]:
+    def get_baseline_mean(self, device_type: DeviceType, typical_day: str, group: str) -> np.ndarray:
+        key = BaselineKey(device_type, group, typical_day)
+        if self.cache is not None:
+            cached = self.cache.get((Baseline.__tablename__, key))
+            if cached is not None:
+                return cached
+        baseline = self._query_baseline_mean(key)
+        if baseline is None:
+            raise DataNotFoundException(f"No baseline found for {str(key)}.")
+        return self.cache.put((Baseline.__tablename__, key), baseline) if self.cache is not None else baseline
+
+    def _query_baseline_mean(self, key: BaselineKey) -> Optional[np.ndarray]:
+        '''Query the mean baseline of one key without the cache, None if the key is missing. See _query_baseline_means.'''
         stmt = select(Baseline.mean_power)\
-                    .filter(Baseline.device_type.is_(device_type))\
-                    .filter(Baseline.typical_day.is_(typical_day))\
-                    .filter(Baseline.group.is_(group))
+                    .filter(Baseline.device_type.is_(key.device_type))\
+                    .filter(Baseline.typical_day.is_(key.typical_day))\
+                    .filter(Baseline.group.is_(key.group))\
+                    .order_by(text("rowid"))
         baseline = self.session.scalar(stmt)
-        return pickle.loads(baseline)
+        return decode_profile(baseline) if baseline is not None else None
+
+    def get_baseline_means_bulk(self, keys: List[BaselineKey]) -> Dict[BaselineKey, np.ndarray]:
+        '''
+        Fetch the mean baselines of all keys, with one query per LOOKUP_CHUNK_SIZE keys. Raises a DataNotFoundException that
+        names every missing key. The first row of a key that is stored more than once is returned.
+        '''
+        keys = list(dict.fromkeys(keys))
+        if self.cache is not None:
+            cached = self.cache.load_many([(Baseline.__tablename__, k) for k in keys],
+                                          lambda cache_keys: {(Baseline.__tablename__, k): v for k, v in self._query_baseline_means([k[1] for k in cache_keys]).items()})
+            baselines = {k[1]: v for k, v in cached.items()}
+        else:
+            baselines = self._query_baseline_means(keys)
+        missing = [k for k in keys if k not in baselines]
+        if missing:
+            raise DataNotFoundException("No baselines found for:\n\t" + "\n\t".join(map(str, missing)))
+        return baselines
+
+    def _query_baseline_means(self, keys: List[BaselineKey]) -> Dict[BaselineKey, np.ndarray]:
+        '''
+        Query the mean baselines of the keys, without the cache. Missing keys are left out, of a key that is stored more than
+        once the first row is returned. The lookups of this DAO read through this method and _query_baseline_mean,
+        see db/core_lookups.py for another read path.
+        '''
+        baselines: Dict[BaselineKey, np.ndarray] = {}
+        key_columns = [Baseline.device_type, Baseline.group, Baseline.typical_day]
+        for chunk_start in range(0, len(keys), self.LOOKUP_CHUNK_SIZE):
+            chunk = keys[chunk_start:chunk_start + self.LOOKUP_CHUNK_SIZE]
+            stmt = select(*key_columns, Baseline.mean_power).where(matches_any_key(key_columns, chunk)).order_by(text("rowid"))
+            for row in self.session.execute(stmt):
+                key = BaselineKey(*row[:3])
+                if key not in baselines:
+                    baselines[key] = decode_profile(row.mean_power)
+        return baselines
 
-    def get_baseline_p95(self, device_type: DeviceType, typical_day: str, group: str) -> List[float]:
+    def get_baseline_p95(self, device_type: DeviceType, typical_day: str, group: str) -> np.ndarray:
         stmt = select(Baseline.p95)\
                     .filter(Baseline.device_type.is_(device_type))\
                     .filter(Baseline.typical_day.is_(typical_day))\
                     .filter(Baseline.group.is_(group))
         baseline = self.session.scalar(stmt)
-        return pickle.loads(baseline)
+        return decode_profile(baseline)
         
     def delete_device_type(self, device_type: DeviceType):
         stmt = delete(Baseline).where(Baseline.device_type.is_(device_type))
         self.session.execute(stmt)
-        self.session.commit()
\ No newline at end of file
+        self.session.commit()
+
+    def delete_ids(self, ids: List[str], commit: bool = True):
+        for chunk_start in range(0, len(ids), self.BULK_CHUNK_SIZE):
+            self.session.execute(delete(Baseline).where(Baseline.id.in_(ids[chunk_start:chunk_start + self.BULK_CHUNK_SIZE])))
+        if commit:
+            self.session.commit()
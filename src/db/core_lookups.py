@@ -0,0 +1,85 @@
+from datetime import time
+from time import perf_counter
+from typing import Dict, Final, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from db.baselines_dao import BaselineDao
+from db.flex_devices_dao import FlexDevicesDao
+from db.lookup_keys import BaselineKey, FlexMetricKey
+from db.models import Baseline, FlexMetric
+from db.profile_cache import ProfileCache
+from db.profile_codec import decode_profile
+from util.instrumentation import record_query
+
+'''
+Lean read path for the profile lookups of FlexMetrics, in core SQL on the DB-API connection of a session.
+
+The ORM builds, compiles and caches a statement on every lookup and converts the parameters with the type decorators of
+the models. The statements below are constant strings with positional parameters instead: the sqlite3 module prepares
+them once per connection and reuses the prepared statement (see sqlite3.connect cached_statements), the parameters are
+converted to the stored values here and the payload is decoded directly to a numpy array.
+
+The DAOs below only replace the queries of the ORM DAOs (_query_flex_metric(s), _query_baseline_mean(s)), the cache and
+the errors of the lookups are the same. Like the ORM queries, the first row of a key that is stored more than once is returned.
+'''
+
+# Rows of equal keys are in rowid order in the lookup index, ordering by rowid doesn't add a sort
+_FLEX_METRIC_SQL: Final[str] = f'SELECT flex_metric FROM {FlexMetric.__tablename__} ' \
+                               'WHERE device_type = ? AND "group" = ? AND typical_day = ? AND cong_start = ? AND cong_duration = ? ORDER BY rowid'
+_BASELINE_MEAN_SQL: Final[str] = f'SELECT mean_power FROM {Baseline.__tablename__} WHERE device_type = ? AND "group" = ? AND typical_day = ? ORDER BY rowid'
+
+
+def _time_value(t: time) -> str:
+    '''The value of a time as stored by the sqlite Time type of SQLAlchemy'''
+    return f"{t.hour:02d}:{t.minute:02d}:{t.second:02d}.{t.microsecond:06d}"
+
+
+def _flex_metric_params(key: FlexMetricKey) -> Tuple:
+    # Device types are stored by name, see MappedEnum
+    return (key.device_type.name, key.group, key.typical_day, _time_value(key.cong_start), key.cong_duration)
+
+
+def _baseline_params(key: BaselineKey) -> Tuple:
+    return (key.device_type.name, key.group, key.typical_day)
+
+
+def _fetch_one(connection, sql: str, params: Tuple) -> Optional[Tuple]:
+    t = perf_counter()
+    row = connection.execute(sql, params).fetchone()
+    record_query(perf_counter() - t)
+    return row
+
+
+class CoreFlexDevicesDao(FlexDevicesDao):
+    '''FlexDevicesDao with the flex metric lookups in core SQL (see module docstring), the other methods use the ORM'''
+
+    def __init__(self, session: Session, cache: ProfileCache = None) -> None:
+        super().__init__(session, cache)
+        self.connection = session.connection().connection.driver_connection
+
+    def _query_flex_metric(self, key: FlexMetricKey) -> Optional[np.ndarray]:
+        row = _fetch_one(self.connection, _FLEX_METRIC_SQL, _flex_metric_params(key))
+        return decode_profile(row[0]) if row is not None else None
+
+    def _query_flex_metrics(self, keys: List[FlexMetricKey]) -> Dict[FlexMetricKey, np.ndarray]:
+        # One execution of the prepared statement per key is a single index seek, cheaper than compiling an OR query
+        flex_metrics = {key: self._query_flex_metric(key) for key in keys}
+        return {key: flex_metric for key, flex_metric in flex_metrics.items() if flex_metric is not None}
+
+
+class CoreBaselineDao(BaselineDao):
+    '''BaselineDao with the mean baseline lookups in core SQL (see module docstring), the other methods use the ORM'''
+
+    def __init__(self, session: Session, cache: ProfileCache = None) -> None:
+        super().__init__(session, cache)
+        self.connection = session.connection().connection.driver_connection
+
+    def _query_baseline_mean(self, key: BaselineKey) -> Optional[np.ndarray]:
+        row = _fetch_one(self.connection, _BASELINE_MEAN_SQL, _baseline_params(key))
+        return decode_profile(row[0]) if row is not None else None
+
+    def _query_baseline_means(self, keys: List[BaselineKey]) -> Dict[BaselineKey, np.ndarray]:
+        baselines = {key: self._query_baseline_mean(key) for key in keys}
+        return {key: baseline for key, baseline in baselines.items() if baseline is not None}
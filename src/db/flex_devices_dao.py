@@ -1,51 +1,67 @@
 
-import pickle
 from datetime import time
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 
-from sqlalchemy import delete, select
+import numpy as np
+from sqlalchemy import delete, select, text
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm import Session
 
 from db.data_not_found_exception import DataNotFoundException
+from db.lookup_keys import BaselineKey, FlexMetricKey, matches_any_key
 from db.models import FlexMetric
+from db.profile_cache import ProfileCache
+from db.profile_codec import decode_profile, encode_profile
 from experiment.experiment import Experiment
 from experiment.experiment_container import ExperimentContainer
 from experiment.experiment_description import DeviceType
 
 
 class FlexDevicesDao():
+    # Keep the amount of bound parameters per query well below the sqlite limit
+    BULK_CHUNK_SIZE: int = 1000
+    # Amount of keys per bulk lookup query, see matches_any_key
+    LOOKUP_CHUNK_SIZE: int = 100
+
+    # Amount of rows per executemany of an upsert
+    UPSERT_BATCH_SIZE: int = 5000
+
+    @classmethod
+    def to_db_values(cls, exp: Experiment) -> Dict[str, Any]:
+        return dict(id=exp.exp_des.name,
+                    cong_start=exp.exp_des.congestion_start.time(),
+                    cong_duration=exp.exp_des.congestion_duration,
+                    device_type=exp.exp_des.device_type,
+                    group=exp.exp_des.group,
+                    typical_day=exp.exp_des.typical_day,
+                    flex_metric=encode_profile(exp.get_weighted_mean_flex_metrics_array()))
 
     @classmethod
     def to_db_object(cls, exp: Experiment) -> FlexMetric:
-        flex_metric = pickle.dumps(exp.get_weighted_mean_flex_metrics().to_list())
-        return FlexMetric(id=exp.exp_des.name, 
-                            cong_start=exp.exp_des.congestion_start.time(),
-                            cong_duration=exp.exp_des.congestion_duration,
-                            device_type=exp.exp_des.device_type,
-                            group=exp.exp_des.group,
-                            typical_day=exp.exp_des.typical_day,
-                            flex_metric=flex_metric)
+        return FlexMetric(**FlexDevicesDao.to_db_values(exp))
 
     
-    def __init__(self, session: Session) -> None:
+    def __init__(self, session: Session, cache: ProfileCache = None) -> None:
         self.session = session
+        self.cache = cache
 
-    def save_container(self, container: ExperimentContainer):
-        for e in container.exp.values():
-            exp = self.session.get(FlexMetric, e.exp_des.name)
-            if exp:
-                self.session.merge(FlexDevicesDao.to_db_object(e))
-            else: 
-                self.session.add(FlexDevicesDao.to_db_object(e))
-        self.session.commit()
+    def save_container(self, container: ExperimentContainer, commit: bool = True):
+        self.upsert([FlexDevicesDao.to_db_values(e) for e in container.exp.values()], commit)
 
-    def save(self, exp: Experiment):
-        exp_db = self.session.get(FlexMetric, exp.exp_des.name)
-        if exp_db:
-            self.session.merge(FlexDevicesDao.to_db_object(exp))
-        else: 
-            self.session.add(FlexDevicesDao.to_db_object(exp))
-        self.session.commit()
+    def save(self, exp: Experiment, commit: bool = True):
+        self.upsert([FlexDevicesDao.to_db_values(exp)], commit)
+
+    def upsert(self, rows: List[Dict[str, Any]], commit: bool = True):
+        '''
+        Insert or update flex metric rows (see to_db_values) with a single INSERT ... ON CONFLICT statement per batch.
+        '''
+        stmt = insert(FlexMetric)
+        stmt = stmt.on_conflict_do_update(index_elements=[FlexMetric.id],
+                                          set_={c: stmt.excluded[c] for c in ['cong_start', 'cong_duration', 'device_type', 'group', 'typical_day', 'flex_metric']})
+        for batch_start in range(0, len(rows), self.UPSERT_BATCH_SIZE):
+            self.session.execute(stmt, rows[batch_start:batch_start + self.UPSERT_BATCH_SIZE])
+        if commit:
+            self.session.commit()
 
     def get_typical_days(self, device_type: DeviceType) -> List[str]:
         stmt = select(FlexMetric.typical_day).where(FlexMetric.device_type.is_(device_type)).distinct()
@@ -77,20 +93,107 @@ class FlexDevicesDao():
         stmt = select(FlexMetric.group).where(FlexMetric.device_type.is_(device_type)).distinct()
         return self.session.scalars(stmt).all()
 
-    def get_flex_metrics(self, device_type: DeviceType, cong_start: time, cong_dur: int, group: str, typical_day: str) -> List[float]:
+    def get_flex_metrics(self, device_type: DeviceType, cong_start: time, cong_dur: int, group: str, typical_day: str) -> np.ndarray:
+        key = FlexMetricKey(device_type, group, typical_day, cong_start, cong_dur)
+        if self.cache is not None:
+            cached = self.cache.get((FlexMetric.__tablename__, key))
+            if cached is not None:
+                return cached
+        flex_metric = self._query_flex_metric(key)
+        if flex_metric is None:
+            raise DataNotFoundException(f"No flex metrics found for {str(key)}.")
+        return self.cache.put((FlexMetric.__tablename__, key), flex_metric) if self.cache is not None else flex_metric
+
+    def _query_flex_metric(self, key: FlexMetricKey) -> Optional[np.ndarray]:
+        '''Query the flex metrics of one key without the cache, None if the key is missing. See _query_flex_metrics.'''
         stmt = select(FlexMetric.flex_metric)\
-                    .filter(FlexMetric.device_type.is_(device_type))\
-                    .filter(FlexMetric.cong_start.is_(cong_start))\
-                    .filter(FlexMetric.cong_duration.is_(cong_dur))\
-                    .filter(FlexMetric.group.is_(group))\
-                    .filter(FlexMetric.typical_day.is_(typical_day))
+                    .filter(FlexMetric.device_type.is_(key.device_type))\
+                    .filter(FlexMetric.cong_start.is_(key.cong_start))\
+                    .filter(FlexMetric.cong_duration.is_(key.cong_duration))\
+                    .filter(FlexMetric.group.is_(key.group))\
+                    .filter(FlexMetric.typical_day.is_(key.typical_day))\
+                    .order_by(text("rowid"))
         res = self.session.scalar(stmt)
-        if res:
-            return pickle.loads(res)
+        return decode_profile(res) if res else None
+
+    def get_flex_metrics_bulk(self, keys: List[FlexMetricKey]) -> Dict[FlexMetricKey, np.ndarray]:
+        '''
+        Fetch the flex metrics of all keys, with one query per LOOKUP_CHUNK_SIZE keys. Raises a DataNotFoundException that
+        names every missing key. The first row of a key that is stored more than once is returned.
+        '''
+        keys = list(dict.fromkeys(keys))
+        if self.cache is not None:
+            cached = self.cache.load_many([(FlexMetric.__tablename__, k) for k in keys],
+                                          lambda cache_keys: {(FlexMetric.__tablename__, k): v for k, v in self._query_flex_metrics([k[1] for k in cache_keys]).items()})
+            flex_metrics = {k[1]: v for k, v in cached.items()}
         else:
-            raise DataNotFoundException(f"No flex metrics found for {str(device_type)}, congestion start '{cong_start}', congestion duration '{cong_dur}', group '{group}', typical day '{typical_day}'.")
+            flex_metrics = self._query_flex_metrics(keys)
+        missing = [k for k in keys if k not in flex_metrics]
+        if missing:
+            raise DataNotFoundException("No flex metrics found for:\n\t" + "\n\t".join(map(str, missing)))
+        return flex_metrics
+
+    def _query_flex_metrics(self, keys: List[FlexMetricKey]) -> Dict[FlexMetricKey, np.ndarray]:
+        '''
+        Query the flex metrics of the keys, without the cache. Missing keys are left out, of a key that is stored more than
+        once the first row is returned. The lookups of this DAO read through this method and _query_flex_metric,
+        see db/core_lookups.py for another read path.
+        '''
+        flex_metrics: Dict[FlexMetricKey, np.ndarray] = {}
+        key_columns = [FlexMetric.device_type, FlexMetric.group, FlexMetric.typical_day, FlexMetric.cong_start, FlexMetric.cong_duration]
+        for chunk_start in range(0, len(keys), self.LOOKUP_CHUNK_SIZE):
+            chunk = keys[chunk_start:chunk_start + self.LOOKUP_CHUNK_SIZE]
+            stmt = select(*key_columns, FlexMetric.flex_metric).where(matches_any_key(key_columns, chunk)).order_by(text("rowid"))
+            for row in self.session.execute(stmt):
+                key = FlexMetricKey(*row[:5])
+                if key not in flex_metrics:
+                    flex_metrics[key] = decode_profile(row.flex_metric)
+        return flex_metrics
+
+    def get_congestion_windows(self) -> List[Tuple[time, int]]:
+        '''Return all (congestion start, congestion duration) combinations in the database, sorted'''
+        stmt = select(FlexMetric.cong_start, FlexMetric.cong_duration).distinct().order_by(FlexMetric.cong_start, FlexMetric.cong_duration)
+        return [tuple(row) for row in self.session.execute(stmt)]
+
+    def get_flex_metrics_of_groups(self, keys: List[BaselineKey]) -> Dict[FlexMetricKey, np.ndarray]:
+        '''
+        Fetch the flex metrics of all congestion periods of the (device type, group, typical day) keys, with one query per
+        LOOKUP_CHUNK_SIZE keys. Raises a DataNotFoundException that names every key without flex metrics. Like
+        get_flex_metrics, the first row of a congestion period that is stored more than once is returned. The profiles are not cached.
+        '''
+        keys = list(dict.fromkeys(keys))
+        flex_metrics: Dict[FlexMetricKey, np.ndarray] = {}
+        group_columns = [FlexMetric.device_type, FlexMetric.group, FlexMetric.typical_day]
+        for chunk_start in range(0, len(keys), self.LOOKUP_CHUNK_SIZE):
+            chunk = keys[chunk_start:chunk_start + self.LOOKUP_CHUNK_SIZE]
+            stmt = select(*group_columns, FlexMetric.cong_start, FlexMetric.cong_duration, FlexMetric.flex_metric)\
+                        .where(matches_any_key(group_columns, chunk)).order_by(text("rowid"))
+            for row in self.session.execute(stmt):
+                key = FlexMetricKey(*row[:5])
+                if key not in flex_metrics:
+                    flex_metrics[key] = decode_profile(row.flex_metric)
+        found = {BaselineKey(*k[:3]) for k in flex_metrics}
+        missing = [k for k in keys if k not in found]
+        if missing:
+            raise DataNotFoundException("No flex metrics found for:\n\t" + "\n\t".join(map(str, missing)))
+        return flex_metrics
+
+    def get_flex_metrics_of_device_type(self, device_type: DeviceType) -> Dict[str, Tuple[FlexMetricKey, np.ndarray]]:
+        '''
+        Return the key and flex metrics of all flex metric rows of the device type, by id, in the order of the rows.
+        Scenario aggregates written in this order keep the first row of a key first.
+        '''
+        stmt = select(FlexMetric.id, FlexMetric.device_type, FlexMetric.group, FlexMetric.typical_day, FlexMetric.cong_start, FlexMetric.cong_duration, FlexMetric.flex_metric)\
+                    .where(FlexMetric.device_type.is_(device_type)).order_by(text("rowid"))
+        return {row.id: (FlexMetricKey(*row[1:6]), decode_profile(row.flex_metric)) for row in self.session.execute(stmt)}
 
     def delete_device_type(self, device_type: DeviceType):
         stmt = delete(FlexMetric).where(FlexMetric.device_type.is_(device_type))
         self.session.execute(stmt)
-        self.session.commit()
\ No newline at end of file
+        self.session.commit()
+
+    def delete_ids(self, ids: List[str], commit: bool = True):
+        for chunk_start in range(0, len(ids), self.BULK_CHUNK_SIZE):
+            self.session.execute(delete(FlexMetric).where(FlexMetric.id.in_(ids[chunk_start:chunk_start + self.BULK_CHUNK_SIZE])))
+        if commit:
+            self.session.commit()
@@ -0,0 +1,37 @@
+from datetime import time
+from typing import Iterable, NamedTuple, Sequence
+
+from sqlalchemy import ColumnElement, and_, or_
+
+from experiment.device_type import DeviceType
+
+
+class FlexMetricKey(NamedTuple):
+    '''Identifies one flex metric profile in the database'''
+    device_type: DeviceType
+    group: str
+    typical_day: str
+    cong_start: time
+    cong_duration: int
+
+    def __str__(self) -> str:
+        return f"{str(self.device_type)}, congestion start '{self.cong_start}', congestion duration '{self.cong_duration}', group '{self.group}', typical day '{self.typical_day}'"
+
+
+class BaselineKey(NamedTuple):
+    '''Identifies one baseline profile in the database'''
+    device_type: DeviceType
+    group: str
+    typical_day: str
+
+    def __str__(self) -> str:
+        return f"{str(self.device_type)}, group '{self.group}', typical day '{self.typical_day}'"
+
+
+def matches_any_key(columns: Sequence[ColumnElement], keys: Iterable[tuple]) -> ColumnElement[bool]:
+    '''
+    Filter on the rows whose columns equal one of the keys. SQLite looks up every OR-ed equality in the index that starts
+    with the columns, a row-value IN (tuple_(...).in_(keys)) compiles to a scan of the whole table instead.
+    Every key adds a level to the expression tree, which sqlite limits to 1000 levels: filter on at most a few hundred keys.
+    '''
+    return or_(*(and_(*(c == v for c, v in zip(columns, key))) for key in keys))
@@ -1,7 +1,8 @@
 
 from datetime import time
+from typing import Final, List
 
-from sqlalchemy import BLOB, Column, Time
+from sqlalchemy import BLOB, JSON, Column, Index, Time
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 from db.type_decorators import MappedEnum
@@ -11,6 +12,13 @@ from experiment.experiment_description import DeviceType
 Python models of the SQL database tables.
 '''
 
+# Stored in the 'user_version' pragma of the sqlite database
+# 1: binary profile format
+# 2: lookup indexes on flexible_devices and baseline
+# 3: source_files manifest table
+# 4: optional scenario_aggregates table
+DB_SCHEMA_VERSION: Final[int] = 4
+
 class Base(DeclarativeBase):
     pass
 
@@ -29,6 +37,9 @@ class FlexMetric(Base):
     group: Mapped[str]
     flex_metric: Mapped[BLOB] = Column(BLOB)
 
+    # Matches the lookup of a flex metric and also covers the congestion start and duration queries
+    __table_args__ = (Index("ix_flexible_devices_lookup", "device_type", "group", "typical_day", "cong_start", "cong_duration"),)
+
     def __repr__(self) -> str:
         return f"{self.asset_type}: cong_start: {self.cong_start}, cong_dur: {self.cong_duration})"
 
@@ -45,3 +56,43 @@ class Baseline(Base):
     group: Mapped[str]
     mean_power: Mapped[BLOB] = Column(BLOB)
     p95: Mapped[BLOB] = Column(BLOB)
+
+    __table_args__ = (Index("ix_baseline_lookup", "device_type", "group", "typical_day"),)
+
+
+class ScenarioAggregate(Base):
+    '''
+    Python model of the optional database table with precomputed scenario data per flex metric (see FlexMetric, with the same id).
+    All profiles cover the congestion period and are per device: the baseline mean, the flex metric and the flex power (flex metric x baseline mean).
+    '''
+    __tablename__ = "scenario_aggregates"
+
+    id: Mapped[str] = mapped_column(primary_key=True)
+    cong_start: Mapped[time] = Column(Time)
+    cong_duration: Mapped[int]
+    device_type: Mapped[DeviceType] = Column(MappedEnum(DeviceType))
+    typical_day: Mapped[str]
+    group: Mapped[str]
+    baseline_mean: Mapped[BLOB] = Column(BLOB)
+    flex_metric: Mapped[BLOB] = Column(BLOB)
+    flex_power: Mapped[BLOB] = Column(BLOB)
+
+    __table_args__ = (Index("ix_scenario_aggregates_lookup", "device_type", "group", "typical_day", "cong_start", "cong_duration"),)
+
+
+class SourceFile(Base):
+    '''
+    Python model of the database table with the input files that are written to the database, and the rows they produced.
+    Used to only process new and changed input files.
+    '''
+    __tablename__ = "source_files"
+
+    asset_type: Mapped[str] = mapped_column(primary_key=True)
+    path: Mapped[str] = mapped_column(primary_key=True)
+    device_type: Mapped[DeviceType] = Column(MappedEnum(DeviceType))
+    group: Mapped[str]
+    size: Mapped[int]
+    mtime_ns: Mapped[int]
+    hash: Mapped[str]
+    flex_metric_ids: Mapped[List[str]] = Column(JSON)
+    baseline_ids: Mapped[List[str]] = Column(JSON)
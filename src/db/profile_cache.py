@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Event, Lock
+from time import monotonic
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+@dataclass
+class CacheStats():
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    coalesced: int = 0
+    '''Misses that were served by a load of another thread'''
+
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+
+class _Flight():
+    '''A load of a profile that is in progress'''
+
+    def __init__(self) -> None:
+        self.done = Event()
+        self.profile: Optional[np.ndarray] = None
+        self.failed = False
+
+
+class ProfileCache():
+    '''
+    Bounded LRU cache for profiles read from the database. Cached arrays are read-only.
+
+    The cache is cleared as soon as the database file (or its write-ahead log) changes on disk,
+    so writes and deletes by to_database.py are picked up without restarting the process.
+    '''
+
+    __shared: Dict[Path, ProfileCache] = {}
+    __shared_lock = Lock()
+
+    def __init__(self, db_file: Optional[Path] = None, max_size: int = 4096, ttl_s: Optional[float] = None) -> None:
+        '''
+        Args:
+            db_file: database file to watch for changes. If None, the cache is only invalidated explicitly.
+            max_size: maximum amount of profiles in the cache.
+            ttl_s: time to live of a cached profile in seconds. If None, profiles only expire on eviction or invalidation.
+        '''
+        if max_size < 1:
+            raise AssertionError("Cache size should be at least 1")
+        self.db_file = db_file
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.stats = CacheStats()
+        self.__entries: OrderedDict[Hashable, Tuple[np.ndarray, float]] = OrderedDict()
+        self.__in_flight: Dict[Hashable, _Flight] = {}
+        self.__generation = self.__db_generation()
+        self.__lock = Lock()
+
+    @classmethod
+    def shared(cls, db_file: Path) -> ProfileCache:
+        '''Return the cache that is shared by all users of a database file within this process'''
+        path = db_file.resolve()
+        with cls.__shared_lock:
+            if path not in cls.__shared:
+                cls.__shared[path] = ProfileCache(path)
+            return cls.__shared[path]
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, np.ndarray]:
+        '''Return the cached profiles for the keys that are present in the cache'''
+        with self.__lock:
+            return self.__get_many(keys)
+
+    def load_many(self, keys: List[Hashable], load: Callable[[List[Hashable]], Dict[Hashable, np.ndarray]]) -> Dict[Hashable, np.ndarray]:
+        '''
+        Return the profiles of the keys, the profiles that are not cached are loaded with one call of load and cached.
+        Keys that another thread is loading at the same time are not loaded again, the result of that load is used (single-flight).
+        Keys that load doesn't return are left out of the result.
+        '''
+        to_load: List[Hashable] = []
+        to_wait: Dict[Hashable, _Flight] = {}
+        with self.__lock:
+            found = self.__get_many(keys)
+            for key in dict.fromkeys(keys):
+                if key in found:
+                    continue
+                flight = self.__in_flight.get(key)
+                if flight is None:
+                    self.__in_flight[key] = _Flight()
+                    to_load.append(key)
+                else:
+                    to_wait[key] = flight
+        if to_load:
+            found.update(self.__load(to_load, load))
+        retry: List[Hashable] = []
+        for key, flight in to_wait.items():
+            flight.done.wait()
+            if flight.failed:
+                retry.append(key)
+            elif flight.profile is not None:
+                found[key] = flight.profile
+        with self.__lock:
+            self.stats.coalesced += len(to_wait) - len(retry)
+        if retry:
+            found.update({k: self.put(k, v) for k, v in load(retry).items()})
+        return found
+
+    def __load(self, keys: List[Hashable], load: Callable[[List[Hashable]], Dict[Hashable, np.ndarray]]) -> Dict[Hashable, np.ndarray]:
+        '''Load the keys of which this thread owns the flight, and pass the result to the threads that wait for it'''
+        flights = [self.__in_flight[k] for k in keys]
+        try:
+            loaded = {k: self.put(k, v) for k, v in load(keys).items()}
+        except BaseException:
+            for flight in flights:
+                flight.failed = True
+            raise
+        else:
+            for key, flight in zip(keys, flights):
+                flight.profile = loaded.get(key)
+        finally:
+            with self.__lock:
+                for key, flight in zip(keys, flights):
+                    del self.__in_flight[key]
+                    flight.done.set()
+        return loaded
+
+    def __get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, np.ndarray]:
+        found: Dict[Hashable, np.ndarray] = {}
+        self.__validate()
+        now = monotonic()
+        for key in keys:
+            entry = self.__entries.get(key)
+            if entry is not None and self.ttl_s is not None and now - entry[1] > self.ttl_s:
+                del self.__entries[key]
+                entry = None
+            if entry is None:
+                self.stats.misses += 1
+            else:
+                self.__entries.move_to_end(key)
+                self.stats.hits += 1
+                found[key] = entry[0]
+        return found
+
+    def put(self, key: Hashable, profile: np.ndarray) -> np.ndarray:
+        '''Add a profile to the cache and return the read-only array that is cached'''
+        if profile.flags.writeable:
+            profile = profile.copy()
+            profile.flags.writeable = False
+        with self.__lock:
+            self.__entries[key] = (profile, monotonic())
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.stats.evictions += 1
+        return profile
+
+    def invalidate(self) -> None:
+        with self.__lock:
+            self.__clear()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __clear(self) -> None:
+        if self.__entries:
+            self.stats.invalidations += 1
+        self.__entries.clear()
+
+    def __validate(self) -> None:
+        generation = self.__db_generation()
+        if generation != self.__generation:
+            self.__clear()
+            self.__generation = generation
+
+    def __db_generation(self) -> Tuple:
+        if self.db_file is None:
+            return ()
+        generation = []
+        for path in (self.db_file, Path(f"{self.db_file}-wal")):
+            try:
+                stat = os.stat(path)
+                generation.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                generation.append(None)
+        return tuple(generation)
@@ -0,0 +1,58 @@
+import pickle
+import struct
+from typing import Final, Sequence, Union
+
+import numpy as np
+
+from db.profile_format_exception import ProfileFormatException
+from util.instrumentation import record_decoded
+
+'''
+Binary storage format of the power profiles and flex metrics in the database.
+
+A profile is stored as a small fixed header followed by the raw little-endian array data:
+
+    magic (4 bytes) | format version (uint8) | dtype code (1 byte) | length (uint32) | data
+
+Decoding is zero-copy through np.frombuffer, so the returned arrays are read-only.
+'''
+
+PROFILE_MAGIC: Final[bytes] = b'FMPR'
+PROFILE_FORMAT_VERSION: Final[int] = 1
+
+_HEADER = struct.Struct('<4sBcI')
+_DTYPES = {b'f': np.dtype('<f4'), b'd': np.dtype('<f8')}
+_DTYPE_CODES = {v: k for k, v in _DTYPES.items()}
+
+
+def encode_profile(values: Union[Sequence[float], np.ndarray], dtype: np.dtype = np.float64) -> bytes:
+    arr = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    if arr.ndim != 1:
+        raise ProfileFormatException(f"Only one dimensional profiles can be stored, got shape {arr.shape}")
+    return _HEADER.pack(PROFILE_MAGIC, PROFILE_FORMAT_VERSION, _DTYPE_CODES[arr.dtype], len(arr)) + arr.tobytes()
+
+
+def is_encoded_profile(blob: bytes) -> bool:
+    return blob is not None and len(blob) >= _HEADER.size and blob[:len(PROFILE_MAGIC)] == PROFILE_MAGIC
+
+
+def decode_profile(blob: bytes) -> np.ndarray:
+    if not is_encoded_profile(blob):
+        raise ProfileFormatException("Profile is not stored in the binary profile format. Migrate the database with 'src/to_database.py --migrate'.")
+    _, version, dtype_code, length = _HEADER.unpack_from(blob)
+    if version != PROFILE_FORMAT_VERSION:
+        raise ProfileFormatException(f"Unsupported profile format version {version}")
+    if dtype_code not in _DTYPES:
+        raise ProfileFormatException(f"Unsupported profile data type '{dtype_code.decode()}'")
+    record_decoded(length * _DTYPES[dtype_code].itemsize)
+    return np.frombuffer(blob, dtype=_DTYPES[dtype_code], count=length, offset=_HEADER.size)
+
+
+def convert_legacy_profile(blob: bytes) -> bytes:
+    '''
+    Convert a pickled profile (list or pandas Series) to the binary profile format.
+    Only use this on databases from a trusted source, unpickling can execute arbitrary code.
+    '''
+    if is_encoded_profile(blob):
+        return blob
+    return encode_profile(np.asarray(pickle.loads(blob), dtype=np.float64))
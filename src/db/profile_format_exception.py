@@ -0,0 +1,2 @@
+class ProfileFormatException(Exception):
+    pass
@@ -0,0 +1,30 @@
+from pathlib import Path
+
+from sqlalchemy import Engine, create_engine, event
+from sqlalchemy.pool import QueuePool
+
+'''
+Engine for processes that only read the database, e.g. the scenario server (see server.py).
+'''
+
+# Amount of bytes of the database file that sqlite reads through a memory map, shared with other processes by the OS
+DEFAULT_MMAP_SIZE: int = 256 * 2**20
+
+
+def create_read_only_engine(db_file: Path, pool_size: int = 8, mmap_size: int = DEFAULT_MMAP_SIZE) -> Engine:
+    '''
+    Create an engine with a pool of read-only connections that can be used from many threads.
+    '''
+    engine = create_engine(f"sqlite:///file:{db_file.resolve()}?mode=ro&uri=true", echo=False,
+                           poolclass=QueuePool, pool_size=pool_size, max_overflow=0, pool_pre_ping=False,
+                           connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def set_read_only_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only=ON")
+        cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    return engine
@@ -0,0 +1,100 @@
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, NamedTuple
+
+import numpy as np
+from sqlalchemy import delete, exists, select, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from db.data_not_found_exception import DataNotFoundException
+from db.lookup_keys import FlexMetricKey, matches_any_key
+from db.models import ScenarioAggregate
+from db.profile_cache import ProfileCache
+from db.profile_codec import decode_profile, encode_profile
+from experiment.device_type import DeviceType
+
+
+def ptu_of_day(t: time) -> int:
+    '''Return the index of the PTU (15 minutes) of the day that starts at t'''
+    return int((datetime.combine(date(2020,1,1), t) - datetime(2020,1,1)) / timedelta(minutes=15))
+
+
+class ScenarioProfiles(NamedTuple):
+    '''Profiles of one device in the congestion period'''
+    baseline_mean: np.ndarray
+    flex_metric: np.ndarray
+    flex_power: np.ndarray
+
+
+class ScenarioAggregatesDao():
+    # Amount of keys per bulk lookup query, see matches_any_key
+    LOOKUP_CHUNK_SIZE: int = 100
+
+    # Amount of rows per executemany of an upsert
+    UPSERT_BATCH_SIZE: int = 5000
+
+    @classmethod
+    def to_db_values(cls, flex_id: str, key: FlexMetricKey, baseline_mean: np.ndarray, flex_metric: np.ndarray) -> Dict[str, Any]:
+        '''
+        Args:
+            flex_id: id of the flex metric row.
+            baseline_mean: mean baseline of the congestion period.
+        '''
+        if len(baseline_mean) != len(flex_metric):
+            raise AssertionError(f"Baseline and flex metric of {str(key)} have a different length")
+        return dict(id=flex_id, cong_start=key.cong_start, cong_duration=key.cong_duration, device_type=key.device_type, group=key.group, typical_day=key.typical_day,
+                    baseline_mean=encode_profile(baseline_mean), flex_metric=encode_profile(flex_metric), flex_power=encode_profile(np.asarray(flex_metric) * baseline_mean))
+
+    def __init__(self, session: Session, cache: ProfileCache = None) -> None:
+        self.session = session
+        self.cache = cache
+
+    def upsert(self, rows: List[Dict[str, Any]], commit: bool = True):
+        stmt = insert(ScenarioAggregate)
+        stmt = stmt.on_conflict_do_update(index_elements=[ScenarioAggregate.id],
+                                          set_={c: stmt.excluded[c] for c in ['cong_start', 'cong_duration', 'device_type', 'group', 'typical_day', 'baseline_mean', 'flex_metric', 'flex_power']})
+        for batch_start in range(0, len(rows), self.UPSERT_BATCH_SIZE):
+            self.session.execute(stmt, rows[batch_start:batch_start + self.UPSERT_BATCH_SIZE])
+        if commit:
+            self.session.commit()
+
+    def has_device_type(self, device_type: DeviceType) -> bool:
+        return self.session.scalar(select(exists().where(ScenarioAggregate.device_type.is_(device_type))))
+
+    def get_scenario_profiles_bulk(self, keys: List[FlexMetricKey], ignore_missing: bool = False) -> Dict[FlexMetricKey, ScenarioProfiles]:
+        '''
+        Fetch the scenario profiles of all keys, with one query per LOOKUP_CHUNK_SIZE keys. Raises a DataNotFoundException that
+        names every missing key, unless ignore_missing is set, then the missing keys are left out of the result.
+        Like the flex metric lookups, the first row of a key that is stored more than once is returned.
+        '''
+        keys = list(dict.fromkeys(keys))
+        if self.cache is not None:
+            cached = self.cache.load_many([(ScenarioAggregate.__tablename__, k) for k in keys],
+                                          lambda cache_keys: {(ScenarioAggregate.__tablename__, k): v for k, v in self.__query_scenario_profiles([k[1] for k in cache_keys]).items()})
+            profiles = {k[1]: v for k, v in cached.items()}
+        else:
+            profiles = self.__query_scenario_profiles(keys)
+        missing = [k for k in keys if k not in profiles]
+        if missing and not ignore_missing:
+            raise DataNotFoundException("No scenario aggregates found for:\n\t" + "\n\t".join(map(str, missing)))
+        return {k: ScenarioProfiles(*profiles[k]) for k in keys if k in profiles}
+
+    def __query_scenario_profiles(self, keys: List[FlexMetricKey]) -> Dict[FlexMetricKey, np.ndarray]:
+        '''Return the profiles of every key as one (3 x congestion duration) array, in the order of ScenarioProfiles'''
+        profiles: Dict[FlexMetricKey, np.ndarray] = {}
+        key_columns = [ScenarioAggregate.device_type, ScenarioAggregate.group, ScenarioAggregate.typical_day, ScenarioAggregate.cong_start, ScenarioAggregate.cong_duration]
+        for chunk_start in range(0, len(keys), self.LOOKUP_CHUNK_SIZE):
+            chunk = keys[chunk_start:chunk_start + self.LOOKUP_CHUNK_SIZE]
+            stmt = select(*key_columns, ScenarioAggregate.baseline_mean, ScenarioAggregate.flex_metric, ScenarioAggregate.flex_power)\
+                        .where(matches_any_key(key_columns, chunk)).order_by(text("rowid"))
+            for row in self.session.execute(stmt):
+                key = FlexMetricKey(*row[:5])
+                if key not in profiles:
+                    profiles[key] = np.stack([decode_profile(row.baseline_mean), decode_profile(row.flex_metric), decode_profile(row.flex_power)])
+        return profiles
+
+    def delete_device_type(self, device_type: DeviceType, commit: bool = True):
+        stmt = delete(ScenarioAggregate).where(ScenarioAggregate.device_type.is_(device_type))
+        self.session.execute(stmt)
+        if commit:
+            self.session.commit()
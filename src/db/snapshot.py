@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import json
+import shutil
+from datetime import time
+from pathlib import Path
+from typing import Dict, Final, List, Tuple
+
+import numpy as np
+from sqlalchemy import Engine, inspect, select, text
+from sqlalchemy.orm import Session
+
+from db.data_not_found_exception import DataNotFoundException
+from db.lookup_keys import BaselineKey, FlexMetricKey
+from db.models import DB_SCHEMA_VERSION, Baseline, FlexMetric, ScenarioAggregate
+from db.profile_codec import decode_profile
+from db.scenario_aggregates_dao import ScenarioProfiles
+
+'''
+Read-only snapshot of the flex metrics database, for machines that only look up profiles.
+
+A snapshot is a directory of numpy files that are memory-mapped on open, so opening is near-instant and the OS shares
+the pages between processes:
+
+    profiles.npy    all profiles (flex metrics, baselines and scenario aggregates) in one contiguous float32 array
+    keys.npy        the sorted lookup keys of the profiles
+    offsets.npy     offset of the profile of every key in profiles.npy
+    lengths.npy     length of the profile of every key
+    snapshot.json   format version and the congestion periods of the flex metrics
+
+A lookup is a binary search in the keys and a slice of the profiles, without copying.
+'''
+
+SNAPSHOT_FORMAT_VERSION: Final[int] = 1
+
+_SEPARATOR: Final[str] = '\x1f'
+_FLEX_METRIC: Final[str] = 'F'
+_BASELINE: Final[str] = 'B'
+_SCENARIO_AGGREGATE: Final[str] = 'S'
+
+
+# The keys are stored as UTF-8 bytes, which sort in the same order as the strings
+def _flex_metric_key(kind: str, key: FlexMetricKey) -> bytes:
+    return _SEPARATOR.join([kind, str(key.device_type), key.group, key.typical_day, key.cong_start.isoformat(), str(key.cong_duration)]).encode()
+
+
+def _baseline_key(key: BaselineKey) -> bytes:
+    return _SEPARATOR.join([_BASELINE, str(key.device_type), key.group, key.typical_day]).encode()
+
+
+def write_snapshot(engine: Engine, snapshot_dir: Path) -> int:
+    '''
+    Write a snapshot of the database, replacing an existing snapshot in the directory. Returns the amount of profiles.
+    '''
+    keys: List[bytes] = []
+    profiles: List[np.ndarray] = []
+    windows = set()
+    with Session(engine) as session:
+        # In rowid order: the stable sort below keeps the first row of a key that is stored more than once first, the row the database lookups return
+        stmt = select(FlexMetric.device_type, FlexMetric.group, FlexMetric.typical_day, FlexMetric.cong_start, FlexMetric.cong_duration, FlexMetric.flex_metric)\
+                    .order_by(text("rowid"))
+        for row in session.execute(stmt):
+            keys.append(_flex_metric_key(_FLEX_METRIC, FlexMetricKey(*row[:5])))
+            profiles.append(decode_profile(row.flex_metric))
+            windows.add((row.cong_start, row.cong_duration))
+        for row in session.execute(select(Baseline.device_type, Baseline.group, Baseline.typical_day, Baseline.mean_power).order_by(text("rowid"))):
+            keys.append(_baseline_key(BaselineKey(*row[:3])))
+            profiles.append(decode_profile(row.mean_power))
+        if inspect(engine).has_table(ScenarioAggregate.__tablename__):
+            stmt = select(ScenarioAggregate.device_type, ScenarioAggregate.group, ScenarioAggregate.typical_day, ScenarioAggregate.cong_start, ScenarioAggregate.cong_duration,
+                          ScenarioAggregate.baseline_mean, ScenarioAggregate.flex_metric, ScenarioAggregate.flex_power).order_by(text("rowid"))
+            for row in session.execute(stmt):
+                keys.append(_flex_metric_key(_SCENARIO_AGGREGATE, FlexMetricKey(*row[:5])))
+                # Stored as one profile of 3 x congestion duration, in the order of ScenarioProfiles
+                profiles.append(np.concatenate([decode_profile(row.baseline_mean), decode_profile(row.flex_metric), decode_profile(row.flex_power)]))
+
+    key_array = np.array(keys, dtype=bytes)
+    order = np.argsort(key_array, kind='stable')
+    lengths = np.array([len(p) for p in profiles], dtype=np.int32)[order]
+    offsets = np.zeros(len(keys), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+    values = np.concatenate([profiles[i] for i in order]).astype(np.float32) if keys else np.empty(0, dtype=np.float32)
+
+    # Write next to the old snapshot and replace it at the end, readers never see a partial snapshot
+    tmp_dir = snapshot_dir.with_name(snapshot_dir.name + '.tmp')
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+    np.save(tmp_dir / 'profiles.npy', values)
+    np.save(tmp_dir / 'keys.npy', key_array[order])
+    np.save(tmp_dir / 'offsets.npy', offsets)
+    np.save(tmp_dir / 'lengths.npy', lengths)
+    with open(tmp_dir / 'snapshot.json', 'w') as f:
+        json.dump({'format_version': SNAPSHOT_FORMAT_VERSION, 'db_schema_version': DB_SCHEMA_VERSION,
+                   'congestion_windows': [[s.isoformat(), d] for s, d in sorted(windows)]}, f)
+    if snapshot_dir.exists():
+        shutil.rmtree(snapshot_dir)
+    tmp_dir.rename(snapshot_dir)
+    return len(keys)
+
+
+class SnapshotFlexMetrics():
+    '''
+    Reader of a snapshot (see write_snapshot) with the lookups of the DAOs that FlexMetrics uses, so FlexMetrics can use it
+    in place of the database. The returned profiles are read-only float32 views of the snapshot.
+    '''
+
+    def __init__(self, snapshot_dir: Path) -> None:
+        if not (snapshot_dir / 'snapshot.json').exists():
+            raise FileNotFoundError(f"No snapshot found in '{snapshot_dir}'")
+        with open(snapshot_dir / 'snapshot.json') as f:
+            meta = json.load(f)
+        if meta['format_version'] != SNAPSHOT_FORMAT_VERSION:
+            raise AssertionError(f"Unsupported snapshot format version {meta['format_version']}, export the snapshot again")
+        self.snapshot_dir = snapshot_dir
+        self.profiles: np.ndarray = np.load(snapshot_dir / 'profiles.npy', mmap_mode='r')
+        self.keys: np.ndarray = np.load(snapshot_dir / 'keys.npy', mmap_mode='r')
+        self.offsets: np.ndarray = np.load(snapshot_dir / 'offsets.npy', mmap_mode='r')
+        self.lengths: np.ndarray = np.load(snapshot_dir / 'lengths.npy', mmap_mode='r')
+        self.congestion_windows: List[Tuple[time, int]] = [(time.fromisoformat(s), d) for s, d in meta['congestion_windows']]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def get_flex_metrics_bulk(self, keys: List[FlexMetricKey]) -> Dict[FlexMetricKey, np.ndarray]:
+        '''Raises a DataNotFoundException that names every missing key'''
+        flex_metrics = self.__lookup(keys, [_flex_metric_key(_FLEX_METRIC, k) for k in keys])
+        self.__raise_missing("flex metrics", keys, flex_metrics)
+        return flex_metrics
+
+    def get_baseline_means_bulk(self, keys: List[BaselineKey]) -> Dict[BaselineKey, np.ndarray]:
+        '''Raises a DataNotFoundException that names every missing key'''
+        baselines = self.__lookup(keys, [_baseline_key(k) for k in keys])
+        self.__raise_missing("baselines", keys, baselines)
+        return baselines
+
+    def get_scenario_profiles_bulk(self, keys: List[FlexMetricKey], ignore_missing: bool = False) -> Dict[FlexMetricKey, ScenarioProfiles]:
+        '''Raises a DataNotFoundException that names every missing key, unless ignore_missing is set'''
+        profiles = self.__lookup(keys, [_flex_metric_key(_SCENARIO_AGGREGATE, k) for k in keys])
+        if not ignore_missing:
+            self.__raise_missing("scenario aggregates", keys, profiles)
+        return {k: ScenarioProfiles(*p.reshape(3, -1)) for k, p in profiles.items()}
+
+    def get_congestion_windows(self) -> List[Tuple[time, int]]:
+        return self.congestion_windows
+
+    def get_flex_metrics_of_groups(self, keys: List[BaselineKey]) -> Dict[FlexMetricKey, np.ndarray]:
+        '''Return the flex metrics of all congestion periods of the (device type, group, typical day) keys'''
+        flex_metrics: Dict[FlexMetricKey, np.ndarray] = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            # The flex metrics of a group are a contiguous range of the sorted keys
+            prefix = _SEPARATOR.join([_FLEX_METRIC, str(key.device_type), key.group, key.typical_day, ''])
+            start, end = np.searchsorted(self.keys, np.array([prefix.encode(), (prefix[:-1] + chr(ord(_SEPARATOR) + 1)).encode()]))
+            if start == end:
+                missing.append(key)
+            for i in range(start, end):
+                cong_start, cong_duration = self.keys[i].decode().split(_SEPARATOR)[4:]
+                # A key that is stored more than once is a run of equal keys, the first is the first row in the database
+                flex_metrics.setdefault(FlexMetricKey(*key, time.fromisoformat(cong_start), int(cong_duration)), self.__profile(i))
+        if missing:
+            raise DataNotFoundException("No flex metrics found for:\n\t" + "\n\t".join(map(str, missing)))
+        return flex_metrics
+
+    def __lookup(self, keys: List, snapshot_keys: List[bytes]) -> Dict:
+        if not keys:
+            return {}
+        query = np.array(snapshot_keys, dtype=bytes)
+        positions = np.minimum(np.searchsorted(self.keys, query), max(len(self.keys) - 1, 0))
+        found = (self.keys[positions] == query) if len(self.keys) > 0 else np.zeros(len(query), dtype=bool)
+        return {k: self.__profile(p) for k, p, f in zip(keys, positions, found) if f}
+
+    def __profile(self, position: int) -> np.ndarray:
+        offset = self.offsets[position]
+        return self.profiles[offset:offset + self.lengths[position]]
+
+    def __raise_missing(self, what: str, keys: List, found: Dict):
+        missing = [k for k in dict.fromkeys(keys) if k not in found]
+        if missing:
+            raise DataNotFoundException(f"No {what} found for:\n\t" + "\n\t".join(map(str, missing)))
@@ -0,0 +1,67 @@
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, List
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from db.models import SourceFile
+from experiment.device_type import DeviceType
+
+
+def file_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(2**20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class SourceFilesDao():
+    '''
+    Manifest of the input files that are written to the database, per asset type of to_database.py.
+    '''
+    # Keep the amount of bound parameters per query well below the sqlite limit
+    BULK_CHUNK_SIZE: int = 1000
+
+    @classmethod
+    def to_db_values(cls, asset_type: str, path: Path, device_type: DeviceType, group: str, flex_metric_ids: List[str], baseline_ids: List[str]) -> Dict[str, Any]:
+        stat = path.stat()
+        return dict(asset_type=asset_type, path=str(path), device_type=device_type, group=group, size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                    hash=file_hash(path), flex_metric_ids=flex_metric_ids, baseline_ids=baseline_ids)
+
+    def __init__(self, session: Session) -> None:
+        self.session = session
+
+    def get_source_files(self, asset_type: str) -> Dict[str, SourceFile]:
+        '''Return the manifest entries of an asset type by path'''
+        stmt = select(SourceFile).where(SourceFile.asset_type == asset_type)
+        return {s.path: s for s in self.session.scalars(stmt)}
+
+    def upsert(self, rows: List[Dict[str, Any]], commit: bool = True):
+        stmt = insert(SourceFile)
+        stmt = stmt.on_conflict_do_update(index_elements=[SourceFile.asset_type, SourceFile.path],
+                                          set_={c: stmt.excluded[c] for c in ['device_type', 'group', 'size', 'mtime_ns', 'hash', 'flex_metric_ids', 'baseline_ids']})
+        if rows:
+            self.session.execute(stmt, rows)
+        if commit:
+            self.session.commit()
+
+    def set_mtime(self, asset_type: str, path: str, mtime_ns: int, commit: bool = True):
+        '''Update the modification time of a file of which the content didn't change'''
+        self.session.execute(update(SourceFile).where(SourceFile.asset_type == asset_type, SourceFile.path == path).values(mtime_ns=mtime_ns))
+        if commit:
+            self.session.commit()
+
+    def delete_paths(self, asset_type: str, paths: List[str], commit: bool = True):
+        for chunk_start in range(0, len(paths), self.BULK_CHUNK_SIZE):
+            stmt = delete(SourceFile).where(SourceFile.asset_type == asset_type, SourceFile.path.in_(paths[chunk_start:chunk_start + self.BULK_CHUNK_SIZE]))
+            self.session.execute(stmt)
+        if commit:
+            self.session.commit()
+
+    def delete_device_type(self, device_type: DeviceType):
+        stmt = delete(SourceFile).where(SourceFile.device_type.is_(device_type))
+        self.session.execute(stmt)
+        self.session.commit()
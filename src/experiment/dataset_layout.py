@@ -0,0 +1,47 @@
+from pathlib import Path
+from typing import Iterator, List, Optional
+from urllib.parse import quote, unquote
+
+'''
+Layout of the converted (parquet) input data. It mirrors the directory structure of the csv input data,
+but the files of a directory are partitioned by group in sub directories named 'group=<group>'.
+'''
+
+PARTITION_PREFIX = 'group='
+
+
+def partition_dir(base_dir: Path, group: str) -> Path:
+    return base_dir / (PARTITION_PREFIX + quote(group, safe='+-_.'))
+
+
+def partition_group(path: Path) -> Optional[str]:
+    '''Return the group of a partition directory, or None if the path is not a partition directory'''
+    if path.is_dir() and path.name.startswith(PARTITION_PREFIX):
+        return unquote(path.name.removeprefix(PARTITION_PREFIX))
+    return None
+
+
+def is_partitioned(base_dir: Path) -> bool:
+    return any(partition_group(p) is not None for p in base_dir.iterdir())
+
+
+def iter_files(base_dir: Path, groups: List[str] = []) -> Iterator[Path]:
+    '''
+    Iterate the files in a directory and its partitions. If groups are given, only the partitions of those groups are visited.
+    '''
+    for path in base_dir.iterdir():
+        group = partition_group(path)
+        if group is None:
+            if path.is_file():
+                yield path
+        elif len(groups) == 0 or group in groups:
+            yield from (p for p in path.iterdir() if p.is_file())
+
+
+def find_file(base_dir: Path, group: str, stem: str, suffixes: List[str]) -> Path:
+    '''
+    Return the first existing file with the stem and one of the suffixes, either directly in the directory or in the partition of the group.
+    If none exists, the path of the last option is returned.
+    '''
+    candidates = [base_dir / (stem + s) for s in suffixes] + [partition_dir(base_dir, group) / (stem + s) for s in suffixes]
+    return next((c for c in candidates if c.exists()), candidates[-1])
@@ -1,41 +1,62 @@
 from datetime import datetime, timedelta
+from typing import Union
 
+import numpy as np
 import pandas as pd
 
 from .experiment_description import ExperimentDescription
+from .profile_array import ProfileArray
 
 
 class Experiment:
     """
     Experiment class that contains data of baseline and shifted power profiles and calculates the flex metric.
     The expirement class only concerns data in the congestion period.
+
+    The profiles are stored as float32 arrays (see ProfileArray) and PTU are referred to by their offset,
+    the DataFrame and Series getters are views that are created on request.
     """
 
+    __slots__ = ('exp_des', 'ptu_duration', '__baseline', '__shifted', '__congestion_offset', '__mean_weighted_flex_metric')
+
 
-    def __init__(self, baseline: pd.DataFrame, shifted: pd.DataFrame, experiment_description: ExperimentDescription) -> None:
+    def __init__(self, baseline: Union[pd.DataFrame, ProfileArray], shifted: Union[pd.DataFrame, ProfileArray], experiment_description: ExperimentDescription) -> None:
         """
         Args:
-            baseline: pandas dataframe with the baseline profiles of a experiment.
-            shifted: pandas dataframe of a experiment's shifted profiles.
+            baseline: baseline profiles of a experiment. Pass a ProfileArray to share it between experiments.
+            shifted: a experiment's shifted profiles.
         """
 
         self.exp_des = experiment_description
-        self.ptu_duration: timedelta = baseline.index[1] - baseline.index[0]
+        self.__baseline = baseline if isinstance(baseline, ProfileArray) else ProfileArray.from_frame(baseline)
+        self.ptu_duration: timedelta = self.__baseline.ptu_duration
         congestion_end = self.exp_des.congestion_start + (self.exp_des.congestion_duration - 1) * self.ptu_duration
-        self.__baseline = baseline
+        if not isinstance(shifted, ProfileArray):
+            shifted = ProfileArray.from_frame(shifted, self.__baseline.columns)
+        self.__shifted = shifted.slice_time(self.exp_des.congestion_start, congestion_end)
+        self.__congestion_offset = self.__baseline.offset(self.exp_des.congestion_start)
 
-        self.__shifted = shifted[self.exp_des.congestion_start: congestion_end]
-        mean_baseline = self.__baseline[self.exp_des.congestion_start : congestion_end].mean(axis=1)
-        self.__mean_weighted_flex_metric: pd.Series = (mean_baseline - self.__shifted.mean(axis=1)) / mean_baseline
+        baseline_values = self.__baseline.values[self.__congestion_offset : self.__baseline.offset(congestion_end, side='right')]
+        if len(baseline_values) != len(self.__shifted):
+            raise AssertionError(f"Baseline and shifted profiles of experiment '{self.exp_des.name}' don't cover the same congestion period")
+        mean_baseline = np.nanmean(baseline_values, axis=1, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.__mean_weighted_flex_metric: np.ndarray = (mean_baseline - np.nanmean(self.__shifted.values, axis=1, dtype=np.float64)) / mean_baseline
+        self.__mean_weighted_flex_metric.flags.writeable = False
 
 
     def get_congestion_start(self) -> datetime:
         return self.exp_des.congestion_start
 
 
+    def get_congestion_offset(self) -> int:
+        """Return the PTU offset of the congestion start in the baseline profiles"""
+        return self.__congestion_offset
+
+
     def get_congestion_duration(self) -> int:
         return self.exp_des.congestion_duration
-    
+
 
     def get_flexwindow_duration(self) -> int:
         return self.exp_des.flexwindow_duration
@@ -43,35 +64,46 @@ class Experiment:
 
     def get_group(self) -> str:
         return self.exp_des.group
-    
-    
+
+
     def get_weighted_mean_flex_metrics(self) -> pd.Series:
+        return pd.Series(self.__mean_weighted_flex_metric, index=self.__shifted.index(), copy=False)
+
+
+    def get_weighted_mean_flex_metrics_array(self) -> np.ndarray:
+        """Return the (read-only) flex metric per PTU of the congestion period"""
         return self.__mean_weighted_flex_metric
-    
+
 
     def get_weighted_mean_flex_metric(self, ptu: int) -> float :
-        return self.__mean_weighted_flex_metric[self.exp_des.congestion_start + self.ptu_duration * ptu]
+        return self.__mean_weighted_flex_metric[ptu]
 
 
     def get_baseline_profiles(self) -> pd.DataFrame:
         """Return the baseline power for all PTU of all devices"""
-        return self.__baseline
+        return self.__baseline.to_frame()
+
+
+    def get_mean_baseline(self) -> np.ndarray:
+        """Return the mean baseline power of the devices for all PTU"""
+        return np.nanmean(self.__baseline.values, axis=1, dtype=np.float64)
+
 
     def get_baseline(self, ptu: int) -> pd.Series:
         """Return the baseline power of all devices"""
-        return self.__baseline.iloc[ptu]
+        return self.__baseline.row(ptu)
+
 
-    
     def get_shifted(self, ptu: int) -> pd.Series:
         """Return the power after flex optimalization of all devices"""
-        return self.__shifted.iloc[ptu]
-    
+        return self.__shifted.row(ptu)
+
 
     def get_shifted_profiles(self) -> pd.DataFrame:
         """Return the baseline power for all PTU of all devices"""
-        return self.__shifted
+        return self.__shifted.to_frame()
 
 
     def get_num_active_baseline_devices(self, ptu: int) -> int:
-        mask = self.__baseline.iloc[ptu] != 0.0
-        return self.__baseline.iloc[ptu][mask.values].count()
+        row = self.__baseline.values[ptu]
+        return int(np.count_nonzero((row != 0.0) & ~np.isnan(row)))
@@ -1,83 +1,94 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
 
 from .experiment import Experiment
 from .experiment_filter import ExperimentFilter
+from .experiment_table import ExperimentTable, group_positions
 
 
 class ExperimentContainer():
+    '''
+    The filter and flex metric methods work on a columnar table of the experiments (see ExperimentTable),
+    which is created on first use.
+    '''
 
     def __init__(self, experiments : Dict[str, Experiment]) -> None:
         self.exp = experiments
+        self.__table: Optional[ExperimentTable] = None
+
+
+    def get_table(self) -> ExperimentTable:
+        if self.__table is None:
+            self.__table = ExperimentTable.from_experiments(self.exp)
+        return self.__table
 
 
     def filter(self, filter: ExperimentFilter) -> ExperimentContainer:
-        filtered_experiments = {k: v for k, v in self.exp.items() if filter.pass_filter(v.exp_des)}
-        return ExperimentContainer(filtered_experiments)           
+        mask = self.get_table().mask(filter)
+        filtered = ExperimentContainer({k: self.exp[k] for k in self.get_table().keys[mask]})
+        filtered.__table = self.get_table().take(mask)
+        return filtered
 
 
     def get_mean_flex_per_duration(self) -> Dict[int, List[float]]:
-        data: Dict[int, List[float] ] = {}
-        for exp in self.exp.values():
-            flex_metrics = data.setdefault(exp.get_congestion_duration(), [])
-            flex_metrics.extend(exp.get_weighted_mean_flex_metrics().to_numpy())
-        return dict(sorted(data.items()))
-    
+        return self.__group_flex(self.get_table().per_flex_metric('duration'), int)
+
 
     def get_mean_flex_per_duration_per_ptu(self) -> Dict[int, Dict[int, List[float]]]:
-        data: Dict[int, Dict[int, float] ] = {}
-        for exp in self.exp.values():
-            flex_metrics_per_duration = data.setdefault(exp.get_congestion_duration(), {})
-            for ptu in range(exp.get_congestion_duration()):
-                flex_metrics = flex_metrics_per_duration.setdefault(ptu, [])
-                flex_metrics.append(exp.get_weighted_mean_flex_metric(ptu))
-        return dict(sorted(data.items()))
+        return self.__group_flex_per_ptu(self.get_table().per_flex_metric('duration'), int)
 
 
     def get_mean_flex_per_congestion_start(self) -> Dict[datetime, List[float]]:
-        data: Dict[datetime, List[float] ] = {}
-        for exp in self.exp.values():
-            flex_metrics = data.setdefault(exp.get_congestion_start(), [])
-            flex_metrics.extend(exp.get_weighted_mean_flex_metrics().to_numpy())
-        return dict(sorted(data.items()))
-    
+        return self.__group_flex(self.get_table().per_flex_metric('cong_start').view(np.int64), _to_datetime)
+
 
     def get_mean_flex_per_congestion_start_per_ptu(self) -> Dict[datetime, Dict[int, List[float]]]:
-        data: Dict[datetime, Dict[int, List[float]]] = {}
-        for exp in self.exp.values():
-            flex_metrics_per_cong_start = data.setdefault(exp.get_congestion_start(), {})
-            for ptu in range(exp.get_congestion_duration()):
-                flex_metrics = flex_metrics_per_cong_start.setdefault(ptu, [])
-                flex_metrics.append(exp.get_weighted_mean_flex_metric(ptu))
-        return dict(sorted(data.items()))
-    
-    
+        return self.__group_flex_per_ptu(self.get_table().per_flex_metric('cong_start').view(np.int64), _to_datetime)
+
+
     def get_mean_flex_per_group(self) -> Dict[str, List[float]]:
-        data: Dict[str, List[float] ] = {}
-        for exp in self.exp.values():
-            flex_metrics = data.setdefault(exp.exp_des.group, [])
-            flex_metrics.extend(exp.get_weighted_mean_flex_metrics().to_numpy())
-        return data
-    
+        groups = self.get_table().metadata['group'].cat
+        codes = np.repeat(groups.codes.to_numpy(), self.get_table().lengths())
+        return self.__group_flex(codes, lambda code: groups.categories[code], sort=False)
+
 
     def get_mean_flex(self) -> List[float]:
-        data: List[float] = []
-        for exp in self.exp.values():
-            data.extend(exp.get_weighted_mean_flex_metrics().to_numpy())
-        return data
-    
+        return self.get_table().flex_metrics.tolist()
+
 
     def get_mean_flex_for_time_of_day(self) -> Dict[datetime, List[float]]:
-        data : Dict[datetime, List[float]] = {}
-        for exp in self.exp.values():
-            metric_per_ptu = exp.get_weighted_mean_flex_metrics().to_numpy()
-            for i in range(exp.get_congestion_duration()):
-                l = data.setdefault(exp.get_congestion_start() + exp.ptu_duration * i, [])
-                l.append(metric_per_ptu[i])
-        return data
-    
-    
+        table = self.get_table()
+        time_of_day = table.per_flex_metric('cong_start').view(np.int64) + table.ptus() * table.per_flex_metric('ptu_duration').view(np.int64)
+        return self.__group_flex(time_of_day, _to_datetime, sort=False)
+
+
     def get_groups(self) -> List[str]:
-        return list((set(map(lambda e: e.exp_des.group, self.exp.values()))))
\ No newline at end of file
+        return list((set(map(lambda e: e.exp_des.group, self.exp.values()))))
+
+
+    def __group_flex(self, keys: np.ndarray, to_key: Callable, sort: bool = True) -> Dict:
+        flex_metrics = self.get_table().flex_metrics
+        unique, positions = group_positions(keys, sort)
+        return {to_key(k): flex_metrics[p].tolist() for k, p in zip(unique, positions)}
+
+
+    def __group_flex_per_ptu(self, keys: np.ndarray, to_key: Callable) -> Dict:
+        flex_metrics = self.get_table().flex_metrics
+        ptus = self.get_table().ptus()
+        unique_keys, key_codes = np.unique(keys, return_inverse=True)
+        # Group by (key, ptu) at once, sorting the combined code sorts by key first and ptu second
+        num_ptus = ptus.max(initial=0) + 1
+        converted_keys = [to_key(k) for k in unique_keys]
+        data = {k: {} for k in converted_keys}
+        for code, p in zip(*group_positions(key_codes * num_ptus + ptus)):
+            data[converted_keys[code // num_ptus]][int(code % num_ptus)] = flex_metrics[p].tolist()
+        return data
+
+
+def _to_datetime(ns: np.int64) -> datetime:
+    return pd.Timestamp(ns).to_pydatetime()
@@ -1,9 +1,10 @@
 from dataclasses import dataclass
 from enum import Enum
+from functools import lru_cache
 import re
+from typing import NamedTuple, Optional
 
 from datetime import datetime, timedelta
-from dateutil import parser
 
 from experiment.device_type import DeviceType
 
@@ -14,6 +15,16 @@ class DataSource(Enum):
     ELAAD_AGG=2
 
 
+class _NameFields(NamedTuple):
+    '''The fields of an ExperimentDescription that only depend on the experiment name'''
+    group: str
+    flexwindow_duration: Optional[int]
+    flexwindow_start: Optional[datetime]
+    congestion_start: datetime
+    congestion_duration: int
+    data_source: DataSource
+
+
 @dataclass(init=False)
 class ExperimentDescription():
     name: str
@@ -25,49 +36,108 @@ class ExperimentDescription():
     congestion_duration: int
     __data_source: DataSource
 
-    __ev_regex_v1 =r"pc4\d{4}_flexwindowduration\d*_congestionstart[^_]*_congestionduration\d*$"
-    __ev_regex_v2 = r"pc4\d{4}_flexwindowstart\d{4}-\d{2}-\d{2}T\d{4}_flexwindowduration\d*_congestionstart[^_]*_congestionduration\d*$"
-    __ev_regex_elaad = r".*-\d{1,2}-\d{4}-\d{1,2}-\d-\d{1,2}(_\d{1,2})?-(none|st-\d{1,2}-\d{4}-\d{4})-\d*-(week|wknd)"
-    __hp_regex = r".*_flexwindowstart\d{4}-\d{2}-\d{2}T\d{4}_flexwindowduration\d*_congestionstart[^_]*_congestionduration\d*$"
+    __ev_regex_v1 = r"pc4(?P<v1_group>\d{4})_flexwindowduration(?P<v1_flexwindow_duration>\d*)_congestionstart(?P<v1_congestion_start>[^_]*)_congestionduration(?P<v1_congestion_duration>\d*)"
+    __ev_regex_v2 = r"pc4(?P<v2_group>\d{4})_flexwindowstart(?P<v2_flexwindow_start>\d{4}-\d{2}-\d{2}T\d{4})_flexwindowduration(?P<v2_flexwindow_duration>\d*)_congestionstart(?P<v2_congestion_start>[^_]*)_congestionduration(?P<v2_congestion_duration>\d*)"
+    __hp_regex = r"(?P<hp_group>.*)_flexwindowstart(?P<hp_flexwindow_start>\d{4}-\d{2}-\d{2}T\d{4})_flexwindowduration(?P<hp_flexwindow_duration>\d*)_congestionstart(?P<hp_congestion_start>[^_]*)_congestionduration(?P<hp_congestion_duration>\d*)"
+    # public-med-50-2030-11-2-17_25-st-4-1600-1700-20-week, baselines have 'none' instead of the congestion period
+    __ev_regex_elaad = r"(?P<elaad_prefix>.*)-\d{1,2}-(?P<elaad_year>\d{4})-\d{1,2}-\d-\d{1,2}(?:_\d{1,2})?-(?:none|st-\d{1,2}-(?P<elaad_congestion_start>\d{4})-(?P<elaad_congestion_end>\d{4}))-\d*-(?:week|wknd)"
+    # One pass over the name. A v2 name also matches the HP pattern, so v2 is tried first (the other patterns exclude each other).
+    __name_regex = re.compile(f"(?P<v1>{__ev_regex_v1})|(?P<v2>{__ev_regex_v2})|(?P<hp>{__hp_regex})|(?P<elaad>{__ev_regex_elaad})")
+    __dt_fmt = "%Y-%m-%dT%H%M"
 
     @staticmethod
     def validate_name(exp_name: str) -> bool:
-        v1_match = bool(re.fullmatch(ExperimentDescription.__ev_regex_v1, exp_name))
-        v2_match = bool(re.fullmatch(ExperimentDescription.__ev_regex_v2, exp_name))
-        hp_match = bool(re.fullmatch(ExperimentDescription.__hp_regex, exp_name))
-        elaad_match = bool(re.fullmatch(ExperimentDescription.__ev_regex_elaad, exp_name))
-        return v1_match or v2_match or hp_match or elaad_match
+        return ExperimentDescription.__name_regex.fullmatch(exp_name) is not None
+
+    @staticmethod
+    def elaad_baseline_group(baseline_name: str) -> Optional[str]:
+        '''Return the group of an Elaad baseline (file) name, which has 'none' instead of the congestion period, or None for other names'''
+        match = ExperimentDescription.__name_regex.fullmatch(baseline_name)
+        if match is None or match['elaad'] is None or match['elaad_congestion_start'] is not None:
+            return None
+        return ExperimentDescription.__elaad_group(match)
+
+    @staticmethod
+    def parse(experiment_name: str, device_type: DeviceType) -> 'ExperimentDescription':
+        '''
+        Same as the constructor, but the fields of a name are parsed once and reused by later calls with the name, for
+        directory scans that describe the same files more than once. Every call returns a new description.
+        '''
+        description = ExperimentDescription.try_parse(experiment_name, device_type)
+        if description is None:
+            raise AssertionError(f"Invalid experiment (file) name '{experiment_name}'")
+        return description
+
+    @staticmethod
+    def try_parse(experiment_name: str, device_type: DeviceType) -> Optional['ExperimentDescription']:
+        '''
+        Same as parse, but returns None for a name that isn't an experiment name, instead of validating the name first.
+        Names that aren't experiment names are also matched only once.
+        '''
+        fields = ExperimentDescription.__parse_name_memoized(experiment_name)
+        if fields is None:
+            return None
+        description = object.__new__(ExperimentDescription)
+        description.__set_fields(experiment_name, device_type, fields)
+        return description
 
     def __init__(self, experiment_name: str, device_type: DeviceType) -> None:
-        if not ExperimentDescription.validate_name(experiment_name):
+        fields = ExperimentDescription.__parse_name(experiment_name)
+        if fields is None:
             raise AssertionError(f"Invalid experiment (file) name '{experiment_name}'")
+        self.__set_fields(experiment_name, device_type, fields)
+
+    def __set_fields(self, experiment_name: str, device_type: DeviceType, fields: _NameFields) -> None:
         self.name = experiment_name
         self.device_type = device_type
-        if re.fullmatch(ExperimentDescription.__ev_regex_elaad, experiment_name):
-            self.flexwindow_duration = None
-            self.flexwindow_start = None
-            # public-med-50-2030-11-2-17_25-st-4-1600-1700-20-week.csv
-            self.congestion_start = datetime.strptime(experiment_name.split('-')[9], "%H%M")
-            cong_end = datetime.strptime(experiment_name.split('-')[10], "%H%M")
+        self.group = fields.group
+        self.flexwindow_duration = fields.flexwindow_duration
+        self.flexwindow_start: datetime = fields.flexwindow_start
+        self.congestion_start = fields.congestion_start
+        self.congestion_duration = fields.congestion_duration
+        self.__data_source = fields.data_source
+        self.typical_day = self.determine_typical_day()
+
+    @staticmethod
+    @lru_cache(maxsize=2**17)
+    def __parse_name_memoized(experiment_name: str) -> Optional[_NameFields]:
+        # The fields are immutable values, so the descriptions of a name can share them
+        return ExperimentDescription.__parse_name(experiment_name)
+
+    @staticmethod
+    def __parse_name(experiment_name: str) -> Optional[_NameFields]:
+        '''Returns None if the name isn't an experiment name'''
+        match = ExperimentDescription.__name_regex.fullmatch(experiment_name)
+        if match is None:
+            return None
+        if match['elaad'] is not None:
+            if match['elaad_congestion_start'] is None:
+                raise AssertionError(f"Experiment (file) name '{experiment_name}' has no congestion period")
+            congestion_start = datetime.strptime(match['elaad_congestion_start'], "%H%M")
+            cong_end = datetime.strptime(match['elaad_congestion_end'], "%H%M")
             # TODO: get rid of hardcoded 15 minutes
-            self.congestion_duration = int((cong_end - self.congestion_start) / timedelta(minutes=15))
-            self.group = re.match(r"^\w+-\w+", experiment_name).group() + f"-{experiment_name.split('-')[3]}"
+            congestion_duration = int((cong_end - congestion_start) / timedelta(minutes=15))
             # TODO: how to differentiate for other Elaad data?
-            self.__data_source = DataSource.ELAAD_AGG
+            return _NameFields(ExperimentDescription.__elaad_group(match), None, None, congestion_start, congestion_duration, DataSource.ELAAD_AGG)
+        pattern = match.lastgroup
+        congestion_start = ExperimentDescription.__parse_datetime(match[f'{pattern}_congestion_start'], experiment_name)
+        if pattern == 'v1':
+            flexwindow_start = congestion_start - timedelta(hours=6)
         else:
-            self.__data_source = DataSource.GO_E
-            self.flexwindow_duration = int(re.findall("flexwindowduration\d*", experiment_name)[0].removeprefix("flexwindowduration"))
-            self.congestion_start = parser.parse(re.findall("congestionstart\d{4}-\d{2}-\d{2}T\d{4}", experiment_name)[0].removeprefix("congestionstart"))
-            self.congestion_duration = int(re.findall("congestionduration\d*", experiment_name)[0].removeprefix("congestionduration"))
-            if re.fullmatch(ExperimentDescription.__ev_regex_v1, experiment_name):
-                self.group = re.findall("pc4\d{4}", experiment_name)[0].removeprefix('pc4')
-                self.flexwindow_start = self.congestion_start - timedelta(hours=6)
-            elif re.fullmatch(ExperimentDescription.__ev_regex_v2, experiment_name):
-                self.group = re.findall("pc4\d{4}", experiment_name)[0].removeprefix('pc4')
-                self.flexwindow_start: datetime = parser.parse(re.findall("flexwindowstart\d{4}-\d{2}-\d{2}T\d{4}", experiment_name)[0].removeprefix("flexwindowstart"))
-            elif re.fullmatch(ExperimentDescription.__hp_regex, experiment_name):
-                self.group = re.findall(".*_flexwindowstart", experiment_name)[0].removesuffix('_flexwindowstart')
-        self.typical_day = self.determine_typical_day()
+            flexwindow_start = ExperimentDescription.__parse_datetime(match[f'{pattern}_flexwindow_start'], experiment_name)
+        return _NameFields(match[f'{pattern}_group'], int(match[f'{pattern}_flexwindow_duration']), flexwindow_start, congestion_start,
+                           int(match[f'{pattern}_congestion_duration']), DataSource.GO_E)
+
+    @staticmethod
+    def __elaad_group(match: re.Match) -> str:
+        return f"{match['elaad_prefix']}-{match['elaad_year']}"
+
+    @staticmethod
+    def __parse_datetime(value: str, experiment_name: str) -> datetime:
+        try:
+            return datetime.strptime(value, ExperimentDescription.__dt_fmt)
+        except ValueError:
+            raise AssertionError(f"Invalid date and time '{value}' in experiment (file) name '{experiment_name}'")
 
     def determine_typical_day(self) -> str:
         if self.device_type == DeviceType.EV and self.__data_source == DataSource.GO_E:
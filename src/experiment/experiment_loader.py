@@ -1,18 +1,28 @@
 
+from __future__ import annotations
+
 from abc import ABC, abstractmethod
-from datetime import datetime, time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
 from pathlib import Path, PurePath
+from time import perf_counter
 from time import time as time_s
-from typing import List
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Set, Tuple
 
 import pandas as pd
 
 from experiment.device_type import DeviceType
 
+from .dataset_layout import find_file, iter_files, partition_group
 from .experiment import Experiment
 from .experiment_container import ExperimentContainer
 from .experiment_description import DataSource, ExperimentDescription
 from .experiment_filter import ExperimentFilter
+from .profile_array import ProfileArray
+from .windowed_reader import read_csv_rows, read_parquet_window
 
 
 class ExperimentLoader():
@@ -37,41 +47,165 @@ class ExperimentLoader():
         else:
             raise AssertionError(f"No support for loading files of source {data_source}")
 
-    def load_experiments(self, experiment_filter: ExperimentFilter = ExperimentFilter()) -> ExperimentContainer:
-        loaded_experiments = {}
-        missing_baseline = False
+    def load_experiments(self, experiment_filter: ExperimentFilter = ExperimentFilter(), workers: int = 1) -> ExperimentContainer:
+        '''
+        Args:
+            workers: amount of processes that parse the experiment files in parallel.
+        '''
+        return ExperimentContainer({e.exp_des.name: e for e in self.iter_experiments(experiment_filter, workers)})
+
+    def iter_experiments(self, experiment_filter: ExperimentFilter = ExperimentFilter(), workers: int = 1, max_in_flight: int = 1000) -> Iterator[Experiment]:
+        '''
+        Load the experiments one at a time, so that the consumer can process and drop them without holding all experiments in memory.
+        Raises an AssertionError before any experiment is loaded if any experiment misses its baseline.
+
+        Args:
+            workers: amount of processes that parse the experiment files in parallel.
+            max_in_flight: maximum amount of experiments that are loaded ahead of the consumer.
+        '''
         device_type = self.file_loader.get_device_type()
         print("Loading experiments from files...")
+        # Partitions of groups that don't pass the filter are not visited
+        all_experiments = [(d, p) for p in iter_files(self.file_loader.shifted_dir, experiment_filter.groups) if (d := ExperimentDescription.try_parse(p.stem, device_type)) is not None]
+        to_load = [(d, p) for d, p in all_experiments if experiment_filter.pass_filter(d)]
+        # Fast fail approach:
+        self.__check_baselines([d for d, _ in to_load])
+        return self.__load(to_load, len(all_experiments), workers, max_in_flight)
+
+    def __check_baselines(self, descriptions: List[ExperimentDescription]) -> None:
+        baselines: Dict[Tuple[str, str], Path] = {}
+        missing = []
+        for d in descriptions:
+            key = (d.group, d.get_baseline_file_name())
+            if key not in baselines:
+                baselines[key] = self.file_loader.find_baseline(d)
+            if not baselines[key].exists():
+                missing.append(d.name)
+                print(f"ERROR: Experiment '{d.name}' doesn't have a baseline input data file '{baselines[key]}'")
+        if missing:
+            raise AssertionError(f"{len(missing)} experiments don't have a baseline input data file")
+
+    def __load(self, to_load: List[Tuple[ExperimentDescription, Path]], cnt_experiments: int, workers: int, max_in_flight: int) -> Iterator[Experiment]:
+        cnt_loaded = 0
         t = time_s()
-        all_experiments: List[Path] = list(filter(lambda e: ExperimentDescription.validate_name(e.stem), self.file_loader.shifted_dir.iterdir()))
-
-        for cnt_checked, exp_path in enumerate(all_experiments):
-            description = ExperimentDescription(exp_path.stem, device_type)
-            if cnt_checked > 0 and cnt_checked % int(max(len(all_experiments),10) / 10) == 0:
-                print(f"Loaded {len(loaded_experiments)} / {cnt_checked} experiments.")
-            if experiment_filter.pass_filter(description):
-                try:
-                    loaded_experiments[description.name] = self.file_loader.load_experiment(description, exp_path)
-                except FileNotFoundError as e:
-                    missing_baseline = True
-                    print("ERROR: Experiment '" + e.filename + "' doesn't have a baseline input data file")
+        baseline_stats = BaselineCacheStats()
 
-        # Fast fail approach:
-        if missing_baseline : exit(1)
-        print(f"Experiments loaded successfully. Loaded {len(loaded_experiments)} / {cnt_checked + 1} experiments in {round(time_s() - t)} seconds.")
-        return ExperimentContainer(loaded_experiments)
+        self.file_loader.baseline_cache.clear()
+        try:
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(self.file_loader,)) if workers > 1 else nullcontext() as pool:
+                if not pool:
+                    _init_worker(self.file_loader)
+                # Results are collected per chunk, a consumer that is slower than the workers doesn't pile up loaded experiments
+                for chunk_start in range(0, len(to_load), max_in_flight):
+                    chunk = to_load[chunk_start:chunk_start + max_in_flight]
+                    chunk_descriptions = [d for d, _ in chunk]
+                    chunk_paths = [p for _, p in chunk]
+                    if pool:
+                        results = pool.map(_load_experiment, chunk_descriptions, chunk_paths, chunksize=max(1, len(chunk) // (workers * 8)))
+                    else:
+                        results = map(_load_experiment, chunk_descriptions, chunk_paths)
+                    for cnt_done, (description, experiment, missing_file, stats) in enumerate(results, chunk_start):
+                        baseline_stats.add(stats)
+                        if cnt_done > 0 and cnt_done % int(max(len(to_load),10) / 10) == 0:
+                            print(f"Loaded {cnt_loaded} / {cnt_done} experiments.")
+                        if missing_file:
+                            # The file was removed after the baselines were checked
+                            raise AssertionError(f"Experiment '{description.name}' doesn't have a baseline input data file '{missing_file}'")
+                        cnt_loaded += 1
+                        yield experiment
+        finally:
+            self.file_loader.baseline_cache.clear()
+
+        print(f"Experiments loaded successfully. Loaded {cnt_loaded} / {cnt_experiments} experiments in {round(time_s() - t)} seconds.")
+        print(f"Parsed {baseline_stats.files_parsed} baselines in {baseline_stats.parse_time_s:.1f} seconds, {baseline_stats.hits} times a parsed baseline was reused.")
+
+    def get_groups(self) -> Set[str]:
+        '''Return the groups of all experiments in the shifted directory'''
+        device_type = self.file_loader.get_device_type()
+        groups = set()
+        for path in self.file_loader.shifted_dir.iterdir():
+            group = partition_group(path)
+            if group is not None:
+                groups.add(group)
+            elif (description := ExperimentDescription.try_parse(path.stem, device_type)) is not None:
+                groups.add(description.group)
+        return groups
+
+
+@dataclass
+class BaselineCacheStats():
+    files_parsed: int = 0
+    hits: int = 0
+    parse_time_s: float = 0.0
+
+    def add(self, other: BaselineCacheStats) -> None:
+        self.files_parsed += other.files_parsed
+        self.hits += other.hits
+        self.parse_time_s += other.parse_time_s
+
+    def diff(self, other: BaselineCacheStats) -> BaselineCacheStats:
+        return BaselineCacheStats(self.files_parsed - other.files_parsed, self.hits - other.hits, self.parse_time_s - other.parse_time_s)
+
+    def copy(self) -> BaselineCacheStats:
+        return BaselineCacheStats(self.files_parsed, self.hits, self.parse_time_s)
+
+
+class _BaselineFileCache():
+    '''
+    Parses every baseline (day) only once, many experiments share the same baseline file.
+    The parsed profiles are shared by the experiments of the baseline.
+    The least recently used files are dropped when the parsed files use more than max_bytes of memory.
+    '''
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.stats = BaselineCacheStats()
+        self.__files: OrderedDict[Hashable, ProfileArray] = OrderedDict()
+        self.__bytes = 0
+
+    def get(self, key: Hashable, parse: Callable[[], pd.DataFrame]) -> ProfileArray:
+        if key in self.__files:
+            self.__files.move_to_end(key)
+            self.stats.hits += 1
+            return self.__files[key]
+        t = perf_counter()
+        profiles = ProfileArray.from_frame(parse())
+        self.stats.parse_time_s += perf_counter() - t
+        self.stats.files_parsed += 1
+        self.__files[key] = profiles
+        self.__bytes += profiles.nbytes
+        while self.__bytes > self.max_bytes and len(self.__files) > 1:
+            _, dropped = self.__files.popitem(last=False)
+            self.__bytes -= dropped.nbytes
+        return profiles
+
+    def clear(self) -> None:
+        self.__files.clear()
+        self.__bytes = 0
+
+    def __getstate__(self):
+        # Parsed files are never sent to worker processes
+        return {'max_bytes': self.max_bytes, 'stats': BaselineCacheStats()}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_bytes'])
 
 
 class _DataSourceLoader(ABC):
 
-    def __init__(self, baselines_dir: Path, shifted_dir: Path ) -> None:
+    def __init__(self, baselines_dir: Path, shifted_dir: Path, max_cached_baseline_bytes: int = 2**30) -> None:
         self.baselines_dir = baselines_dir
         self.shifted_dir = shifted_dir
+        self.baseline_cache = _BaselineFileCache(max_cached_baseline_bytes)
 
     @abstractmethod
     def load_experiment(self, description: ExperimentDescription, exp_path: Path) -> Experiment:
         pass
 
+    def find_baseline(self, description: ExperimentDescription) -> Path:
+        '''Return the path of the baseline file of the experiment, the path doesn't exist if the baseline is missing'''
+        return find_file(self.baselines_dir, description.group, description.get_baseline_file_name(), ['.csv', '.parquet'])
+
     @abstractmethod
     def get_device_type(self) -> DeviceType:
         pass
@@ -80,21 +214,30 @@ class _DataSourceLoader(ABC):
 class _Go_eLoader(_DataSourceLoader):
   
     def load_experiment(self, description: ExperimentDescription, exp_path: Path) -> Experiment:
-        baseline = (self.baselines_dir / description.get_baseline_file_name()).with_suffix('.csv')
-        if not baseline.exists():
-            baseline = (self.baselines_dir / description.get_baseline_file_name()).with_suffix('.parquet')
+        baseline = self.find_baseline(description)
         df_shifted = self.__load_file(exp_path)
-        df_baseline: pd.DataFrame = self.__load_file(baseline)
-        day = description.congestion_start.date()
-        idx = df_baseline.index.get_loc(datetime.combine(day, time()))
-        return Experiment(df_baseline.iloc[idx:idx+96], df_shifted, description)
+        day_start = datetime.combine(description.congestion_start.date(), time())
+        baseline_profiles = self.baseline_cache.get((baseline.resolve(), day_start), lambda: self.__load_day(baseline, day_start))
+        return Experiment(baseline_profiles, df_shifted, description)
     
     def get_device_type(self) -> DeviceType:
         return DeviceType.from_string(PurePath(self.shifted_dir).parts[-2])
 
+    def __load_day(self, path: Path, day_start: datetime) -> pd.DataFrame:
+        '''Only parse the 96 PTU of the day starting at day_start'''
+        if path.suffix == '.csv':
+            df = read_csv_rows(path, day_start, 96, sep=';', decimal=',')
+        elif path.suffix == '.parquet':
+            df = read_parquet_window(path, day_start, day_start + timedelta(days=1)).iloc[:96]
+        else:
+            print(f"Warning: cannot load file: {path}")
+            return None
+        if len(df.index) == 0 or df.index[0] != day_start:
+            raise KeyError(f"Baseline file '{path}' has no data for {day_start}")
+        return df
+
     def __load_file(self, path: Path) -> pd.DataFrame:
         if path.suffix == '.csv':
-            # Consider using skiprows and nrows to only create dataframe for the congestion period.
             return pd.read_csv(path, sep=';', decimal=',', index_col=0, parse_dates=True)
         if path.suffix == '.parquet':
             return pd.read_parquet(path)
@@ -105,8 +248,8 @@ class _Go_eLoader(_DataSourceLoader):
 class _ElaadAggLoader(_DataSourceLoader):
 
     def load_experiment(self, description: ExperimentDescription, exp_path: Path) -> Experiment:
-        baseline_path = (self.baselines_dir / description.get_baseline_file_name()).with_suffix('.csv')
-        baseline = self.__read_file(baseline_path)
+        baseline_path = self.find_baseline(description)
+        baseline = self.baseline_cache.get(baseline_path.resolve(), lambda: self.__read_file(baseline_path))
         df_shifted = self.__read_file(exp_path)
         return Experiment(baseline, df_shifted, description)
 
@@ -116,4 +259,30 @@ class _ElaadAggLoader(_DataSourceLoader):
     def __read_file(self, path: Path) -> pd.DataFrame:
         amout_charging_points = int(path.stem.split('-')[2])
         assert(amout_charging_points > 0 and amout_charging_points < 10000)
+        if path.suffix == '.parquet':
+            return pd.read_parquet(path, columns=['Average']) / amout_charging_points * 1000
         return pd.read_csv(path, sep=',', header=0, index_col=0, parse_dates=True, date_format='%H:%M')[['Average']] / amout_charging_points * 1000
+
+
+_worker_file_loader: _DataSourceLoader = None
+
+
+def _init_worker(file_loader: _DataSourceLoader) -> None:
+    '''
+    Set the file loader of the (worker) process, so that its baseline cache lives as long as the process.
+    '''
+    global _worker_file_loader
+    _worker_file_loader = file_loader
+
+
+def _load_experiment(description: ExperimentDescription, exp_path: Path) -> Tuple[ExperimentDescription, Optional[Experiment], Optional[str], BaselineCacheStats]:
+    '''
+    Load one experiment. A missing file is returned instead of raised, so that all missing baselines can be reported.
+    This is a module level function, so that it can be used in worker processes.
+    '''
+    stats_before = _worker_file_loader.baseline_cache.stats.copy()
+    try:
+        experiment, missing_file = _worker_file_loader.load_experiment(description, exp_path), None
+    except FileNotFoundError as e:
+        experiment, missing_file = None, str(e.filename)
+    return description, experiment, missing_file, _worker_file_loader.baseline_cache.stats.diff(stats_before)
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .experiment import Experiment
+from .experiment_filter import ExperimentFilter
+
+'''
+Columnar representation of the experiments of a container, to filter and group the flex metrics of many experiments at once.
+'''
+
+
+class ExperimentTable():
+    '''
+    One metadata row per experiment and the flex metrics of all experiments in one (ragged) array.
+    The flex metrics of experiment i are flex_metrics[offsets[i]:offsets[i + 1]].
+    '''
+
+    def __init__(self, keys: np.ndarray, metadata: pd.DataFrame, flex_metrics: np.ndarray, offsets: np.ndarray) -> None:
+        '''
+        Args:
+            keys: key of every experiment in the container.
+            metadata: columns group, cong_start, duration, flexwindow, typical_day and ptu_duration.
+        '''
+        self.keys = keys
+        self.metadata = metadata
+        self.flex_metrics = flex_metrics
+        self.offsets = offsets
+
+    @classmethod
+    def from_experiments(cls, experiments: Dict[str, Experiment]) -> ExperimentTable:
+        exps = list(experiments.values())
+        metadata = pd.DataFrame({
+            'group': pd.Categorical([e.exp_des.group for e in exps]),
+            'cong_start': pd.to_datetime(pd.Series([e.exp_des.congestion_start for e in exps], dtype=object)),
+            'duration': np.array([e.exp_des.congestion_duration for e in exps], dtype=np.int64),
+            'flexwindow': pd.array([e.exp_des.flexwindow_duration for e in exps], dtype='Int64'),
+            'typical_day': pd.Categorical([e.exp_des.typical_day for e in exps]),
+            'ptu_duration': pd.to_timedelta(pd.Series([e.ptu_duration for e in exps], dtype=object))})
+        flex_metrics = [e.get_weighted_mean_flex_metrics_array() for e in exps]
+        offsets = np.zeros(len(exps) + 1, dtype=np.int64)
+        np.cumsum([len(f) for f in flex_metrics], out=offsets[1:])
+        values = np.concatenate(flex_metrics) if flex_metrics else np.empty(0)
+        return ExperimentTable(np.array(list(experiments.keys()), dtype=object), metadata, values, offsets)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lengths(self) -> np.ndarray:
+        '''Return the amount of flex metrics (PTU) of every experiment'''
+        return np.diff(self.offsets)
+
+    def mask(self, filter: ExperimentFilter) -> np.ndarray:
+        '''Return which experiments pass the filter, like ExperimentFilter.pass_filter'''
+        mask = np.ones(len(self), dtype=bool)
+        for column, values in [('group', filter.groups), ('flexwindow', filter.flex_window_durations),
+                               ('cong_start', filter.cong_starts), ('duration', filter.cong_durations)]:
+            if len(values) > 0:
+                mask &= self.metadata[column].isin(values).to_numpy(dtype=bool)
+        return mask
+
+    def take(self, mask: np.ndarray) -> ExperimentTable:
+        lengths = self.lengths()[mask]
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.repeat(self.offsets[:-1][mask] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return ExperimentTable(self.keys[mask], self.metadata[mask].reset_index(drop=True), self.flex_metrics[positions], offsets)
+
+    def per_flex_metric(self, column: str) -> np.ndarray:
+        '''Return the value of a metadata column for every flex metric'''
+        return np.repeat(self.metadata[column].to_numpy(), self.lengths())
+
+    def ptus(self) -> np.ndarray:
+        '''Return the PTU (in the congestion period) of every flex metric'''
+        return np.arange(self.offsets[-1]) - np.repeat(self.offsets[:-1], self.lengths())
+
+
+def group_positions(keys: np.ndarray, sort: bool = True) -> Tuple[np.ndarray, List[np.ndarray]]:
+    '''
+    Group the positions of equal keys, positions keep their order within a group.
+    Returns the unique keys and the positions per key, sorted by key or else in order of first appearance.
+    '''
+    unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    positions = np.split(order, np.cumsum(np.bincount(inverse, minlength=len(unique)))[:-1])
+    if not sort:
+        by_appearance = np.argsort(first)
+        return unique[by_appearance], [positions[i] for i in by_appearance]
+    return unique, positions[:len(unique)]
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+'''
+Compact storage of (PTU x device) power profiles. The time axis is stored as a start time and a PTU duration
+instead of an index with a timestamp per row, only irregular time axes keep their index.
+'''
+
+
+class ProfileArray():
+    '''
+    Power profiles as a contiguous, read-only float32 array with one row per PTU and one column per device.
+    '''
+
+    __slots__ = ('values', 'columns', 'start', 'ptu_duration', '__index')
+
+    def __init__(self, values: np.ndarray, columns: pd.Index, start: datetime, ptu_duration: timedelta, index: Optional[pd.DatetimeIndex] = None) -> None:
+        '''
+        Args:
+            values: power per PTU (rows) and device (columns).
+            index: time of every row, only needed if the rows are not exactly ptu_duration apart.
+        '''
+        self.values: np.ndarray = np.ascontiguousarray(values, dtype=np.float32)
+        self.values.flags.writeable = False
+        self.columns = columns
+        self.start = start
+        self.ptu_duration = ptu_duration
+        self.__index = index
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, columns: Optional[pd.Index] = None) -> ProfileArray:
+        '''
+        Args:
+            columns: columns to use instead of those of the frame if they are equal, so that profiles of the same devices share one index.
+        '''
+        if len(df.index) < 2:
+            raise AssertionError("Profiles should contain at least two PTU")
+        ptu_duration = df.index[1] - df.index[0]
+        regular = ((df.index[1:] - df.index[:-1]) == ptu_duration).all()
+        if columns is None or not columns.equals(df.columns):
+            columns = df.columns
+        return ProfileArray(df.to_numpy(dtype=np.float32), columns, df.index[0], ptu_duration, None if regular else df.index)
+
+    def __len__(self) -> int:
+        return self.values.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes
+
+    def index(self) -> pd.DatetimeIndex:
+        if self.__index is not None:
+            return self.__index
+        return pd.date_range(self.start, periods=len(self), freq=self.ptu_duration)
+
+    def time_of(self, ptu: int) -> datetime:
+        if self.__index is not None:
+            return self.__index[ptu]
+        return self.start + ptu * self.ptu_duration
+
+    def offset(self, t: datetime, side: str = 'left') -> int:
+        '''
+        Return the PTU offset at which t would be inserted in the time axis, like np.searchsorted.
+        '''
+        if self.__index is not None:
+            return int(self.__index.searchsorted(t, side=side))
+        ptus, remainder = divmod(t - self.start, self.ptu_duration)
+        if side == 'right' or remainder:
+            ptus += 1
+        return min(max(ptus, 0), len(self))
+
+    def slice_time(self, start: datetime, end: datetime) -> ProfileArray:
+        '''Return a copy of the rows from start up to and including end, the same rows as df[start:end]'''
+        first, stop = self.offset(start), self.offset(end, side='right')
+        index = self.__index[first:stop] if self.__index is not None else None
+        return ProfileArray(self.values[first:stop].copy(), self.columns, self.time_of(first) if first < len(self) else end, self.ptu_duration, index)
+
+    def row(self, ptu: int) -> pd.Series:
+        return pd.Series(self.values[ptu], index=self.columns, name=self.time_of(ptu), copy=False)
+
+    def to_frame(self) -> pd.DataFrame:
+        '''Return a DataFrame view on the (read-only) data'''
+        return pd.DataFrame(self.values, index=self.index(), columns=self.columns, copy=False)
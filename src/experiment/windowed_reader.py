@@ -0,0 +1,77 @@
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO
+
+import pandas as pd
+
+'''
+Read only a window of rows from time series files that are sorted on their first (timestamp) column.
+'''
+
+
+def read_csv_rows(path: Path, start: datetime, nrows: int, sep: str = ';', decimal: str = ',') -> pd.DataFrame:
+    '''
+    Read nrows rows of a csv file, starting at the first row with a timestamp at or after start.
+    The row is located with a binary search on the byte offsets of the file, so only the requested rows are parsed.
+    Falls back to reading the whole file if the timestamps cannot be compared with start.
+    '''
+    with open(path, 'rb') as f:
+        header = f.readline()
+        data_start = f.tell()
+        try:
+            offset = _find_first_line(f, data_start, path.stat().st_size, start, sep.encode())
+        except (ValueError, TypeError):
+            df = pd.read_csv(path, sep=sep, decimal=decimal, index_col=0, parse_dates=True)
+            return df[df.index >= start].iloc[:nrows]
+        f.seek(offset)
+        lines = [f.readline() for _ in range(nrows)]
+    return pd.read_csv(BytesIO(header + b''.join(lines)), sep=sep, decimal=decimal, index_col=0, parse_dates=True)
+
+
+def read_parquet_window(path: Path, start: datetime, end: datetime) -> pd.DataFrame:
+    '''
+    Read the rows of a parquet file with an index in [start, end). Row groups outside the window are not read.
+    '''
+    index_column = _parquet_index_column(path)
+    if index_column is not None:
+        df = pd.read_parquet(path, filters=[(index_column, '>=', pd.Timestamp(start)), (index_column, '<', pd.Timestamp(end))])
+    else:
+        df = pd.read_parquet(path)
+    return df[(df.index >= start) & (df.index < end)]
+
+
+def _parquet_index_column(path: Path) -> str:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+    index_columns = (pq.read_schema(path).pandas_metadata or {}).get('index_columns', [])
+    # A RangeIndex is stored as metadata instead of as a column
+    return index_columns[0] if len(index_columns) == 1 and isinstance(index_columns[0], str) else None
+
+
+def _find_first_line(f: BinaryIO, data_start: int, size: int, start: datetime, sep: bytes) -> int:
+    '''Return the byte offset of the first line with a timestamp at or after start'''
+    lo, hi = data_start, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        line_start = _next_line_start(f, data_start, mid)
+        if line_start >= size or _line_timestamp(f, line_start, sep) >= start:
+            hi = mid
+        else:
+            lo = mid + 1
+    return _next_line_start(f, data_start, lo)
+
+
+def _next_line_start(f: BinaryIO, data_start: int, pos: int) -> int:
+    if pos <= data_start:
+        return data_start
+    f.seek(pos - 1)
+    f.readline()
+    return f.tell()
+
+
+def _line_timestamp(f: BinaryIO, line_start: int, sep: bytes) -> datetime:
+    f.seek(line_start)
+    return datetime.fromisoformat(f.readline().split(sep, 1)[0].strip().decode())
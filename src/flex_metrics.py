@@ -1,20 +1,28 @@
+from __future__ import annotations
 
-
-from datetime import date, datetime, timedelta
+from contextlib import contextmanager
+from copy import copy
 from pathlib import Path
 from sys import exit
-from typing import Dict, List, NamedTuple
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine
 from sqlalchemy.orm import Session
 
 from db.baselines_dao import BaselineDao
+from db.core_lookups import CoreBaselineDao, CoreFlexDevicesDao
+from db.data_not_found_exception import DataNotFoundException
 from db.flex_devices_dao import FlexDevicesDao
+from db.lookup_keys import BaselineKey, FlexMetricKey
+from db.profile_cache import ProfileCache
+from db.scenario_aggregates_dao import ScenarioAggregatesDao, ScenarioProfiles, ptu_of_day
+from db.snapshot import SnapshotFlexMetrics
 from experiment.experiment_description import DeviceType
 from flex_metric_config import Config
-from flex_metrics_results import DeviceResults, Results
+from flex_metrics_results import DeviceResults, Results, SweepResults
+from util.instrumentation import span
 
 
 class FlexMetricProfiles(NamedTuple):
@@ -23,100 +31,461 @@ class FlexMetricProfiles(NamedTuple):
     hhp: Dict[str, List[float]]
 
 
+class Lookups(NamedTuple):
+    '''The profile lookups of FlexMetrics, the DAOs of a database session or a snapshot'''
+    flex_metrics: Union[FlexDevicesDao, SnapshotFlexMetrics]
+    baselines: Union[BaselineDao, SnapshotFlexMetrics]
+    scenario_aggregates: Union[ScenarioAggregatesDao, SnapshotFlexMetrics]
+
+
+class _StackedColumns():
+    '''
+    The result columns of many scenarios, one row per device of a scenario. The baselines and flex power of the rows are
+    determined with a few NumPy operations over the rows of all scenarios, instead of per device and scenario.
+    '''
+
+    def __init__(self, day_profiles: Dict[BaselineKey, np.ndarray], width: int) -> None:
+        self.width = width
+        self.__day_profiles = day_profiles
+        self.__profile_index: Dict[BaselineKey, int] = {}
+        self.__rows = 0
+        # (row, position in the sum of the row, profile index, start PTU, duration, factor)
+        self.__windows: List[Tuple[int, int, int, int, int, float]] = []
+        self.__window_counts: Dict[int, int] = {}
+        self.__values: List[Tuple[int, np.ndarray, float]] = []
+        self.__flex: List[Tuple[int, np.ndarray, Optional[float]]] = []
+
+    def add_window(self, key: BaselineKey, start: int, duration: int, factor: float, row: Optional[int] = None) -> int:
+        '''Add a baseline of a window of the profile of the day of key times factor. The windows added to the same row are summed.'''
+        row = self.__new_row() if row is None else row
+        position = self.__window_counts.get(row, 0)
+        self.__window_counts[row] = position + 1
+        profile = self.__profile_index.setdefault(key, len(self.__profile_index))
+        self.__windows.append((row, position, profile, start, duration, factor))
+        return row
+
+    def add_values(self, values: np.ndarray, factor: float) -> int:
+        '''Add a baseline of values times factor'''
+        row = self.__new_row()
+        self.__values.append((row, values, factor))
+        return row
+
+    def add_flex(self, row: int, values: np.ndarray, amount: Optional[float] = None) -> int:
+        '''Add the flex power of values times the baseline of row, or times amount if given'''
+        self.__flex.append((row, values, amount))
+        return len(self.__flex) - 1
+
+    def compute(self) -> Tuple[np.ndarray, np.ndarray]:
+        '''Return the baselines and the flex power, as a row of width PTU per added baseline and flex power'''
+        baselines = np.zeros((self.__rows, self.width))
+        if self.__windows:
+            day_profiles = np.stack([self.__day_profiles[key] for key in self.__profile_index])
+            rows, positions, profiles, starts, durations, factors = (np.array(c) for c in zip(*self.__windows))
+            if np.any(starts + durations > day_profiles.shape[1]):
+                raise AssertionError("The congestion period of a scenario doesn't end on the same day")
+            ptus = starts[:, None] + np.arange(self.width)
+            # PTU after the congestion period are not used
+            ptus = np.where(ptus < day_profiles.shape[1], ptus, 0)
+            windows = day_profiles[profiles[:, None], ptus] * factors[:, None]
+            # Summed in the order in which the windows were added
+            for position in range(positions.max() + 1):
+                at = positions == position
+                if position == 0:
+                    baselines[rows[at]] = windows[at]
+                else:
+                    baselines[rows[at]] += windows[at]
+        if self.__values:
+            rows, values, factors = zip(*self.__values)
+            baselines[list(rows)] = self.__padded(values) * np.array(factors)[:, None]
+        if not self.__flex:
+            return baselines, np.zeros((0, self.width))
+        rows, values, amounts = zip(*self.__flex)
+        factors = baselines[list(rows)]
+        with_amount = [i for i, a in enumerate(amounts) if a is not None]
+        factors[with_amount] = np.array([amounts[i] for i in with_amount], dtype=np.float64)[:, None]
+        return baselines, self.__padded(values) * factors
+
+    def __new_row(self) -> int:
+        self.__rows += 1
+        return self.__rows - 1
+
+    def __padded(self, values: Tuple[np.ndarray, ...]) -> np.ndarray:
+        padded = np.zeros((len(values), self.width))
+        for i, v in enumerate(values):
+            padded[i, :len(v)] = v
+        return padded
+
+
 class FlexMetrics():
 
-    def __init__(self, config: Config, db_file: Path) -> None:
-        if not db_file.exists():
+    def __init__(self, config: Config, db_file: Path, cache: ProfileCache = None, use_scenario_aggregates: bool = True, engine: Engine = None,
+                 snapshot: SnapshotFlexMetrics = None) -> None:
+        '''
+        Args:
+            cache: cache for the profiles fetched from the database. By default a cache is shared by all FlexMetrics instances of the same database file.
+            use_scenario_aggregates: use the precomputed scenario profiles of EV and HP if the database contains them (see to_database.py --scenario-aggregates).
+            engine: engine of the database file, e.g. a pooled read-only engine that is shared by many FlexMetrics (see db/read_only_engine.py).
+                By default a new engine is created.
+            snapshot: look up the profiles in this snapshot of the database instead of in the database (see to_snapshot.py).
+        '''
+        self.snapshot = snapshot
+        if snapshot is not None:
+            self.engine = None
+        elif not db_file.exists():
             print("Database file is missing. Cannot run the flex metrics tool.\nExiting...")
             exit(1)
         else:
-            self.engine = create_engine(f"sqlite:///{db_file}", echo=False)
+            self.engine = engine if engine is not None else create_engine(f"sqlite:///{db_file}", echo=False)
         self.conf = config
+        self.cache = cache if cache is not None else ProfileCache.shared(db_file)
+        self.use_scenario_aggregates = use_scenario_aggregates
 
-    def fetch_flex_metrics(self) -> FlexMetricProfiles:
-        with Session(self.engine) as session:
-            dao = FlexDevicesDao(session)
-            ev_fm: Dict[str, List[float]] = {}
-            hp_fm: Dict[str, List[float]] = {}
-            hhp_fm: Dict[str, List[float]] = {}
-            if self.conf.ev:
-                for e in self.conf.ev:
-                    ev_fm[e.pc4] = dao.get_flex_metrics(DeviceType.EV, self.conf.congestion_start, self.conf.congestion_duration, e.pc4, e.typical_day)
-            if self.conf.hp:
-                for hp in self.conf.hp.house_type:
-                    hp_fm[hp.name] = dao.get_flex_metrics(DeviceType.HP, self.conf.congestion_start, self.conf.congestion_duration, hp.name, self.conf.hp.typical_day)
-            if self.conf.hhp:
-                for hhp in self.conf.hhp.house_type:
-                    hhp_fm[hhp.name] = self.conf.congestion_duration * [1]
-        return FlexMetricProfiles(ev_fm, hp_fm, hhp_fm)
-    
-    def fetch_baselines(self) -> pd.DataFrame:
-        with Session(self.engine) as session:
-            #TODO: get rid of hardcode length
-            baselines: pd.DataFrame = pd.DataFrame(index=range(0,96))
-            dao = BaselineDao(session)
-            if self.conf.ev:
-                for e in self.conf.ev:
-                    # TODO: this is wrong! The baselines are accidentially stored as DataFrame in de database therefore we can now multiply the array!
-                    baselines[f'ev-{e.pc4}'] = dao.get_baseline_mean(DeviceType.EV, e.typical_day, e.pc4).values * e.amount
-            if self.conf.hp:
-                for hp in self.conf.hp.house_type:
-                    baselines['hp-' + hp.name] = dao.get_baseline_mean(DeviceType.HP, self.conf.hp.typical_day, hp.name).values * hp.amount
-            if self.conf.hhp:
-                for hhp in self.conf.hhp.house_type:
-                    baselines['hhp-' + hhp.name] = dao.get_baseline_mean(DeviceType.HHP, self.conf.hhp.typical_day, hhp.name).values * hhp.amount
-            if self.conf.pv:
-                b = dao.get_baseline_mean(DeviceType.PV, self.conf.pv.typical_day, self.conf.pv.profile_type).values
-                baselines['pv']= b * self.conf.pv.peak_power_W
-            if self.conf.non_flexible_load:
-                #TODO: get rid of hardcode length
-                baselines['sjv'] = 96 * [0]
-                for sjv in self.conf.non_flexible_load.sjv:
-                    baselines['sjv'] += np.array(dao.get_baseline_mean(DeviceType.SJV, self.conf.non_flexible_load.typical_day, sjv.name)) * sjv.amount
-        return baselines
+    def fetch_flex_metrics(self, flexible_devices: bool = True) -> FlexMetricProfiles:
+        '''
+        Args:
+            flexible_devices: also fetch the flex metrics of EV and HP.
+        '''
+        with span("fetch_flex_metrics"):
+            keys = self.__flex_metric_keys() if flexible_devices else {}
+            with self.__lookups() as lookups:
+                flex_metrics = lookups.flex_metrics.get_flex_metrics_bulk(list(keys.values())) if keys else {}
+            return self.__flex_metric_profiles(keys, flex_metrics, flexible_devices)
     
+    def fetch_scenario_profiles(self) -> Optional[Dict[str, ScenarioProfiles]]:
+        '''
+        Fetch the precomputed scenario profiles of the EV and HP in the config.
+        Returns None if the database doesn't contain scenario profiles for all of them.
+        '''
+        with span("fetch_scenario_profiles"):
+            keys = self.__flex_metric_keys()
+            if not keys:
+                return None
+            with self.__lookups() as lookups:
+                try:
+                    profiles = lookups.scenario_aggregates.get_scenario_profiles_bulk(list(keys.values()))
+                except DataNotFoundException:
+                    return None
+            return {name: profiles[key] for name, key in keys.items()}
+
+    def fetch_baselines(self, flexible_devices: bool = True) -> pd.DataFrame:
+        '''
+        Args:
+            flexible_devices: also fetch the baselines of EV and HP.
+        '''
+        with span("fetch_baselines"):
+            keys = self.__baseline_keys(flexible_devices)
+            with self.__lookups() as lookups:
+                profiles = lookups.baselines.get_baseline_means_bulk(list(keys.values())) if keys else {}
+            return self.__baselines_frame(keys, profiles, flexible_devices)
 
     def determine_flex_power(self) -> Results:
-        flex_metrics = self.fetch_flex_metrics()
-        cong_start_idx = int((datetime.combine(date(2020,1,1), self.conf.congestion_start) - datetime(2020,1,1)) / timedelta(minutes=15))
-        baselines_db = self.fetch_baselines()[cong_start_idx:cong_start_idx + self.conf.congestion_duration].reset_index()
+        with span("determine_flex_power"):
+            scenario_profiles = self.fetch_scenario_profiles() if self.use_scenario_aggregates else None
+            # The scenario profiles contain the flex metrics and baselines of EV and HP
+            flex_metrics = self.fetch_flex_metrics(scenario_profiles is None)
+            baselines = self.fetch_baselines(scenario_profiles is None)
+            with span("assemble_results"):
+                return self.__results(scenario_profiles, flex_metrics, baselines)
+
+    def determine_flex_power_many(self, configs: List[Config]) -> List[Results]:
+        '''
+        Determine the flex power of many scenarios, in the order of the configs.
+        The profiles of all scenarios are fetched at once, with one bulk query per table over the distinct keys of the scenarios,
+        using the engine and cache of this instance. A DataNotFoundException names the missing keys of all scenarios.
+        '''
+        with span("determine_flex_power_many"):
+            scenarios = [self.__with_config(c) for c in configs]
+            with self.__lookups() as lookups:
+                with span("fetch_scenario_profiles"):
+                    aggregates: Dict[FlexMetricKey, ScenarioProfiles] = {}
+                    if self.use_scenario_aggregates:
+                        keys = [k for s in scenarios for k in s.__flex_metric_keys().values()]
+                        aggregates = lookups.scenario_aggregates.get_scenario_profiles_bulk(keys, ignore_missing=True) if keys else {}
+                    scenario_profiles: List[Optional[Dict[str, ScenarioProfiles]]] = []
+                    for s in scenarios:
+                        keys = s.__flex_metric_keys()
+                        found = bool(keys) and all(k in aggregates for k in keys.values())
+                        scenario_profiles.append({name: aggregates[k] for name, k in keys.items()} if found else None)
+
+                flex_metric_keys = [s.__flex_metric_keys() if p is None else {} for s, p in zip(scenarios, scenario_profiles)]
+                baseline_keys = [s.__baseline_keys(p is None) for s, p in zip(scenarios, scenario_profiles)]
+                missing = []
+                try:
+                    with span("fetch_flex_metrics"):
+                        keys = [k for ks in flex_metric_keys for k in ks.values()]
+                        flex_metrics = lookups.flex_metrics.get_flex_metrics_bulk(keys) if keys else {}
+                except DataNotFoundException as e:
+                    missing.append(str(e))
+                try:
+                    with span("fetch_baselines"):
+                        keys = [k for ks in baseline_keys for k in ks.values()]
+                        baselines = lookups.baselines.get_baseline_means_bulk(keys) if keys else {}
+                except DataNotFoundException as e:
+                    missing.append(str(e))
+                if missing:
+                    raise DataNotFoundException("\n".join(missing))
+
+            with span("assemble_results"):
+                return self.__results_many(scenarios, scenario_profiles, flex_metric_keys, baseline_keys, flex_metrics, baselines)
+
+    def sweep_flex_power(self) -> SweepResults:
+        '''
+        Determine the flex power of the scenario for every congestion period (start and duration) in the database at once,
+        the congestion start and duration of the config are not used. The flex metrics of all periods are fetched with one query.
+        PTU after the end of a congestion period, and periods for which a device has no flex metrics, are NaN.
+        '''
+        with span("sweep_flex_power"):
+            devices = (self.conf.ev or []) + (self.conf.hp.house_type if self.conf.hp else []) + (self.conf.hhp.house_type if self.conf.hhp else [])
+            if any(d.amount is None for d in devices):
+                raise AssertionError("A sweep over all congestion periods needs the amount of every device, a baseline_total_W only fits one congestion period")
+            baseline_keys = self.__baseline_keys(True)
+            flexible_keys = {name: key for name, key in baseline_keys.items() if key.device_type in [DeviceType.EV, DeviceType.HP]}
+            with self.__lookups() as lookups:
+                with span("fetch_flex_metrics"):
+                    windows = lookups.flex_metrics.get_congestion_windows()
+                    flex_metrics = lookups.flex_metrics.get_flex_metrics_of_groups(list(flexible_keys.values())) if flexible_keys else {}
+                with span("fetch_baselines"):
+                    profiles = lookups.baselines.get_baseline_means_bulk(list(baseline_keys.values())) if baseline_keys else {}
+            if not windows:
+                raise DataNotFoundException("No flex metrics found in the database")
+
+            with span("assemble_results"):
+                baselines = self.__baselines_frame(baseline_keys, profiles, True)
+                cong_starts = sorted({w[0] for w in windows})
+                cong_durations = sorted({w[1] for w in windows})
+                start_index = {s: i for i, s in enumerate(cong_starts)}
+                duration_index = {d: i for i, d in enumerate(cong_durations)}
+                shape = (len(cong_starts), len(cong_durations), max(cong_durations))
+                # PTU of the day of every (congestion start x PTU), PTU in the congestion period and within the day are valid
+                ptus = np.array([ptu_of_day(s) for s in cong_starts])[:, None] + np.arange(shape[2])
+                valid = (ptus < len(baselines))[:, None, :] & (np.arange(shape[2]) < np.array(cong_durations)[:, None])[None, :, :]
+                ptus = np.minimum(ptus, len(baselines) - 1)
+
+                def in_congestion_periods(profile: np.ndarray) -> np.ndarray:
+                    return np.where(valid, np.asarray(profile, dtype=np.float64)[ptus][:, None, :], np.nan)
+
+                flex_metric_cubes: Dict[BaselineKey, np.ndarray] = {key: np.full(shape, np.nan) for key in flexible_keys.values()}
+                for key, flex_metric in flex_metrics.items():
+                    flex_metric_cubes[BaselineKey(*key[:3])][start_index[key.cong_start], duration_index[key.cong_duration], :len(flex_metric)] = flex_metric
+
+                flex_power: Dict[DeviceType, np.ndarray] = {}
+                for name, key in baseline_keys.items():
+                    if key.device_type in [DeviceType.EV, DeviceType.HP]:
+                        device_flex_power = flex_metric_cubes[key] * in_congestion_periods(baselines[name])
+                    elif key.device_type is DeviceType.HHP:
+                        device_flex_power = in_congestion_periods(baselines[name])
+                    else:
+                        continue
+                    flex_power[key.device_type] = flex_power[key.device_type] + device_flex_power if key.device_type in flex_power else device_flex_power
+                return SweepResults(cong_starts, cong_durations, in_congestion_periods(baselines.sum(axis=1)), flex_power)
+
+    @contextmanager
+    def __lookups(self) -> Iterator[Lookups]:
+        if self.snapshot is not None:
+            yield Lookups(self.snapshot, self.snapshot, self.snapshot)
+        else:
+            with Session(self.engine) as session:
+                # The flex metric and baseline lookups bypass the ORM, see db/core_lookups.py
+                yield Lookups(CoreFlexDevicesDao(session, self.cache), CoreBaselineDao(session, self.cache), ScenarioAggregatesDao(session, self.cache))
+
+    def __with_config(self, config: Config) -> FlexMetrics:
+        '''Return a FlexMetrics of another config that shares the engine and cache of this instance'''
+        scenario = copy(self)
+        scenario.conf = config
+        return scenario
+
+    def __flex_metric_keys(self) -> Dict[str, FlexMetricKey]:
+        '''Return the flex metric keys of the EV and HP in the config'''
+        keys: Dict[str, FlexMetricKey] = {}
+        if self.conf.ev:
+            for e in self.conf.ev:
+                keys[f'ev-{e.pc4}'] = FlexMetricKey(DeviceType.EV, e.pc4, e.typical_day, self.conf.congestion_start, self.conf.congestion_duration)
+        if self.conf.hp:
+            for hp in self.conf.hp.house_type:
+                keys['hp-' + hp.name] = FlexMetricKey(DeviceType.HP, hp.name, self.conf.hp.typical_day, self.conf.congestion_start, self.conf.congestion_duration)
+        return keys
+
+    def __flex_metric_profiles(self, keys: Dict[str, FlexMetricKey], flex_metrics: Dict[FlexMetricKey, np.ndarray], flexible_devices: bool) -> FlexMetricProfiles:
+        ev_fm: Dict[str, List[float]] = {}
+        hp_fm: Dict[str, List[float]] = {}
+        hhp_fm: Dict[str, List[float]] = {}
+        if self.conf.ev and flexible_devices:
+            for e in self.conf.ev:
+                ev_fm[e.pc4] = flex_metrics[keys[f'ev-{e.pc4}']]
+        if self.conf.hp and flexible_devices:
+            for hp in self.conf.hp.house_type:
+                hp_fm[hp.name] = flex_metrics[keys['hp-' + hp.name]]
+        if self.conf.hhp:
+            for hhp in self.conf.hhp.house_type:
+                hhp_fm[hhp.name] = self.conf.congestion_duration * [1]
+        return FlexMetricProfiles(ev_fm, hp_fm, hhp_fm)
+
+    def __baseline_keys(self, flexible_devices: bool) -> Dict[str, BaselineKey]:
+        keys: Dict[str, BaselineKey] = {}
+        if self.conf.ev and flexible_devices:
+            for e in self.conf.ev:
+                keys[f'ev-{e.pc4}'] = BaselineKey(DeviceType.EV, e.pc4, e.typical_day)
+        if self.conf.hp and flexible_devices:
+            for hp in self.conf.hp.house_type:
+                keys['hp-' + hp.name] = BaselineKey(DeviceType.HP, hp.name, self.conf.hp.typical_day)
+        if self.conf.hhp:
+            for hhp in self.conf.hhp.house_type:
+                keys['hhp-' + hhp.name] = BaselineKey(DeviceType.HHP, hhp.name, self.conf.hhp.typical_day)
+        if self.conf.pv:
+            keys['pv'] = BaselineKey(DeviceType.PV, self.conf.pv.profile_type, self.conf.pv.typical_day)
+        if self.conf.non_flexible_load:
+            for sjv in self.conf.non_flexible_load.sjv:
+                keys['sjv-' + sjv.name] = BaselineKey(DeviceType.SJV, sjv.name, self.conf.non_flexible_load.typical_day)
+        return keys
+
+    def __baselines_frame(self, keys: Dict[str, BaselineKey], profiles: Dict[BaselineKey, np.ndarray], flexible_devices: bool) -> pd.DataFrame:
+        # The columns are collected first and the frames created at once, which is much faster than inserting columns one by one
+        columns: Dict[str, np.ndarray] = {}
+        if self.conf.ev and flexible_devices:
+            for e in self.conf.ev:
+                columns[f'ev-{e.pc4}'] = profiles[keys[f'ev-{e.pc4}']] * e.amount
+        if self.conf.hp and flexible_devices:
+            for hp in self.conf.hp.house_type:
+                columns['hp-' + hp.name] = profiles[keys['hp-' + hp.name]] * hp.amount
+        if self.conf.hhp:
+            for hhp in self.conf.hhp.house_type:
+                columns['hhp-' + hhp.name] = profiles[keys['hhp-' + hhp.name]] * hhp.amount
+        if self.conf.pv:
+            columns['pv'] = profiles[keys['pv']] * self.conf.pv.peak_power_W
+        if self.conf.non_flexible_load:
+            #TODO: get rid of hardcode length
+            columns['sjv'] = np.zeros(96, dtype=np.int64)
+            for sjv in self.conf.non_flexible_load.sjv:
+                columns['sjv'] = columns['sjv'] + profiles[keys['sjv-' + sjv.name]] * sjv.amount
+        #TODO: get rid of hardcode length
+        return pd.DataFrame(columns, index=range(0,96))
+
+    def __results(self, scenario_profiles: Optional[Dict[str, ScenarioProfiles]], flex_metrics: FlexMetricProfiles, baselines: pd.DataFrame) -> Results:
+        cong_start_idx = ptu_of_day(self.conf.congestion_start)
+        baselines_db = {name: baselines[name].to_numpy()[cong_start_idx:cong_start_idx + self.conf.congestion_duration] for name in baselines.columns}
+        index = pd.RangeIndex(self.conf.congestion_duration)
         device_results: List[DeviceResults] = []
         
         if self.conf.ev:
-            ev_baselines = pd.DataFrame(index=pd.RangeIndex(self.conf.congestion_duration))
-            ev_flex_profiles = pd.DataFrame(index=pd.RangeIndex(self.conf.congestion_duration))
+            ev_baselines: Dict[str, np.ndarray] = {}
+            ev_flex_profiles: Dict[str, np.ndarray] = {}
             for e in self.conf.ev:
-                #TODO: array from baseline_total_W should be dataframe
-                ev_baselines[e.pc4] = np.array(e.baseline_total_W) if e.baseline_total_W else baselines_db[f'ev-{e.pc4}']
-                ev_flex_profiles[e.pc4] = np.array(flex_metrics.ev[e.pc4]) * ev_baselines[e.pc4]
-            device_results.append(DeviceResults(DeviceType.EV, ev_baselines, ev_flex_profiles))
+                ev_baselines[e.pc4], ev_flex_profiles[e.pc4] = self.__flexible_device_profiles(f'ev-{e.pc4}', e.amount, e.baseline_total_W, baselines_db,
+                                                                                               scenario_profiles, flex_metrics.ev.get(e.pc4))
+            device_results.append(DeviceResults(DeviceType.EV, pd.DataFrame(ev_baselines, index=index), pd.DataFrame(ev_flex_profiles, index=index)))
         
         if self.conf.pv:
-            pv_baselines = pd.DataFrame(index=pd.RangeIndex(self.conf.congestion_duration))
-            pv_baselines['pv'] = baselines_db['pv']
-            device_results.append(DeviceResults(DeviceType.PV, pv_baselines))
+            device_results.append(DeviceResults(DeviceType.PV, pd.DataFrame({'pv': baselines_db['pv']}, index=index)))
 
         if self.conf.non_flexible_load:
-            non_flex_baselines = pd.DataFrame(index=pd.RangeIndex(self.conf.congestion_duration))
-            non_flex_baselines['non_flex'] = baselines_db['sjv']
-            device_results.append(DeviceResults(DeviceType.SJV, non_flex_baselines))
+            device_results.append(DeviceResults(DeviceType.SJV, pd.DataFrame({'non_flex': baselines_db['sjv']}, index=index)))
 
         if self.conf.hp:
-            hp_baselines = pd.DataFrame(index=pd.RangeIndex(self.conf.congestion_duration))
-            hp_flex_profiles = pd.DataFrame(index=pd.RangeIndex(self.conf.congestion_duration))
+            hp_baselines: Dict[str, np.ndarray] = {}
+            hp_flex_profiles: Dict[str, np.ndarray] = {}
             for hp in self.conf.hp.house_type:
-                #TODO: array from baseline_total_W should be dataframe
-                hp_baselines[hp.name] = np.array(hp.baseline_total_W) if hp.baseline_total_W  else baselines_db['hp-' + hp.name]
-                hp_flex_profiles[hp.name] = np.array(flex_metrics.hp[hp.name]) * hp_baselines[hp.name]
-            device_results.append(DeviceResults(DeviceType.HP, hp_baselines, hp_flex_profiles))
+                hp_baselines[hp.name], hp_flex_profiles[hp.name] = self.__flexible_device_profiles('hp-' + hp.name, hp.amount, hp.baseline_total_W, baselines_db,
+                                                                                                   scenario_profiles, flex_metrics.hp.get(hp.name))
+            device_results.append(DeviceResults(DeviceType.HP, pd.DataFrame(hp_baselines, index=index), pd.DataFrame(hp_flex_profiles, index=index)))
         
         if self.conf.hhp:
-            hhp_baselines = pd.DataFrame(index=pd.RangeIndex(self.conf.congestion_duration))
-            hhp_flex_profiles = pd.DataFrame(index=pd.RangeIndex(self.conf.congestion_duration))
+            hhp_baselines: Dict[str, np.ndarray] = {}
+            hhp_flex_profiles: Dict[str, np.ndarray] = {}
             for hhp in self.conf.hhp.house_type:
                 #TODO: array from baseline_total_W should be dataframe
                 hhp_baselines[hhp.name] = np.array(hhp.baseline_total_W) if hhp.baseline_total_W else baselines_db['hhp-' + hhp.name]
                 hhp_flex_profiles[hhp.name] = np.array(flex_metrics.hhp[hhp.name]) * hhp_baselines[hhp.name]
-            device_results.append(DeviceResults(DeviceType.HHP, hhp_baselines, hhp_flex_profiles))
+            device_results.append(DeviceResults(DeviceType.HHP, pd.DataFrame(hhp_baselines, index=index), pd.DataFrame(hhp_flex_profiles, index=index)))
         
-        return Results(cong_start=self.conf.congestion_start, cong_duration=self.conf.congestion_duration, results=device_results)
\ No newline at end of file
+        return Results(cong_start=self.conf.congestion_start, cong_duration=self.conf.congestion_duration, results=device_results)
+
+    def __results_many(self, scenarios: List[FlexMetrics], scenario_profiles: List[Optional[Dict[str, ScenarioProfiles]]],
+                       flex_metric_keys: List[Dict[str, FlexMetricKey]], baseline_keys: List[Dict[str, BaselineKey]],
+                       flex_metrics: Dict[FlexMetricKey, np.ndarray], baselines: Dict[BaselineKey, np.ndarray]) -> List[Results]:
+        '''
+        Assemble the results of many scenarios from the stacked columns of all scenarios, with the same values as __results.
+        A scenario with result columns that aren't floating point (an integer baseline_total_W, or no SJV in the non flexible load)
+        is assembled with __results, to keep the column types.
+        '''
+        stacked = _StackedColumns(baselines, max(s.conf.congestion_duration for s in scenarios))
+        layouts = [s.__stack_columns(stacked, p, fk, bk, flex_metrics) if s.__has_float_columns() else None
+                   for s, p, fk, bk in zip(scenarios, scenario_profiles, flex_metric_keys, baseline_keys)]
+        baseline_rows, flex_rows = stacked.compute()
+        results = []
+        for s, p, fk, bk, layout in zip(scenarios, scenario_profiles, flex_metric_keys, baseline_keys, layouts):
+            if layout is None:
+                results.append(s.__results(p, s.__flex_metric_profiles(fk, flex_metrics, p is None), s.__baselines_frame(bk, baselines, p is None)))
+                continue
+            index = pd.RangeIndex(s.conf.congestion_duration)
+
+            def frame(columns: Dict[str, int], rows: np.ndarray) -> pd.DataFrame:
+                return pd.DataFrame(rows[list(columns.values()), :len(index)].T, index=index, columns=list(columns.keys()))
+            results.append(Results(cong_start=s.conf.congestion_start, cong_duration=s.conf.congestion_duration,
+                                   results=[DeviceResults(device_type, frame(b, baseline_rows), None if f is None else frame(f, flex_rows)) for device_type, b, f in layout]))
+        return results
+
+    def __has_float_columns(self) -> bool:
+        devices = (self.conf.ev or []) + (self.conf.hp.house_type if self.conf.hp else []) + (self.conf.hhp.house_type if self.conf.hhp else [])
+        if any(d.baseline_total_W and np.array(d.baseline_total_W).dtype != np.float64 for d in devices):
+            return False
+        return not (self.conf.non_flexible_load and not self.conf.non_flexible_load.sjv)
+
+    def __stack_columns(self, stacked: _StackedColumns, scenario_profiles: Optional[Dict[str, ScenarioProfiles]], flex_metric_keys: Dict[str, FlexMetricKey],
+                        baseline_keys: Dict[str, BaselineKey], flex_metrics: Dict[FlexMetricKey, np.ndarray]) -> List[Tuple[DeviceType, Dict[str, int], Optional[Dict[str, int]]]]:
+        '''
+        Add the columns of the scenario to the stacked columns, like __results and __flexible_device_profiles determine them.
+        Returns the baseline and flex power rows of the results of every device type.
+        '''
+        start, duration = ptu_of_day(self.conf.congestion_start), self.conf.congestion_duration
+
+        def flexible_device(name: str, amount: Optional[int], baseline_total_W: Optional[List[float]]) -> Tuple[int, int]:
+            if scenario_profiles is not None:
+                profiles = scenario_profiles[name]
+                if baseline_total_W:
+                    row = stacked.add_values(np.array(baseline_total_W), 1.0)
+                    return row, stacked.add_flex(row, profiles.flex_metric)
+                row = stacked.add_values(profiles.baseline_mean, amount)
+                return row, stacked.add_flex(row, profiles.flex_power, amount)
+            row = stacked.add_values(np.array(baseline_total_W), 1.0) if baseline_total_W else stacked.add_window(baseline_keys[name], start, duration, amount)
+            return row, stacked.add_flex(row, flex_metrics[flex_metric_keys[name]])
+
+        layout: List[Tuple[DeviceType, Dict[str, int], Optional[Dict[str, int]]]] = []
+        if self.conf.ev:
+            baselines, flex_profiles = {}, {}
+            for e in self.conf.ev:
+                baselines[e.pc4], flex_profiles[e.pc4] = flexible_device(f'ev-{e.pc4}', e.amount, e.baseline_total_W)
+            layout.append((DeviceType.EV, baselines, flex_profiles))
+        if self.conf.pv:
+            layout.append((DeviceType.PV, {'pv': stacked.add_window(baseline_keys['pv'], start, duration, self.conf.pv.peak_power_W)}, None))
+        if self.conf.non_flexible_load:
+            row = None
+            for sjv in self.conf.non_flexible_load.sjv:
+                row = stacked.add_window(baseline_keys['sjv-' + sjv.name], start, duration, sjv.amount, row)
+            layout.append((DeviceType.SJV, {'non_flex': row}, None))
+        if self.conf.hp:
+            baselines, flex_profiles = {}, {}
+            for hp in self.conf.hp.house_type:
+                baselines[hp.name], flex_profiles[hp.name] = flexible_device('hp-' + hp.name, hp.amount, hp.baseline_total_W)
+            layout.append((DeviceType.HP, baselines, flex_profiles))
+        if self.conf.hhp:
+            baselines, flex_profiles = {}, {}
+            for hhp in self.conf.hhp.house_type:
+                if hhp.baseline_total_W:
+                    baselines[hhp.name] = stacked.add_values(np.array(hhp.baseline_total_W), 1.0)
+                else:
+                    baselines[hhp.name] = stacked.add_window(baseline_keys['hhp-' + hhp.name], start, duration, hhp.amount)
+                flex_profiles[hhp.name] = stacked.add_flex(baselines[hhp.name], np.ones(duration))
+            layout.append((DeviceType.HHP, baselines, flex_profiles))
+        return layout
+
+    def __flexible_device_profiles(self, name: str, amount: Optional[int], baseline_total_W: Optional[List[float]], baselines_db: Dict[str, np.ndarray],
+                                   scenario_profiles: Optional[Dict[str, ScenarioProfiles]], flex_metric: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        '''Return the baseline and flex power of the congestion period of a flexible device in the config'''
+        #TODO: array from baseline_total_W should be dataframe
+        if scenario_profiles is not None:
+            profiles = scenario_profiles[name]
+            if baseline_total_W:
+                return np.array(baseline_total_W), profiles.flex_metric * np.array(baseline_total_W)
+            return profiles.baseline_mean * amount, profiles.flex_power * amount
+        baseline = np.array(baseline_total_W) if baseline_total_W else baselines_db[name]
+        return baseline, np.array(flex_metric) * baseline
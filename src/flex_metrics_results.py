@@ -1,8 +1,9 @@
 
 from dataclasses import dataclass
 from datetime import time
-from typing import List
+from typing import Any, Dict, List, Optional
 
+import numpy as np
 import pandas as pd
 
 from experiment.device_type import DeviceType
@@ -35,5 +36,44 @@ class Results():
             baselines.append(r.baselines.add_prefix(str(r.device_type).lower() + '_'))
         return pd.concat(baselines, axis=1)
 
-    
+    def to_dict(self) -> Dict[str, Any]:
+        '''Return the results as JSON compatible dict, with a list per profile and None for missing values'''
+        return {'cong_start': self.cong_start.isoformat(), 'cong_duration': self.cong_duration,
+                'results': [{'device_type': str(r.device_type),
+                             'baselines': _profiles_to_dict(r.baselines),
+                             'flex_profiles': None if r.flex_profiles is None else _profiles_to_dict(r.flex_profiles)} for r in self.results]}
+
+
+@dataclass
+class SweepResults():
+    '''
+    Results of a scenario for all congestion periods, as cubes of (congestion start x congestion duration x PTU in the congestion period).
+    PTU after the end of a congestion period are NaN.
+    '''
+    cong_starts: List[time]
+    cong_durations: List[int]
+    baselines: np.ndarray
+    '''Summed baseline of all devices'''
+    flex_power: Dict[DeviceType, np.ndarray]
+    '''Summed flex power per flexible device type'''
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        arrays = {'cong_start': np.array([s.isoformat() for s in self.cong_starts]), 'cong_duration': np.array(self.cong_durations), 'baseline': self.baselines}
+        arrays.update({'flex_' + str(device_type).lower(): cube for device_type, cube in self.flex_power.items()})
+        return arrays
+
+    def to_frame(self) -> pd.DataFrame:
+        '''Return the results in long format, one row per congestion start, congestion duration and PTU in the congestion period'''
+        starts, durations, ptus = np.indices(self.baselines.shape)
+        in_period = ptus < np.array(self.cong_durations)[durations]
+        arrays = self.to_arrays()
+        frame = pd.DataFrame({'cong_start': arrays.pop('cong_start')[starts[in_period]],
+                              'cong_duration': arrays.pop('cong_duration')[durations[in_period]],
+                              'ptu': ptus[in_period]})
+        for name, cube in arrays.items():
+            frame[name] = cube[in_period]
+        return frame
+
 
+def _profiles_to_dict(profiles: pd.DataFrame) -> Dict[str, List[Optional[float]]]:
+    return {str(name): [None if np.isnan(v) else float(v) for v in column] for name, column in profiles.items()}
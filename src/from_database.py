@@ -24,7 +24,6 @@ with Session(engine) as session:
     months = dao.get_typical_days(device_type=DeviceType.PV, group=group)
     profiles = pd.DataFrame(index=pd.RangeIndex(start=0, stop=96))
     for m in months:
-        p: pd.DataFrame = dao.get_baseline_mean(device_type=DeviceType.PV, typical_day=m, group=group)
-        profiles[m] = p.reset_index(drop=True)
+        profiles[m] = dao.get_baseline_mean(device_type=DeviceType.PV, typical_day=m, group=group)
 
     profiles.to_csv("pvgis-interpolated-tz-shift-eff.csv", sep=';')
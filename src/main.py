@@ -1,20 +1,25 @@
+import cProfile
+import json
 from argparse import ArgumentParser
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Final
+from typing import Final, List, Optional, Tuple
 
 from dataclass_binder import Binder
 
 from db.data_not_found_exception import DataNotFoundException
+from db.snapshot import SnapshotFlexMetrics
 from experiment.device_type import DeviceType
 from flex_metric_config import Config
 from flex_metrics import FlexMetrics
-from result_writer import DirectoryResultWriter
-from util.config_converter import ExcelConverter
+from result_writer import BatchResultWriter, DirectoryResultWriter, SweepResultWriter
+from util.config_converter import ExcelConverter, JsonConverter
 from util.cli_wizard import CliWizard
+from util.instrumentation import Recorder, span
 
 DB_FILE: Final[str]="flex-metrics.db"
 CONFIG_FILE: Final[str]="config.toml"
+PROFILE_FILE_TYPES: Final[List[str]]=[".prof", ".json"]
 
 
 @dataclass
@@ -22,6 +27,11 @@ class CliArgs():
     conf_file: Path
     baselines_only: bool
     wizard_mode: bool
+    batch_file: Optional[Path] = None
+    sweep_format: Optional[str] = None
+    snapshot_dir: Optional[Path] = None
+    profile: bool = False
+    profile_file: Optional[Path] = None
             
 
 def write_toml_template():
@@ -34,20 +44,48 @@ def parse_args() -> CliArgs:
     parser.add_argument('-f', '--file', help="scenario definition file name. Toml and Excel formats accepted.")
     parser.add_argument('-b', '--baselines', action='store_true', help="get only the baselines from database")
     parser.add_argument('-w', '--wizard',  action='store_true', help="run fleximetrics wizard to explore the database contents")
+    parser.add_argument('--batch', metavar='FILE', help="calculate the flex metrics of all scenarios in a JSON lines file and write them to one result file")
+    parser.add_argument('--sweep', choices=SweepResultWriter.file_formats, help="calculate the flex metrics of the scenario for all congestion periods in the database and write them to a file of this format")
+    parser.add_argument('-s', '--snapshot', metavar='DIR', help="look up the profiles in a snapshot of the database (see src/to_snapshot.py) instead of in the database")
+    parser.add_argument('--profile', metavar='FILE', nargs='?', const='', help="print the time spent per phase, and write a cProfile (.prof) or JSON (.json) trace to FILE")
     args = parser.parse_args()
     conf_file = args.file if args.file else CONFIG_FILE
-    return CliArgs(Path(conf_file), args.baselines, args.wizard)
+    profile_file = Path(args.profile) if args.profile else None
+    if profile_file is not None and profile_file.suffix not in PROFILE_FILE_TYPES:
+        print("Unknown profile file type. Please use a file with the prof or json extension.\nExiting...")
+        exit(1)
+    return CliArgs(Path(conf_file), args.baselines, args.wizard, Path(args.batch) if args.batch else None, args.sweep, Path(args.snapshot) if args.snapshot else None,
+                   args.profile is not None, profile_file)
+
+def flex_metrics_calculation(db_path: Path, conf: Config, snapshot: Optional[SnapshotFlexMetrics] = None):
+    try:
+        res = FlexMetrics(conf, db_path, snapshot=snapshot).determine_flex_power()
+        with span("write_results"):
+            DirectoryResultWriter(res, [DeviceType.HHP, DeviceType.HP]).write()
+    except DataNotFoundException as e:
+        print("ERROR: " + str(e))
 
-def flex_metrics_calculation(db_path: Path, conf: Config):
+def batch_flex_metrics_calculation(db_path: Path, names: List[str], confs: List[Config], snapshot: Optional[SnapshotFlexMetrics] = None):
     try:
-        res = FlexMetrics(conf, db_path).determine_flex_power()
-        DirectoryResultWriter(res, [DeviceType.HHP, DeviceType.HP]).write()
+        res = FlexMetrics(confs[0], db_path, snapshot=snapshot).determine_flex_power_many(confs)
+        with span("write_results"):
+            res_file = BatchResultWriter(res, names, [DeviceType.HHP, DeviceType.HP]).write()
+        print(f"Results of {len(res)} scenarios written to '{res_file}'")
     except DataNotFoundException as e:
         print("ERROR: " + str(e))
 
-def baselines_to_file(db_path: Path, conf: Config):
+def sweep_to_file(db_path: Path, conf: Config, file_format: str, snapshot: Optional[SnapshotFlexMetrics] = None):
     try:
-        baselines_df = FlexMetrics(conf, db_path).fetch_baselines()
+        res = FlexMetrics(conf, db_path, snapshot=snapshot).sweep_flex_power()
+        with span("write_results"):
+            res_file = SweepResultWriter(res, file_format).write()
+        print(f"Results of {len(res.cong_starts)} congestion starts and {len(res.cong_durations)} congestion durations written to '{res_file}'")
+    except DataNotFoundException as e:
+        print("ERROR: " + str(e))
+
+def baselines_to_file(db_path: Path, conf: Config, snapshot: Optional[SnapshotFlexMetrics] = None):
+    try:
+        baselines_df = FlexMetrics(conf, db_path, snapshot=snapshot).fetch_baselines()
         # Reduce the (hybrid) heat pump baseline profiles:
         hp_baseline = baselines_df.filter(regex="^hp-")
         if len(hp_baseline.columns) > 0:
@@ -58,11 +96,16 @@ def baselines_to_file(db_path: Path, conf: Config):
             baselines_df.drop(list(hhp_baseline), axis=1, inplace=True)
             baselines_df["hhp"] = hhp_baseline.sum(axis=1)
         baselines_df["all"] = baselines_df.sum(axis=1)
-        baselines_df.round(1).to_csv(f"baselines.csv", sep=';')
+        with span("write_results"):
+            baselines_df.round(1).to_csv(f"baselines.csv", sep=';')
     except DataNotFoundException as e:
         print("ERROR: " + str(e))
 
 def read_config(config_file: Path) -> Config:
+    with span("read_config"):
+        return parse_config(config_file)
+
+def parse_config(config_file: Path) -> Config:
     if Path(args.conf_file).suffix == ".toml":
         try:
             conf = Binder(Config).parse_toml(config_file)
@@ -86,15 +129,94 @@ def read_config(config_file: Path) -> Config:
         exit(1)
     return conf
 
+def open_snapshot(snapshot_dir: Optional[Path]) -> Optional[SnapshotFlexMetrics]:
+    if snapshot_dir is None:
+        return None
+    try:
+        return SnapshotFlexMetrics(snapshot_dir)
+    except (FileNotFoundError, AssertionError) as e:
+        print(str(e) + "\nExiting...")
+        exit(1)
+
+def read_batch(batch_file: Path) -> Tuple[List[str], List[Config]]:
+    '''
+    Read a JSON lines file with one scenario per line. A scenario has the keys of the toml config, with the
+    congestion start as "HH:MM[:SS]", and an optional "name". Unnamed scenarios are named by their line number.
+    '''
+    names: List[str] = []
+    confs: List[Config] = []
+    try:
+        with open(batch_file) as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        print(f"Batch file '{batch_file}' not found." + "\nExiting...")
+        exit(1)
+    with span("read_config"):
+        for line_nr, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                scenario = json.loads(line)
+                name = str(scenario.pop('name', line_nr))
+                conf = JsonConverter(scenario).convert()
+                conf.is_valid()
+            except (ValueError, TypeError, AssertionError) as e:
+                print(f"Scenario on line {line_nr} of '{batch_file}' invalid. " + str(e) + "\nExiting...")
+                exit(1)
+            names.append(name)
+            confs.append(conf)
+    if not confs:
+        print(f"Batch file '{batch_file}' contains no scenarios.\nExiting...")
+        exit(1)
+    if len(set(names)) != len(names):
+        print(f"Scenario names in '{batch_file}' are not unique.\nExiting...")
+        exit(1)
+    return names, confs
+
+def run(args: CliArgs, db_path: Path):
+    snapshot = open_snapshot(args.snapshot_dir)
+
+    if args.wizard_mode:
+        CliWizard(db_path).start()
+    elif args.batch_file:
+        batch_flex_metrics_calculation(db_path, *read_batch(args.batch_file), snapshot=snapshot)
+    elif args.sweep_format:
+        sweep_to_file(db_path, read_config(args.conf_file), args.sweep_format, snapshot)
+    elif args.baselines_only:
+        baselines_to_file(db_path, read_config(args.conf_file), snapshot)
+    else:
+        flex_metrics_calculation(db_path, read_config(args.conf_file), snapshot)
+
+def run_profiled(args: CliArgs, db_path: Path):
+    '''
+    Run with the phases recorded (see util/instrumentation.py), print the time spent per phase
+    and write the cProfile statistics or the spans to the profile file.
+    '''
+    recorder = Recorder()
+    profiler = cProfile.Profile() if args.profile_file is not None and args.profile_file.suffix == ".prof" else None
+    with recorder.activate():
+        if profiler is not None:
+            profiler.enable()
+        try:
+            run(args, db_path)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+    print(recorder.summary())
+    if profiler is not None:
+        profiler.dump_stats(args.profile_file)
+        print(f"cProfile statistics written to '{args.profile_file}'")
+    elif args.profile_file is not None:
+        with open(args.profile_file, "w") as f:
+            json.dump(recorder.to_dict(), f, indent=2)
+        print(f"Spans written to '{args.profile_file}'")
+
 if __name__ == "__main__":
     
     db_path = Path(DB_FILE) if Path(DB_FILE).exists() else Path("_internal") / DB_FILE
         
     args = parse_args()
-    
-    if args.wizard_mode:
-        CliWizard(db_path).start()
-    elif args.baselines_only:
-        baselines_to_file(db_path, read_config(args.conf_file))
+    if args.profile:
+        run_profiled(args, db_path)
     else:
-        flex_metrics_calculation(db_path, read_config(args.conf_file))
+        run(args, db_path)
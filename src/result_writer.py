@@ -1,9 +1,10 @@
-
 import datetime
 from pathlib import Path
 from typing import List
+import numpy as np
+import pandas as pd
 from experiment.device_type import DeviceType
-from flex_metrics_results import Results
+from flex_metrics_results import Results, SweepResults
 
 
 class DirectoryResultWriter():
@@ -16,12 +17,60 @@ class DirectoryResultWriter():
         self.results = results
 
     def write(self) -> None:
-        results = self.results.flex_profiles()
-        for device_type in self.reduce_group:
-            columns_to_reduce = results.filter(regex="flex_" + str(device_type).lower() + "_")
-            if len(columns_to_reduce.columns) > 0:
-                results.drop(list(columns_to_reduce), axis=1, inplace=True)
-                results["flex_" + str(device_type).lower()] = columns_to_reduce.sum(axis=1)
-        results['baseline'] = self.results.baselines().sum(axis=1)
         res_file_name = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M")
-        results.round(1).to_csv(DirectoryResultWriter.base_dir / (res_file_name + '.csv'), sep=';')
\ No newline at end of file
+        reduce_results(self.results, self.reduce_group).round(1).to_csv(DirectoryResultWriter.base_dir / (res_file_name + '.csv'), sep=';')
+
+
+class BatchResultWriter():
+    '''Writes the results of all scenarios of a batch to one file, with the scenario name and PTU as index'''
+
+    def __init__(self, results: List[Results], names: List[str], reduce_group: List[DeviceType]) -> None:
+        if len(results) != len(names):
+            raise AssertionError("Every result of the batch should have a scenario name")
+        if not DirectoryResultWriter.base_dir.exists():
+            DirectoryResultWriter.base_dir.mkdir()
+        self.reduce_group = reduce_group
+        self.results = results
+        self.names = names
+
+    def write(self) -> Path:
+        reduced = [reduce_results(r, self.reduce_group) for r in self.results]
+        # The devices in the scenarios can differ, a column is empty for scenarios without that device
+        results = pd.concat(reduced, keys=self.names, names=['scenario', 'ptu'])
+        results = results[[c for c in results.columns if c != 'baseline'] + ['baseline']]
+        res_file = DirectoryResultWriter.base_dir / (datetime.datetime.now().strftime("%Y-%m-%d_%H-%M") + '_batch.csv')
+        results.round(1).to_csv(res_file, sep=';')
+        return res_file
+
+
+class SweepResultWriter():
+    '''Writes the results of a sweep over all congestion periods to a npz file (the cubes) or a parquet file (long format)'''
+    file_formats: List[str] = ['npz', 'parquet']
+
+    def __init__(self, results: SweepResults, file_format: str = 'npz') -> None:
+        if file_format not in SweepResultWriter.file_formats:
+            raise AssertionError(f"Unknown file format '{file_format}', use one of: " + ", ".join(SweepResultWriter.file_formats))
+        if not DirectoryResultWriter.base_dir.exists():
+            DirectoryResultWriter.base_dir.mkdir()
+        self.results = results
+        self.file_format = file_format
+
+    def write(self) -> Path:
+        res_file = DirectoryResultWriter.base_dir / (datetime.datetime.now().strftime("%Y-%m-%d_%H-%M") + '_sweep.' + self.file_format)
+        if self.file_format == 'npz':
+            np.savez_compressed(res_file, **self.results.to_arrays())
+        else:
+            self.results.to_frame().to_parquet(res_file, index=False)
+        return res_file
+
+
+def reduce_results(results: Results, reduce_group: List[DeviceType]) -> pd.DataFrame:
+    '''Return the flex profiles, with the devices of the reduce group summed per device type, and the total baseline'''
+    reduced = results.flex_profiles()
+    for device_type in reduce_group:
+        columns_to_reduce = reduced.filter(regex="flex_" + str(device_type).lower() + "_")
+        if len(columns_to_reduce.columns) > 0:
+            reduced.drop(list(columns_to_reduce), axis=1, inplace=True)
+            reduced["flex_" + str(device_type).lower()] = columns_to_reduce.sum(axis=1)
+    reduced['baseline'] = results.baselines().sum(axis=1)
+    return reduced
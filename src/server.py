@@ -0,0 +1,217 @@
+import json
+import select
+import threading
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from time import monotonic
+from typing import Any, Dict, Final, Tuple
+
+from sqlalchemy import Engine, text
+
+from db.data_not_found_exception import DataNotFoundException
+from db.profile_cache import ProfileCache
+from db.read_only_engine import DEFAULT_MMAP_SIZE, create_read_only_engine
+from flex_metrics import FlexMetrics
+from util.config_converter import JsonConverter
+
+'''
+Long-running HTTP/JSON service that keeps the flex metrics tool warm: the modules are imported once, and the database
+connections and the profile cache are shared by all requests.
+
+Endpoints:
+    POST /flex-power    scenario in JSON (the keys of the toml config), returns the results of FlexMetrics.determine_flex_power
+    POST /baselines     scenario in JSON, returns the baselines of FlexMetrics.fetch_baselines for all PTU of the day
+    GET  /health        returns {"status": "ok"}
+
+Usage (from the repository root): python src/server.py [--port 8080] [--workers 8]
+'''
+
+DB_FILE: Final[str]="flex-metrics.db"
+# Seconds a keep-alive connection may wait for its next request
+DEFAULT_KEEP_ALIVE_TIMEOUT: Final[float]=5.0
+
+
+class PooledHTTPServer(HTTPServer):
+    '''
+    HTTP server that handles the connections in a fixed pool of worker threads. A worker keeps a keep-alive connection
+    until it is idle for keep_alive_timeout seconds, or until other connections wait for a worker (see PooledRequestHandler).
+    '''
+    # Connections that are not accepted yet, the accepting thread shares the interpreter with the busy workers
+    request_queue_size = 128
+
+    def __init__(self, address: Tuple[str, int], handler: type, workers: int, keep_alive_timeout: float = DEFAULT_KEEP_ALIVE_TIMEOUT) -> None:
+        super().__init__(address, handler)
+        self.workers = workers
+        self.keep_alive_timeout = keep_alive_timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="flex-metrics-worker")
+        self.__open_connections = 0
+        self.__lock = threading.Lock()
+
+    def has_waiting_connections(self) -> bool:
+        '''True if accepted connections wait for a free worker'''
+        return self.__open_connections > self.workers
+
+    def process_request(self, request, client_address):
+        with self.__lock:
+            self.__open_connections += 1
+        self.executor.submit(self.__process_request, request, client_address)
+
+    def __process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.__lock:
+                self.__open_connections -= 1
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+
+class PooledRequestHandler(BaseHTTPRequestHandler):
+    '''
+    Keep-alive request handler for a PooledHTTPServer. An idle connection occupies a worker, so the handler doesn't block
+    on the next request: it closes the connection when it is idle for the keep-alive timeout of the server, or as soon
+    as other connections wait for a worker.
+    '''
+    protocol_version = "HTTP/1.1"
+    server: PooledHTTPServer
+    # Seconds a client may stall in the middle of a request
+    timeout = 30
+    # Seconds between the checks for waiting connections while a connection is idle
+    IDLE_POLL_INTERVAL: float = 0.05
+    # Seconds a new connection may take to send its first request before it is closed for waiting connections,
+    # the first request of a client that connected just now may still be on its way
+    FIRST_REQUEST_GRACE: float = 0.5
+
+    def handle(self):
+        self.close_connection = False
+        yield_after = monotonic() + self.FIRST_REQUEST_GRACE
+        while not self.close_connection and self.__wait_for_request(yield_after):
+            self.handle_one_request()
+            yield_after = 0.0
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        if self.server.has_waiting_connections():
+            # Tell the client this connection closes after the response, and free the worker for a waiting connection
+            self.send_header("Connection", "close")
+
+    def __wait_for_request(self, yield_after: float) -> bool:
+        '''
+        Return True when the next request arrived, False if the connection should be closed.
+        The connection is not closed for waiting connections before the monotonic time yield_after.
+        '''
+        deadline = monotonic() + self.server.keep_alive_timeout
+        readable = False
+        while True:
+            if self.__peek():
+                return True
+            if readable:
+                # Readable without data: the client closed the connection
+                return False
+            now = monotonic()
+            if now >= deadline or (now >= yield_after and self.server.has_waiting_connections()):
+                return False
+            readable = bool(select.select([self.connection], [], [], self.IDLE_POLL_INTERVAL)[0])
+
+    def __peek(self) -> bytes:
+        '''Return the received data that is not read yet without blocking, a pipelined request may already be buffered'''
+        self.connection.settimeout(0)
+        try:
+            return self.rfile.peek(1)
+        finally:
+            self.connection.settimeout(self.timeout)
+
+
+class FlexMetricsServer(PooledHTTPServer):
+
+    def __init__(self, address: Tuple[str, int], db_file: Path, workers: int = 8, mmap_size: int = DEFAULT_MMAP_SIZE,
+                 keep_alive_timeout: float = DEFAULT_KEEP_ALIVE_TIMEOUT) -> None:
+        '''
+        Args:
+            workers: amount of requests that are handled concurrently, every worker can use its own database connection.
+            keep_alive_timeout: seconds a keep-alive connection may wait for its next request.
+        '''
+        super().__init__(address, FlexMetricsRequestHandler, workers, keep_alive_timeout)
+        self.db_file = db_file
+        self.engine: Engine = create_read_only_engine(db_file, pool_size=workers, mmap_size=mmap_size)
+        self.cache = ProfileCache.shared(db_file)
+        # Open the first connection now instead of on the first request
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    def flex_metrics(self, scenario: Dict[str, Any]) -> FlexMetrics:
+        conf = JsonConverter(scenario).convert()
+        conf.is_valid()
+        return FlexMetrics(conf, self.db_file, self.cache, engine=self.engine)
+
+    def server_close(self):
+        super().server_close()
+        self.engine.dispose()
+
+
+class FlexMetricsRequestHandler(PooledRequestHandler):
+    # Keep-alive connections (see PooledRequestHandler), clients send many small requests
+    server: FlexMetricsServer
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.__reply(200, {"status": "ok"})
+        else:
+            self.__reply(404, {"error": f"Unknown path '{self.path}'"})
+
+    def do_POST(self):
+        try:
+            scenario = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if self.path == "/flex-power":
+                self.__reply(200, self.server.flex_metrics(scenario).determine_flex_power().to_dict())
+            elif self.path == "/baselines":
+                baselines = self.server.flex_metrics(scenario).fetch_baselines()
+                self.__reply(200, baselines.astype(object).where(baselines.notna(), None).to_dict(orient='list'))
+            else:
+                self.__reply(404, {"error": f"Unknown path '{self.path}'"})
+        except DataNotFoundException as e:
+            self.__reply(404, {"error": str(e)})
+        except (ValueError, TypeError, AssertionError) as e:
+            self.__reply(400, {"error": "Scenario invalid. " + str(e)})
+        except Exception as e:
+            self.log_error("Request failed: %r", e)
+            self.__reply(500, {"error": str(e)})
+
+    def __reply(self, status: int, body: Dict[str, Any]):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(prog="src/server.py", description="Flex Metrics Tool scenario server")
+    parser.add_argument('--host', default="127.0.0.1", help="address to listen on")
+    parser.add_argument('-p', '--port', type=int, default=8080, help="port to listen on")
+    parser.add_argument('-w', '--workers', type=int, default=8, help="amount of requests that are handled concurrently")
+    parser.add_argument('--mmap-size', type=int, default=DEFAULT_MMAP_SIZE, help="amount of bytes of the database that is memory-mapped")
+    parser.add_argument('--keep-alive-timeout', type=float, default=DEFAULT_KEEP_ALIVE_TIMEOUT, help="seconds a keep-alive connection may wait for its next request")
+    args = parser.parse_args()
+
+    db_path = Path(DB_FILE) if Path(DB_FILE).exists() else Path("_internal") / DB_FILE
+    if not db_path.exists():
+        print("Database file is missing. Cannot run the flex metrics server.\nExiting...")
+        exit(1)
+
+    server = FlexMetricsServer((args.host, args.port), db_path, args.workers, args.mmap_size, args.keep_alive_timeout)
+    print(f"Serving flex metrics of '{db_path}' on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,23 +1,30 @@
 from argparse import ArgumentParser
+from dataclasses import dataclass, field
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Set, Tuple
 
-import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, select, text, update
 from sqlalchemy.orm import Session
 
 from db.baselines_dao import BaselineDao
 from db.flex_devices_dao import FlexDevicesDao
-from db.models import Baseline, FlexMetric
-from experiment.experiment_container import ExperimentContainer
+from db.models import DB_SCHEMA_VERSION, Baseline, FlexMetric, SourceFile
+from db.lookup_keys import BaselineKey
+from db.profile_codec import convert_legacy_profile
+from db.scenario_aggregates_dao import ScenarioAggregatesDao, ptu_of_day
+from db.source_files_dao import SourceFilesDao, file_hash
+from experiment.experiment import Experiment
 from experiment.experiment_description import DeviceType, ExperimentDescription
 from experiment.experiment_filter import ExperimentFilter
 
+from experiment.dataset_layout import iter_files
 from experiment.experiment_loader import DataSource, ExperimentLoader
 from flex_metric_config import DEFAULT_PV_GROUP
-from util.conflex import (GmContext, get_daily_sjv_expectation_values, readGM)
+from to_parquet import PARQUET_BASE_PATH, group_of_file
+from util.conflex import GmContext, get_sjv_expectation_values, readGM
 
 BASE_PATH=Path('data')
 
@@ -29,6 +36,17 @@ HP_SHIFTED=BASE_PATH / 'hp/shifted-12/'
 
 HHP_BASELINES=BASE_PATH / 'hhp/baselines/'
 
+# Amount of experiments that are loaded and written at a time
+STREAM_CHUNK_SIZE=1000
+
+def set_input_base_path(base_path: Path):
+    '''Read the experiment input data from another base directory, e.g. the parquet dataset created by to_parquet.py'''
+    global EV_BASELINES, EV_SHIFTED, HP_BASELINES, HP_SHIFTED, HHP_BASELINES
+    EV_BASELINES=base_path / 'ev-elaad/ev/baselines/'
+    EV_SHIFTED=base_path / 'ev-elaad/ev/shifted/'
+    HP_BASELINES=base_path / 'hp/baselines/'
+    HP_SHIFTED=base_path / 'hp/shifted-12/'
+    HHP_BASELINES=base_path / 'hhp/baselines/'
 
 SJV_PV_GM_DIR=BASE_PATH / 'SJV-PV-GM-input'
 
@@ -37,13 +55,96 @@ JRC_PVGIS_FILE=BASE_PATH / 'jrc-pvgis-2015-residential.csv'
 engine = create_engine("sqlite:///flex-metrics.db", echo=False)
 
 
+@event.listens_for(engine, "connect")
+def set_load_pragmas(dbapi_connection, connection_record):
+    # This program only does bulk loads. Losing the database on an OS crash during a load is acceptable, it can be rebuilt from the input files.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.close()
+
+def finish_load():
+    '''
+    Merge the write-ahead log into the database file, so that the database is a single self-contained file again.
+    Later connections of the engine use the default, safe settings.
+    '''
+    if event.contains(engine, "connect", set_load_pragmas):
+        event.remove(engine, "connect", set_load_pragmas)
+    engine.dispose()
+    with engine.connect() as conn:
+        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        conn.execute(text("PRAGMA journal_mode=DELETE"))
+    engine.dispose()
+
+
 def drop_database_tables():
     FlexMetric.metadata.drop_all(engine)
     Baseline.metadata.drop_all(engine)
 
 def create_database_tables():
+    new_database = not inspect(engine).has_table(FlexMetric.__tablename__)
     FlexMetric.metadata.create_all(engine)
     Baseline.metadata.create_all(engine)
+    if new_database:
+        set_schema_version(DB_SCHEMA_VERSION)
+
+def get_schema_version() -> int:
+    with engine.connect() as conn:
+        return conn.execute(text("PRAGMA user_version")).scalar()
+
+def set_schema_version(version: int):
+    with engine.connect() as conn:
+        conn.execute(text(f"PRAGMA user_version = {int(version)}"))
+        conn.commit()
+
+def migrate_database():
+    '''
+    Upgrade a database created by an older version of this tool to the current schema version.
+    '''
+    version = get_schema_version()
+    if version >= DB_SCHEMA_VERSION:
+        print(f"Database schema version is {version}. No migration needed.")
+        return
+    print(f"Migrating database from schema version {version} to {DB_SCHEMA_VERSION}...")
+    if version < 1:
+        convert_profiles()
+        set_schema_version(1)
+    if version < 2:
+        create_lookup_indexes()
+        set_schema_version(2)
+    if version < 3:
+        # The source_files table is created by create_database_tables, it is filled by the next (incremental) write
+        set_schema_version(3)
+    if version < 4:
+        # The scenario_aggregates table is created by create_database_tables, it is only filled on request (--scenario-aggregates)
+        set_schema_version(4)
+
+def convert_profiles():
+    '''
+    Convert the pickled profiles to the binary profile format.
+    '''
+    with Session(engine) as session:
+        rows = session.execute(select(FlexMetric.id, FlexMetric.flex_metric)).all()
+        if rows:
+            session.execute(update(FlexMetric), [{"id": r.id, "flex_metric": convert_legacy_profile(r.flex_metric)} for r in rows])
+        print(f"Converted {len(rows)} flex metrics.")
+        rows = session.execute(select(Baseline.id, Baseline.mean_power, Baseline.p95)).all()
+        if rows:
+            session.execute(update(Baseline), [{"id": r.id,
+                                                "mean_power": convert_legacy_profile(r.mean_power) if r.mean_power else None,
+                                                "p95": convert_legacy_profile(r.p95) if r.p95 else None} for r in rows])
+        print(f"Converted {len(rows)} baselines.")
+        session.commit()
+
+def create_lookup_indexes():
+    for index in list(FlexMetric.__table__.indexes) + list(Baseline.__table__.indexes):
+        index.create(engine, checkfirst=True)
+        print(f"Created index {index.name}.")
+    with engine.connect() as conn:
+        conn.execute(text("ANALYZE"))
+        conn.commit()
 
 def delete_device_type(device_type: DeviceType):
     with Session(engine) as session:
@@ -51,102 +152,251 @@ def delete_device_type(device_type: DeviceType):
         doa.delete_device_type(device_type)
         baseline_dao = BaselineDao(session)
         baseline_dao.delete_device_type(device_type)
+        SourceFilesDao(session).delete_device_type(device_type)
+        ScenarioAggregatesDao(session).delete_device_type(device_type)
 
-def ev_from_file_to_db(data_source: DataSource):
-    areas = set(map(lambda e: ExperimentDescription(e.stem, DeviceType.EV).group, EV_SHIFTED.iterdir()))
-    print(f"Writing EV flex metrics to database. Amount of groups: {len(areas)}")
+@dataclass
+class SourceChanges():
+    '''Difference between the input files of an asset type and the manifest in the database'''
+    new: List[Path] = field(default_factory=list)
+    changed: List[Path] = field(default_factory=list)
+    removed: List[SourceFile] = field(default_factory=list)
+    # Files with a new modification time, but the same content
+    touched: List[Path] = field(default_factory=list)
+    unchanged: int = 0
 
-    for i, area in enumerate(areas):
-        load_filter = ExperimentFilter().with_group(area)
-        all_experiments: ExperimentContainer = ExperimentLoader(EV_BASELINES, EV_SHIFTED, data_source).load_experiments(load_filter)
+    def print(self, asset_type: str, verbose: bool):
+        print(f"{asset_type}: {len(self.new)} new, {len(self.changed)} changed, {len(self.removed)} removed and {self.unchanged + len(self.touched)} unchanged input files.")
+        if verbose:
+            for label, paths in [('new', self.new), ('changed', self.changed), ('removed', [s.path for s in self.removed])]:
+                for p in paths:
+                    print(f"\t{label}: {p}")
 
+def find_source_changes(files: List[Path], manifest: Dict[str, SourceFile], force: bool = False) -> SourceChanges:
+    '''
+    Compare the input files with the manifest. Files with the same size and modification time are not read,
+    the content hash is only compared for files of the same size with another modification time.
+    '''
+    changes = SourceChanges()
+    for f in files:
+        entry = manifest.get(str(f))
+        if entry is None:
+            changes.new.append(f)
+            continue
+        stat = f.stat()
+        if force or stat.st_size != entry.size:
+            changes.changed.append(f)
+        elif stat.st_mtime_ns == entry.mtime_ns:
+            changes.unchanged += 1
+        elif file_hash(f) == entry.hash:
+            changes.touched.append(f)
+        else:
+            changes.changed.append(f)
+    paths = set(map(str, files))
+    changes.removed = [s for p, s in manifest.items() if p not in paths]
+    return changes
+
+def delete_sources(session: Session, asset_type: str, sources: List[SourceFile]):
+    '''Delete the rows produced by the input files and the files from the manifest'''
+    FlexDevicesDao(session).delete_ids([i for s in sources for i in s.flex_metric_ids], commit=False)
+    BaselineDao(session).delete_ids(list({i for s in sources for i in s.baseline_ids}), commit=False)
+    SourceFilesDao(session).delete_paths(asset_type, [s.path for s in sources], commit=False)
+
+def touch_sources(asset_type: str, files: List[Path]):
+    with Session(engine) as session:
+        dao = SourceFilesDao(session)
+        for f in files:
+            dao.set_mtime(asset_type, str(f), f.stat().st_mtime_ns, commit=False)
+        session.commit()
+
+def experiments_to_db(session: Session, experiments: Iterable[Experiment], chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+    '''
+    Write the flex metrics and baselines of a stream of experiments in chunks of chunk_size experiments, in the transaction of the session.
+    Only one chunk of experiments is kept in memory, so the memory use doesn't depend on the amount of experiments.
+    Returns the amount of written experiments.
+    '''
+    written = 0
+    experiments = iter(experiments)
+    flex_dao, baseline_dao = FlexDevicesDao(session), BaselineDao(session)
+    while chunk := list(islice(experiments, chunk_size)):
+        flex_dao.upsert([FlexDevicesDao.to_db_values(e) for e in chunk], commit=False)
+        # Baselines of later chunks overwrite those of earlier chunks, like the last experiment wins within a chunk
+        baseline_dao.save_experiments(chunk, commit=False)
+        written += len(chunk)
+    return written
+
+def experiment_files_to_db(asset_type: str, loader: ExperimentLoader, workers: int = 1, dry_run: bool = False, force: bool = False):
+    '''
+    Write the experiments of the groups with new, changed or removed input files.
+    The experiments of a group share their baselines, so a group is always written as a whole.
+    '''
+    device_type = loader.file_loader.get_device_type()
+    shifted_files = {f: d.group for f in iter_files(loader.file_loader.shifted_dir) if (d := ExperimentDescription.try_parse(f.stem, device_type)) is not None}
+    baseline_files = {f: group_of_file(f.stem, device_type) for f in iter_files(loader.file_loader.baselines_dir) if f.suffix in ['.csv', '.parquet']}
+    file_groups = {**shifted_files, **baseline_files}
+    with Session(engine) as session:
+        manifest = SourceFilesDao(session).get_source_files(asset_type)
+    changes = find_source_changes(list(file_groups.keys()), manifest, force)
+    groups = sorted({file_groups[f] for f in changes.new + changes.changed} | {s.group for s in changes.removed})
+    changes.print(asset_type, dry_run)
+    print(f"Writing {device_type} flex metrics to database. Amount of groups to write: {len(groups)}")
+    if dry_run:
+        return
+    touch_sources(asset_type, changes.touched)
+
+    for i, group in enumerate(groups):
+        shifted_paths = {f.stem: f for f, g in shifted_files.items() if g == group}
+        baseline_paths = {f.stem: f for f, g in baseline_files.items() if g == group}
+        produced: Dict[Path, Tuple[List[str], Set[str]]] = {f: ([], set()) for f in list(shifted_paths.values()) + list(baseline_paths.values())}
+
+        def record_produced(experiments: Iterable[Experiment]) -> Iterator[Experiment]:
+            for e in experiments:
+                baseline_id = BaselineDao.to_db_id(e.exp_des.device_type, e.exp_des.typical_day, e.exp_des.group)
+                produced[shifted_paths[e.exp_des.name]][0].append(e.exp_des.name)
+                produced[shifted_paths[e.exp_des.name]][1].add(baseline_id)
+                if e.exp_des.get_baseline_file_name() in baseline_paths:
+                    produced[baseline_paths[e.exp_des.get_baseline_file_name()]][1].add(baseline_id)
+                yield e
+
+        # The baselines of the group are checked before anything is deleted
+        experiments = loader.iter_experiments(ExperimentFilter().with_group(group), workers) if shifted_paths else []
+        # The old rows, the new rows and the manifest of the group are written in one transaction, a failed load leaves the group as it was
         with Session(engine) as session:
-            doa = FlexDevicesDao(session)
-            doa.save_container(all_experiments)
-            baseline_dao = BaselineDao(session)
-            for e in all_experiments.exp.values():
-                baseline_dao.save_experiment(e)
-        print(f"Written {i + 1} / {len(areas)} groups to database.")
-
-def hp_from_file_to_db():
-    descriptions = list(map(lambda e: ExperimentDescription(e.stem, DeviceType.HP), HP_SHIFTED.iterdir()))
-    hh_types = set(map(lambda x : x.group, descriptions))
-    print(f"Writing HP flex metrics to database. Amount of household types: {len(hh_types)}")
-    
-    for i, hh_type in enumerate(hh_types):
-        load_filter = ExperimentFilter().with_group(hh_type)
-        
-        hp_experiments = ExperimentLoader(baselines_dir=HP_BASELINES, shifted_dir=HP_SHIFTED).load_experiments(load_filter)
-        with Session(engine) as session:
-            doa = FlexDevicesDao(session)
-            baseline_dao = BaselineDao(session)
-            doa.save_container(hp_experiments)
-            for e in hp_experiments.exp.values():
-                baseline_dao.save_experiment(e)
-        print(f"Written {i + 1} / {len(hh_types)} household_types to database.")
-
-def hhp_from_file_to_db():
-    for f in HHP_BASELINES.iterdir():
-        print(f)
-        if f.suffix == '.csv':
-            df_baseline = pd.read_csv(f, sep=';', decimal=',', index_col=0, parse_dates=True)
-            for month_idx in range(1,13):            
-                df_month: pd.DataFrame = df_baseline.loc[df_baseline.index.month == month_idx]
-                df_month_w_tod: pd.DataFrame = df_month.copy()
-                df_month_w_tod['Time'] = df_month_w_tod.index.time
-                df_month_avg: pd.DataFrame = df_month_w_tod.groupby('Time').mean()
-                month = datetime(2020, month_idx, 1).strftime('%B')
-                group_elements: List[str] = f.stem.removeprefix("baselines+").split('+')
-                group = f"{group_elements[0]}+{group_elements[1]}+{group_elements[2].removeprefix('status')}".replace(' ', '_').lower()
-                with Session(engine) as session:
-                    doa = BaselineDao(session)
-                    doa.save(device_type=DeviceType.HHP, typical_day=f"{month}_avg".lower(), group=group, mean_power=df_month_avg.mean(axis=1).round(2))
-                    doa.save(device_type=DeviceType.HHP, typical_day=f"{month}_15th".lower(), group=group, mean_power=df_month.loc[df_month.index.day == 15].mean(axis=1))
+            delete_sources(session, asset_type, [s for s in manifest.values() if s.group == group])
+            experiments_to_db(session, record_produced(experiments))
+            SourceFilesDao(session).upsert([SourceFilesDao.to_db_values(asset_type, f, device_type, group, flex_ids, sorted(baseline_ids)) for f, (flex_ids, baseline_ids) in produced.items()], commit=False)
+            session.commit()
+        print(f"Written {i + 1} / {len(groups)} groups to database.")
+
+def files_to_db(asset_type: str, device_type: DeviceType, files: List[Path], to_rows: Callable[[Path], List[Dict[str, Any]]], dry_run: bool = False, force: bool = False):
+    '''
+    Write the baseline rows of the new and changed input files and delete the rows of removed input files.
+    '''
+    with Session(engine) as session:
+        manifest = SourceFilesDao(session).get_source_files(asset_type)
+    changes = find_source_changes(files, manifest, force)
+    changes.print(asset_type, dry_run)
+    if dry_run:
+        return
+    touch_sources(asset_type, changes.touched)
+    with Session(engine) as session:
+        delete_sources(session, asset_type, [manifest[str(f)] for f in changes.changed] + changes.removed)
+        for f in changes.new + changes.changed:
+            rows = to_rows(f)
+            BaselineDao(session).upsert(rows, commit=False)
+            group = group_of_file(f.stem, device_type) if device_type == DeviceType.HHP else ''
+            SourceFilesDao(session).upsert([SourceFilesDao.to_db_values(asset_type, f, device_type, group, [], [r['id'] for r in rows])], commit=False)
+        session.commit()
+
+def scenario_aggregates_to_db(device_type: DeviceType):
+    '''
+    Rebuild the precomputed scenario profiles of a device type from its flex metrics and baselines in the database.
+    '''
+    with Session(engine) as session:
+        flex_metrics = FlexDevicesDao(session).get_flex_metrics_of_device_type(device_type)
+        baseline_keys = {flex_id: BaselineKey(k.device_type, k.group, k.typical_day) for flex_id, (k, _) in flex_metrics.items()}
+        baselines = BaselineDao(session).get_baseline_means_bulk(list(set(baseline_keys.values())))
+        rows = []
+        for flex_id, (key, flex_metric) in flex_metrics.items():
+            start = ptu_of_day(key.cong_start)
+            baseline_mean = baselines[baseline_keys[flex_id]][start:start + key.cong_duration]
+            if len(baseline_mean) != len(flex_metric):
+                print(f"Warning: no scenario aggregate for {str(key)}, the congestion period doesn't fit in the baseline")
+                continue
+            rows.append(ScenarioAggregatesDao.to_db_values(flex_id, key, baseline_mean, flex_metric))
+        dao = ScenarioAggregatesDao(session)
+        dao.delete_device_type(device_type, commit=False)
+        dao.upsert(rows, commit=False)
+        session.commit()
+    print(f"Written {len(rows)} {device_type} scenario aggregates to database.")
+
+def has_scenario_aggregates(device_type: DeviceType) -> bool:
+    with Session(engine) as session:
+        return ScenarioAggregatesDao(session).has_device_type(device_type)
+
+def ev_from_file_to_db(data_source: DataSource, workers: int = 1, dry_run: bool = False, force: bool = False):
+    asset_type = 'ev-elaad' if data_source == DataSource.ELAAD_AGG else 'ev'
+    experiment_files_to_db(asset_type, ExperimentLoader(EV_BASELINES, EV_SHIFTED, data_source), workers, dry_run, force)
+
+def hp_from_file_to_db(workers: int = 1, dry_run: bool = False, force: bool = False):
+    experiment_files_to_db('hp', ExperimentLoader(baselines_dir=HP_BASELINES, shifted_dir=HP_SHIFTED, data_source=DataSource.GO_E), workers, dry_run, force)
+
+def hhp_from_file_to_db(dry_run: bool = False, force: bool = False):
+    files = []
+    for f in iter_files(HHP_BASELINES):
+        if f.suffix in ['.csv', '.parquet']:
+            files.append(f)
         else:
             print(f"Warning: cannot load file: {f}")
+    files_to_db('hhp', DeviceType.HHP, files, hhp_file_rows, dry_run, force)
+
+def hhp_file_rows(f: Path) -> List[Dict[str, Any]]:
+    print(f)
+    rows = []
+    if f.suffix == '.csv':
+        df_baseline = pd.read_csv(f, sep=';', decimal=',', index_col=0, parse_dates=True)
+    else:
+        df_baseline = pd.read_parquet(f)
+    for month_idx in range(1,13):            
+        df_month: pd.DataFrame = df_baseline.loc[df_baseline.index.month == month_idx]
+        df_month_w_tod: pd.DataFrame = df_month.copy()
+        df_month_w_tod['Time'] = df_month_w_tod.index.time
+        df_month_avg: pd.DataFrame = df_month_w_tod.groupby('Time').mean()
+        month = datetime(2020, month_idx, 1).strftime('%B')
+        group = group_of_file(f.stem, DeviceType.HHP)
+        rows.append(BaselineDao.to_db_values(device_type=DeviceType.HHP, typical_day=f"{month}_avg".lower(), group=group, mean_power=df_month_avg.mean(axis=1).round(2)))
+        rows.append(BaselineDao.to_db_values(device_type=DeviceType.HHP, typical_day=f"{month}_15th".lower(), group=group, mean_power=df_month.loc[df_month.index.day == 15].mean(axis=1)))
+    return rows
         
         
-def jrc_pvgis_file_to_db():
+def jrc_pvgis_file_to_db(dry_run: bool = False, force: bool = False):
     print("Writing pv profiles based on jrc pvgis to database...")
     if JRC_PVGIS_FILE.suffix == '.csv':    
-        df_baseline = pd.read_csv(JRC_PVGIS_FILE, sep=';', index_col=0, header=0, parse_dates=True)
-        df_baseline *= 0.86 # apply 14% system losses (cable, inverter, dust, degration etc.)
-        df_baseline = df_baseline.tz_convert("Europe/Amsterdam")
-        df_baseline = df_baseline.resample("15min").interpolate()
-        for month_idx in range(1,13):            
-            df_month: pd.DataFrame = df_baseline.loc[df_baseline.index.month == month_idx]
-            df_month_w_tod: pd.DataFrame = df_month.copy()
-            df_month_w_tod['Time'] = df_month_w_tod.index.time
-            df_month_avg: pd.DataFrame = df_month_w_tod.groupby('Time').mean() * -1
-            month = datetime(2020, month_idx, 1).strftime('%B')
-            group = DEFAULT_PV_GROUP
-            with Session(engine) as session:
-                doa = BaselineDao(session)
-                doa.save(device_type=DeviceType.PV, typical_day=month.lower(), group=group, mean_power=df_month_avg.mean(axis=1))
+        files_to_db('pv', DeviceType.PV, [JRC_PVGIS_FILE], jrc_pvgis_rows, dry_run, force)
     else: 
          print(f"Warning: cannot load input file: {JRC_PVGIS_FILE}")
 
-def gm_types():
-    gm_df = readGM(SJV_PV_GM_DIR / 'GM-types GO-e.xlsx')
+def jrc_pvgis_rows(f: Path) -> List[Dict[str, Any]]:
+    df_baseline = pd.read_csv(f, sep=';', index_col=0, header=0, parse_dates=True)
+    df_baseline *= 0.86 # apply 14% system losses (cable, inverter, dust, degration etc.)
+    df_baseline = df_baseline.tz_convert("Europe/Amsterdam")
+    df_baseline = df_baseline.resample("15min").interpolate()
+    rows = []
+    for month_idx in range(1,13):            
+        df_month: pd.DataFrame = df_baseline.loc[df_baseline.index.month == month_idx]
+        df_month_w_tod: pd.DataFrame = df_month.copy()
+        df_month_w_tod['Time'] = df_month_w_tod.index.time
+        df_month_avg: pd.DataFrame = df_month_w_tod.groupby('Time').mean() * -1
+        month = datetime(2020, month_idx, 1).strftime('%B')
+        group = DEFAULT_PV_GROUP
+        rows.append(BaselineDao.to_db_values(device_type=DeviceType.PV, typical_day=month.lower(), group=group, mean_power=df_month_avg.mean(axis=1)))
+    return rows
+
+def gm_types(dry_run: bool = False, force: bool = False):
+    files_to_db('sjv', DeviceType.SJV, [SJV_PV_GM_DIR / 'GM-types GO-e.xlsx'], gm_type_rows, dry_run, force)
+
+def gm_type_rows(gm_file: Path) -> List[Dict[str, Any]]:
+    gm_df = readGM(gm_file)
     sunset_rise = pd.read_csv(SJV_PV_GM_DIR / 'sunset-sunrise.csv', delimiter=';', index_col=0)
 
     gm_types = ["sjv500", "sjv1000", "sjv1500", "sjv2000", "sjv2500", "sjv3000", "sjv3500", "sjv4000", "sjv4500", "sjv5000", "sjv6000", "sjv7000", "sjv8000", "sjv9000", "sjv10000", "sjv15000", "PV"]
     day_types = ["Workday", "Weekend"]
 
     gm_context = [GmContext(day_type, month_idx, t) for day_type in day_types for month_idx in range(1, 13) for t in gm_types]
+    sjv_types = [t for t in gm_types if t.startswith('sjv')]
+    # Convert expectation values from kW to W
+    sjv_expectation_values = get_sjv_expectation_values(sjv_types, gm_df, day_types) * 1000
+    rows = []
         
     for gmc in gm_context:
         group: str
         month = datetime(2020, gmc.month_idx, 1).strftime('%B')
         if gmc.gm_type.startswith('sjv'):
-            # Convert expectation values from kW to W
-            expectation_value = np.array(get_daily_sjv_expectation_values(gmc.gm_type, gm_df, gmc.day_type, gmc.month_idx)) * 1000
+            expectation_value = sjv_expectation_values[sjv_types.index(gmc.gm_type), day_types.index(gmc.day_type), gmc.month_idx - 1]
             group = gmc.gm_type
             device_type = DeviceType.SJV
             typical_day=f"{month}_{gmc.day_type}".lower()
-            with Session(engine) as session:
-                doa = BaselineDao(session)
-                doa.save(device_type=device_type, typical_day=typical_day, group=group.lower(), mean_power=expectation_value)
+            rows.append(BaselineDao.to_db_values(device_type=device_type, typical_day=typical_day, group=group.lower(), mean_power=expectation_value))
         if gmc.gm_type.startswith('PV'):
             # It seems that the profiles are normalized to 1, so no need to scale
             # expectation_value = get_daily_pv_expectation_values(gmc.gm_type, gm_df, sunset_rise, gmc.day_type, gmc.month_idx)
@@ -155,6 +405,7 @@ def gm_types():
             # typical_day=f"{month}".lower()
             print("Skipping PV because the PV profiles are not so good. We use the profiles from the JRC pvgis instead.")
         print(f"{gmc.gm_type} - {month} - {gmc.day_type}")
+    return rows
 
 
 def main() :
@@ -162,37 +413,67 @@ def main() :
     parser.add_argument('-d', '--drop', action='store_true', help="delete data before write. if combined with --all, all data is dropped from the database. if combined with --asset_type, only data for those assets is deleted")
     parser.add_argument('-a', '--all', action="store_true", help="write data for all asset types")
     parser.add_argument('-t', '--asset_type', choices=['ev', 'ev-elaad', 'hp', 'sjv', 'pv', 'hhp'], nargs="+", help="select for which asset type data to write")
+    parser.add_argument('-j', '--workers', type=int, default=1, help="amount of processes used to load the experiment files")
+    parser.add_argument('-p', '--parquet', action="store_true", help=f"read the input data from the parquet dataset in '{PARQUET_BASE_PATH}' (see to_parquet.py)")
+    parser.add_argument('-m', '--migrate', action="store_true", help="upgrade an existing database to the current schema version")
+    parser.add_argument('-n', '--dry-run', action="store_true", help="only report which input files are new, changed or removed since the last write, without writing")
+    parser.add_argument('-f', '--force', action="store_true", help="write all input files, also those that didn't change since the last write")
+    parser.add_argument('-s', '--scenario-aggregates', action="store_true", help="also write the precomputed scenario profiles of the written flexible devices (ev, hp). Once written, later writes keep them up to date")
 
     args = parser.parse_args()
 
+    if args.parquet:
+        set_input_base_path(PARQUET_BASE_PATH)
+    # A dry run doesn't change the database
+    drop = args.drop and not args.dry_run
+
     create_database_tables()
 
+    if args.migrate:
+        migrate_database()
+    elif get_schema_version() < DB_SCHEMA_VERSION:
+        print("WARNING: the database has an old schema version. Run with --migrate to upgrade it.")
+    # Determined before any data is dropped, so that dropped scenario profiles are written again
+    write_scenario_aggregates = {device_type: args.scenario_aggregates or has_scenario_aggregates(device_type) for device_type in [DeviceType.EV, DeviceType.HP]}
+
     if args.all or (args.asset_type and 'ev' in args.asset_type):
-        if args.drop and args.asset_type == 'ev':
+        if drop and args.asset_type == 'ev':
             print("NOT supported to delete EV data because there are multiple sources of the data")
             # delete_device_type(DeviceType.EV)
-        ev_from_file_to_db(DataSource.GO_E)
+        ev_from_file_to_db(DataSource.GO_E, args.workers, args.dry_run, args.force)
     if args.all or (args.asset_type and 'ev-elaad' in args.asset_type):
-        if args.drop and args.asset_type == 'ev-elaad':
+        if drop and args.asset_type == 'ev-elaad':
             print("NOT supported to delete EV data because there are multiple sources of the data")
             # delete_device_type(DeviceType.EV)
-        ev_from_file_to_db(DataSource.ELAAD_AGG)
+        ev_from_file_to_db(DataSource.ELAAD_AGG, args.workers, args.dry_run, args.force)
     if args.all or (args.asset_type and 'hp' in args.asset_type):
-        if args.drop:
+        if drop:
             delete_device_type(DeviceType.HP)
-        hp_from_file_to_db()
+        hp_from_file_to_db(args.workers, args.dry_run, args.force)
     if args.all or (args.asset_type and 'sjv' in args.asset_type):
-        if args.drop:
+        if drop:
             delete_device_type(DeviceType.SJV)
-        gm_types()
+        gm_types(args.dry_run, args.force)
     if args.all or (args.asset_type and 'pv' in args.asset_type):
-        if args.drop:
+        if drop:
             delete_device_type(DeviceType.PV)
-        jrc_pvgis_file_to_db()
+        jrc_pvgis_file_to_db(args.dry_run, args.force)
     if args.all or (args.asset_type and 'hhp' in args.asset_type):
-        if args.drop:
+        if drop:
             delete_device_type(DeviceType.HHP)
-        hhp_from_file_to_db()
+        hhp_from_file_to_db(args.dry_run, args.force)
+
+    if not args.dry_run:
+        written_flexible_devices = []
+        if args.all or (args.asset_type and ('ev' in args.asset_type or 'ev-elaad' in args.asset_type)):
+            written_flexible_devices.append(DeviceType.EV)
+        if args.all or (args.asset_type and 'hp' in args.asset_type):
+            written_flexible_devices.append(DeviceType.HP)
+        for device_type in written_flexible_devices:
+            if write_scenario_aggregates[device_type]:
+                scenario_aggregates_to_db(device_type)
+
+    finish_load()
 
 
 if __name__ == "__main__":
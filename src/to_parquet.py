@@ -0,0 +1,91 @@
+import importlib.util
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Final, List, Tuple
+
+import pandas as pd
+
+from experiment.dataset_layout import iter_files, partition_dir
+from experiment.experiment_description import DeviceType, ExperimentDescription
+
+'''
+Helper program to convert the csv input data once to a parquet dataset, partitioned by device type (directory) and group.
+The loaders and to_database.py (with --parquet) read the converted dataset, which is a lot faster than parsing the csv files.
+'''
+
+CSV_BASE_PATH: Final[Path] = Path('data')
+PARQUET_BASE_PATH: Final[Path] = CSV_BASE_PATH / 'parquet'
+
+EV_DIRS: Final[List[Path]] = [Path('ev-elaad/ev/baselines/'), Path('ev-elaad/ev/shifted/')]
+HP_DIRS: Final[List[Path]] = [Path('hp/baselines/'), Path('hp/shifted-12/')]
+HHP_DIRS: Final[List[Path]] = [Path('hhp/baselines/')]
+
+# Rows per row group, a week of PTU. Enables reading a single day of a year-long baseline.
+ROW_GROUP_SIZE: Final[int] = 96 * 7
+
+
+def read_csv(path: Path) -> pd.DataFrame:
+    with open(path) as f:
+        header = f.readline()
+    if ';' in header:
+        # GO-e format
+        return pd.read_csv(path, sep=';', decimal=',', index_col=0, parse_dates=True)
+    # Elaad format
+    return pd.read_csv(path, sep=',', header=0, index_col=0, parse_dates=True, date_format='%H:%M')
+
+
+def write_parquet(df: pd.DataFrame, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.columns = df.columns.astype(str)
+    if importlib.util.find_spec('pyarrow'):
+        df.to_parquet(path, engine='pyarrow', row_group_size=ROW_GROUP_SIZE)
+    else:
+        df.to_parquet(path, engine='fastparquet', row_group_offsets=ROW_GROUP_SIZE)
+
+
+def group_of_file(stem: str, device_type: DeviceType) -> str:
+    if device_type == DeviceType.HHP:
+        group_elements: List[str] = stem.removeprefix("baselines+").split('+')
+        return f"{group_elements[0]}+{group_elements[1]}+{group_elements[2].removeprefix('status')}".replace(' ', '_').lower()
+    if stem.startswith("baselines+"):
+        return stem.removeprefix("baselines+")
+    # Elaad baselines don't contain a congestion period
+    elaad_group = ExperimentDescription.elaad_baseline_group(stem)
+    if elaad_group is not None:
+        return elaad_group
+    return ExperimentDescription.parse(stem, device_type).group
+
+
+def convert_dir(csv_dir: Path, parquet_dir: Path, device_type: DeviceType, force: bool) -> Tuple[int, int]:
+    converted = 0
+    skipped = 0
+    files = [f for f in iter_files(csv_dir) if f.suffix == '.csv']
+    print(f"Converting {len(files)} files from '{csv_dir}' to '{parquet_dir}'...")
+    for f in files:
+        out_path = partition_dir(parquet_dir, group_of_file(f.stem, device_type)) / (f.stem + '.parquet')
+        if not force and out_path.exists() and out_path.stat().st_mtime >= f.stat().st_mtime:
+            skipped += 1
+            continue
+        write_parquet(read_csv(f), out_path)
+        converted += 1
+        if converted % 1000 == 0:
+            print(f"Converted {converted} / {len(files)} files.")
+    return converted, skipped
+
+
+def main():
+    parser = ArgumentParser(prog="ParquetConverter", description="Helper program to convert the csv input data to a parquet dataset")
+    parser.add_argument('-t', '--asset_type', choices=['ev-elaad', 'hp', 'hhp'], nargs="+", default=['ev-elaad', 'hp', 'hhp'], help="select for which asset type data to convert")
+    parser.add_argument('-f', '--force', action='store_true', help="convert files even if the parquet file is up to date")
+    args = parser.parse_args()
+
+    dirs = {'ev-elaad': (EV_DIRS, DeviceType.EV), 'hp': (HP_DIRS, DeviceType.HP), 'hhp': (HHP_DIRS, DeviceType.HHP)}
+    for asset_type in args.asset_type:
+        asset_dirs, device_type = dirs[asset_type]
+        for d in asset_dirs:
+            converted, skipped = convert_dir(CSV_BASE_PATH / d, PARQUET_BASE_PATH / d, device_type, args.force)
+            print(f"Converted {converted} files, {skipped} files were up to date.")
+
+
+if __name__ == "__main__":
+    main()
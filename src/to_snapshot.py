@@ -0,0 +1,33 @@
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+from typing import Final
+
+from sqlalchemy import create_engine
+
+from db.snapshot import write_snapshot
+
+'''
+Helper program to export the flex metrics database to a read-only, memory-mapped snapshot (see db/snapshot.py).
+Use the snapshot with 'src/main.py --snapshot' on machines that only look up profiles.
+'''
+
+DB_FILE: Final[Path] = Path("flex-metrics.db")
+SNAPSHOT_DIR: Final[Path] = Path("flex-metrics.snapshot")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(prog="src/to_snapshot.py", description="Export the flex metrics database to a memory-mapped snapshot")
+    parser.add_argument('-d', '--database', default=str(DB_FILE), help=f"database file, default '{DB_FILE}'")
+    parser.add_argument('-o', '--output', default=str(SNAPSHOT_DIR), help=f"snapshot directory, replaced if it exists, default '{SNAPSHOT_DIR}'")
+    args = parser.parse_args()
+
+    db_file = Path(args.database)
+    if not db_file.exists():
+        print(f"Database file '{db_file}' is missing.\nExiting...")
+        exit(1)
+    t = perf_counter()
+    engine = create_engine(f"sqlite:///{db_file}", echo=False)
+    profiles = write_snapshot(engine, Path(args.output))
+    engine.dispose()
+    print(f"Exported {profiles} profiles to '{args.output}' in {perf_counter() - t:.1f}s")
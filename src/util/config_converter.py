@@ -1,7 +1,10 @@
 
+from datetime import time
 from pathlib import Path
+from typing import Any, Dict
 
 import pandas as pd
+from dataclass_binder import Binder
 from flex_metric_config import BaseloadConfig, Config, EvConfig, HhpConfig, HouseTypeConfig, HpConfig, PvConfig
 
 
@@ -61,5 +64,20 @@ class ExcelConverter():
         return Config(congestion_start=cong_start, congestion_duration=cong_dur, ev=ev_conf, hp=hp_conf, pv=pv_conf, non_flexible_load=sjv_conf, hhp=hhp_conf)
 
 
+class JsonConverter():
+    '''
+    Helper class to convert a scenario in JSON, with the keys of the toml config, to a Config object.
+    The congestion start is a "HH:MM[:SS]" string.
+    '''
+
+    def __init__(self, scenario: Dict[str, Any]) -> None:
+        self.scenario = dict(scenario)
+
+    def convert(self) -> Config:
+        if isinstance(self.scenario.get('congestion-start'), str):
+            self.scenario['congestion-start'] = time.fromisoformat(self.scenario['congestion-start'])
+        return Binder(Config).bind(self.scenario)
+
+
 if __name__ == "__main__":
     ExcelConverter(Path("example-config.xlsx")).convert()
@@ -48,13 +48,61 @@ def get_daily_sjv_expectation_values(sjv_type, df, day_type, month) -> List[floa
 
 
 def get_daily_pv_expectation_values(pv_type, df, sunrise_set, day_type, month) -> List[float]:
-    return list(map(lambda x: get_single_PV_Expectaction_Value(pv_type, df, sunrise_set, GmContext(day_type, month, x), 1), range(1, 97)))
+    return get_pv_expectation_values(pv_type, df, sunrise_set, [day_type], [1], [month])[0, 0, 0].tolist()
     # expectation_values = []
     # for i in range(1, 97):
     #     expectation_values.append(get_single_PV_Expectaction_Value(pv_type, df, (day_type, month, i),1))
     # return expectation_values
 
 
+def get_sjv_expectation_values(sjv_types: List[str], df, day_types: List[str], months: List[int] = range(1, 13)) -> np.ndarray:
+    '''
+    Vectorized version of get_single_SJV_Expectation_value for all SJV types, day types, months and the 96 PTU at once.
+    Performs the same floating point operations in the same order, so the results are identical.
+
+    Returns:
+        array with shape (sjv type, day type, month, PTU)
+    '''
+    power_delta_ = 0.1
+    power_range = np.array([-6.0, 6.0, 121])
+    gmrange = np.linspace(power_range[0],power_range[1],int(power_range[2]))
+    months = list(months)
+    ptus = range(1, 97)
+
+    GMparms = df.drop_duplicates(subset='Name').set_index('Name').loc[sjv_types]
+    # shape (type, distribution)
+    gm_average = np.stack([GMparms[f"Average[{k}]"].to_numpy(dtype=float) / 0.98 for k in range(1, 5)], axis=1)
+    gm_std = np.stack([GMparms[f"Deviation[{k}]"].to_numpy(dtype=float) for k in range(1, 5)], axis=1)
+    powermax = (gm_average + 3 * gm_std).max(axis=1)
+
+    # shape (type, distribution, power)
+    distribution_pdf = stats.norm.pdf(gmrange[None, None, :], loc=gm_average[:, :, None], scale=gm_std[:, :, None])
+    distribution_pdf = distribution_pdf / (distribution_pdf.sum(axis=2, keepdims=True) * power_delta_)
+
+    # shape (type, day type, distribution, PTU) and (type, distribution, month)
+    scale_day = np.stack([np.stack([GMparms[[f"{dagtype}[{k},{kwartier}]" for kwartier in ptus]].to_numpy(dtype=float) for k in range(1, 5)], axis=1) for dagtype in day_types], axis=1)
+    scale_month = np.stack([GMparms[[f"Month[{k},{maand}]" for maand in months]].to_numpy(dtype=float) for k in range(1, 5)], axis=1)
+
+    # shape (type, day type, month, PTU, power)
+    distributionsum = None
+    for k in range(4):
+        pdf = distribution_pdf[:, None, None, None, k, :] * scale_day[:, :, None, k, :, None] * scale_month[:, None, k, :, None, None]
+        distributionsum = pdf if distributionsum is None else distributionsum + pdf
+
+    zeroindex = int(power_range[0]*power_range[2]/(power_range[0]-power_range[1]))
+    power_index = np.arange(distributionsum.shape[-1])
+    # set powermax limit, like range() the start index is truncated towards zero and negative indices clear the whole distribution
+    limit_index = np.array([int( (p*power_range[2] / (power_range[1]-power_range[0])))+zeroindex if p < power_range[1] else distributionsum.shape[-1] for p in powermax])
+    mask = (power_index[None, :] >= np.maximum(limit_index, 0)[:, None]) | (power_index[None, :] < zeroindex)
+    distributionsum = np.where(mask[:, None, None, None, :], 0.0, distributionsum)
+
+    distributionsum = distributionsum / (distributionsum.sum(axis=-1, keepdims=True) * power_delta_)
+
+    # Sequential sums (cumsum) like the loop in get_expectation_value
+    power = power_range[0] + power_index * power_delta_
+    return np.cumsum(distributionsum * power, axis=-1)[..., -1] / np.cumsum(distributionsum, axis=-1)[..., -1]
+
+
 def get_single_SJV_Expectation_value(SJV_Type, df, context):
     dagtype = context[0]
     maand = context[1]
@@ -154,6 +202,61 @@ def get_single_SJV_Expectation_value(SJV_Type, df, context):
 
     return expection_value
 
+def get_daylight_mask(sunrise_set, months: List[int] = range(1, 13)) -> np.ndarray:
+    '''
+    Returns:
+        boolean array with shape (month, PTU) that is True for the PTU between sunrise and sunset
+    '''
+    kwartier = np.arange(1, 97)
+    sunrise = np.array([sunrise_set.loc[month_name[m].lower()]['sunrise'] for m in months])
+    sunset = np.array([sunrise_set.loc[month_name[m].lower()]['sunset'] for m in months])
+    return (kwartier[None, :] >= sunrise[:, None]) & (kwartier[None, :] <= sunset[:, None])
+
+
+def get_pv_expectation_values(GMname, df, sunrise_set, day_types: List[str], installed_powers: List[float], months: List[int] = range(1, 13), chunk_size: int = 16) -> np.ndarray:
+    '''
+    Vectorized version of get_single_PV_Expectaction_Value for many installed powers, all day types, months and the 96 PTU at once.
+    The installed powers are evaluated in chunks to bound the memory use of the (installed power, day type, month, PTU, power) distributions.
+
+    Returns:
+        array with shape (installed power, day type, month, PTU)
+    '''
+    pdelta = 0.1
+    power_range = np.array([-6.0, 6.0, 121])
+    max_power = 0   #kW
+    gmrange = np.linspace(power_range[0],power_range[1],int(power_range[2]))
+    months = list(months)
+    ptus = range(1, 97)
+
+    # Parameter matrices of the PV type, shape (day type, PTU) and (month)
+    GMparms = df.loc[df['Name'] == GMname].iloc[0]
+    trendday = np.array([[GMparms[f"Trend{dagtype}[{kwartier}]"] for kwartier in ptus] for dagtype in day_types], dtype=float)
+    trendmonth = np.array([GMparms[f"TrendMonth[{maand}]"] for maand in months], dtype=float)
+    prob_day = np.array([[GMparms[f"{dagtype}[1,{kwartier}]"] for kwartier in ptus] for dagtype in day_types], dtype=float)
+    prob_month = np.array([GMparms[f"Month[1,{maand}]"] for maand in months], dtype=float)
+    average = GMparms["Average[1]"] + trendday[:, None, :] * trendmonth[None, :, None]
+    probactive = np.minimum(prob_day[:, None, :] * prob_month[None, :, None] * get_daylight_mask(sunrise_set, months)[None, :, :], 1)
+
+    zeroindex = find_zeroindex(None, power_range, pdelta)
+    power = power_range[0] + np.arange(gmrange.size) * pdelta
+    installed_powers = np.asarray(installed_powers, dtype=float)
+    expectation_values = np.empty((installed_powers.size,) + probactive.shape)
+    for chunk_start in range(0, installed_powers.size, chunk_size):
+        installed_power = installed_powers[chunk_start:chunk_start + chunk_size, None, None, None]
+        gm_average = average[None, ...]*installed_power/100
+        gm_std = GMparms["Deviation[1]"]*installed_power/100
+        # shape (installed power, day type, month, PTU, power)
+        distnorm_pdf = stats.norm.pdf(gmrange, loc=gm_average[..., None], scale=np.broadcast_to(gm_std, gm_average.shape)[..., None])
+        distnorm_pdf[..., int(max_power/pdelta)+zeroindex:] = 0
+        distnorm_pdf = distnorm_pdf / (distnorm_pdf.sum(axis=-1, keepdims=True) * pdelta)
+        distnorm_pdf = probactive[None, ..., None] * distnorm_pdf
+        # chance that no sun is shining, hence 0 power
+        distnorm_pdf[..., zeroindex] = (1-probactive[None, ...])/pdelta
+        # Sequential sums (cumsum) like the loop in get_expectation_value
+        expectation_values[chunk_start:chunk_start + chunk_size] = np.cumsum(distnorm_pdf * power, axis=-1)[..., -1] / np.cumsum(distnorm_pdf, axis=-1)[..., -1]
+    return expectation_values
+
+
 def get_single_PV_Expectaction_Value(GMname, df, sunrise_set, context, installed_power_):
     dagtype = context[0]
     maand = context[1]
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import Engine, event
+
+'''
+Timing instrumentation of the phases of a flex metrics run.
+
+A phase is recorded as a span with its wall time, and the amount and time of the database queries and the amount of
+profile bytes decoded within it (including nested spans). Spans are only recorded while a Recorder is active in the
+current thread or a span listener is registered, otherwise a span costs one context variable lookup.
+
+    recorder = Recorder()
+    with recorder.activate():
+        FlexMetrics(conf, db_file).determine_flex_power()
+    print(recorder.summary())
+
+A service forwards the spans of all runs to its metrics system with add_span_listener, the listener is called with
+every finished span.
+'''
+
+SpanListener = Callable[['Span'], None]
+
+
+@dataclass
+class Span():
+    name: str
+    path: str
+    '''Names of the enclosing spans and this span, separated by "/"'''
+    depth: int
+    start_s: float
+    '''Start relative to the activation of the recorder'''
+    wall_s: float
+    queries: int
+    query_time_s: float
+    bytes_decoded: int
+
+
+class Recorder():
+    '''
+    Collects the spans of one run. A recorder is used by one thread at a time.
+    '''
+
+    def __init__(self, listeners: Iterable[SpanListener] = ()) -> None:
+        '''
+        Args:
+            listeners: called with every finished span of this recorder.
+        '''
+        self.listeners = list(listeners)
+        self.spans: List[Span] = []
+        self.queries = 0
+        self.query_time_s = 0.0
+        self.bytes_decoded = 0
+        self.__origin = perf_counter()
+        self.__path: List[str] = []
+
+    @contextmanager
+    def activate(self) -> Iterator[Recorder]:
+        '''Record the spans of the current thread in this recorder'''
+        token = _active_recorder.set(self)
+        try:
+            yield self
+        finally:
+            _active_recorder.reset(token)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        self.__path.append(name)
+        start = perf_counter()
+        queries, query_time_s, bytes_decoded = self.queries, self.query_time_s, self.bytes_decoded
+        try:
+            yield
+        finally:
+            s = Span(name, "/".join(self.__path), len(self.__path) - 1, start - self.__origin, perf_counter() - start,
+                     self.queries - queries, self.query_time_s - query_time_s, self.bytes_decoded - bytes_decoded)
+            self.__path.pop()
+            self.spans.append(s)
+            for listener in self.listeners + _listeners:
+                listener(s)
+
+    def summary(self) -> str:
+        '''Table of the spans, in the order they started, indented by nesting'''
+        lines = [f"{'phase':<40} {'wall [ms]':>10} {'queries':>8} {'query [ms]':>11} {'decoded [kB]':>13}"]
+        for s in sorted(self.spans, key=lambda s: s.start_s):
+            lines.append(f"{'  ' * s.depth + s.name:<40} {s.wall_s * 1000:>10.1f} {s.queries:>8} {s.query_time_s * 1000:>11.1f} {s.bytes_decoded / 1000:>13.1f}")
+        return "\n".join(lines)
+
+    def to_dict(self) -> List[Dict[str, Any]]:
+        return [asdict(s) for s in sorted(self.spans, key=lambda s: s.start_s)]
+
+
+_active_recorder: ContextVar[Optional[Recorder]] = ContextVar("active_recorder", default=None)
+_listeners: List[SpanListener] = []
+
+
+def add_span_listener(listener: SpanListener) -> None:
+    '''Call the listener with every finished span of every run, also when no recorder is active'''
+    _listeners.append(listener)
+
+
+def remove_span_listener(listener: SpanListener) -> None:
+    _listeners.remove(listener)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    '''Record a phase in the active recorder. Without an active recorder only span listeners get the span.'''
+    recorder = _active_recorder.get()
+    if recorder is not None:
+        with recorder.span(name):
+            yield
+    elif _listeners:
+        # A temporary recorder collects the counters of this span and its nested spans for the listeners
+        with Recorder().activate() as recorder, recorder.span(name):
+            yield
+    else:
+        yield
+
+
+def record_query(query_time_s: float) -> None:
+    recorder = _active_recorder.get()
+    if recorder is not None:
+        recorder.queries += 1
+        recorder.query_time_s += query_time_s
+
+
+def record_decoded(nbytes: int) -> None:
+    recorder = _active_recorder.get()
+    if recorder is not None:
+        recorder.bytes_decoded += nbytes
+
+
+# The queries of all SQLAlchemy engines, the core lookups on the DB-API connection call record_query themselves
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active_recorder.get() is not None:
+        conn.info.setdefault("query_start", []).append(perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if starts:
+        record_query(perf_counter() - starts.pop())
@@ -0,0 +1,47 @@
+from datetime import time
+from typing import Iterator
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from db.lookup_keys import FlexMetricKey
+from db.models import Base
+from db.profile_codec import encode_profile
+from experiment.device_type import DeviceType
+
+'''
+Fixtures with a small database. Rows are added with the upsert of the DAOs, the profile of a row is filled with one value
+so tests can tell the rows apart.
+'''
+
+KEY = FlexMetricKey(DeviceType.EV, "1000", "workday", time(17), 4)
+OTHER_KEY = FlexMetricKey(DeviceType.EV, "1001", "workday", time(17), 4)
+
+
+def profile(value: float, length: int = 4) -> bytes:
+    return encode_profile(np.full(length, value))
+
+
+def flex_metric_row(id: str, key: FlexMetricKey, value: float) -> dict:
+    return dict(id=id, device_type=key.device_type, group=key.group, typical_day=key.typical_day, cong_start=key.cong_start, cong_duration=key.cong_duration,
+                flex_metric=profile(value, key.cong_duration))
+
+
+def baseline_row(id: str, key: FlexMetricKey, value: float) -> dict:
+    return dict(id=id, device_type=key.device_type, group=key.group, typical_day=key.typical_day, mean_power=profile(value, 96))
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'flex-metrics.db'}", echo=False)
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine) -> Iterator[Session]:
+    with Session(engine) as session:
+        yield session
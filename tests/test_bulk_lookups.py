@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from conftest import KEY, OTHER_KEY, baseline_row, flex_metric_row
+from db.baselines_dao import BaselineDao
+from db.core_lookups import CoreBaselineDao, CoreFlexDevicesDao
+from db.data_not_found_exception import DataNotFoundException
+from db.flex_devices_dao import FlexDevicesDao
+from db.lookup_keys import BaselineKey
+from db.profile_cache import ProfileCache
+
+
+@pytest.fixture
+def duplicated_session(session):
+    '''KEY is stored twice, the first row has value 1'''
+    FlexDevicesDao(session).upsert([flex_metric_row("a", KEY, 1.0), flex_metric_row("b", KEY, 2.0), flex_metric_row("c", OTHER_KEY, 3.0)])
+    BaselineDao(session).upsert([baseline_row("a", KEY, 1.0), baseline_row("b", KEY, 2.0), baseline_row("c", OTHER_KEY, 3.0)])
+    return session
+
+
+@pytest.mark.parametrize("dao_type", [FlexDevicesDao, CoreFlexDevicesDao])
+@pytest.mark.parametrize("cache", [None, ProfileCache()])
+def test_flex_metrics_bulk_matches_single_lookups(duplicated_session, dao_type, cache):
+    dao = dao_type(duplicated_session, cache)
+    bulk = dao.get_flex_metrics_bulk([KEY, OTHER_KEY, KEY])
+    for key in [KEY, OTHER_KEY]:
+        single = dao_type(duplicated_session).get_flex_metrics(key.device_type, key.cong_start, key.cong_duration, key.group, key.typical_day)
+        np.testing.assert_array_equal(bulk[key], single)
+    np.testing.assert_array_equal(bulk[KEY], np.full(4, 1.0))
+
+
+@pytest.mark.parametrize("dao_type", [BaselineDao, CoreBaselineDao])
+@pytest.mark.parametrize("cache", [None, ProfileCache()])
+def test_baseline_means_bulk_matches_single_lookups(duplicated_session, dao_type, cache):
+    dao = dao_type(duplicated_session, cache)
+    keys = [BaselineKey(*KEY[:3]), BaselineKey(*OTHER_KEY[:3])]
+    bulk = dao.get_baseline_means_bulk(keys + keys)
+    for key in keys:
+        single = dao_type(duplicated_session).get_baseline_mean(key.device_type, key.typical_day, key.group)
+        np.testing.assert_array_equal(bulk[key], single)
+    np.testing.assert_array_equal(bulk[keys[0]], np.full(96, 1.0))
+
+
+def test_flex_metrics_of_groups_match_bulk_lookups(duplicated_session):
+    dao = FlexDevicesDao(duplicated_session)
+    groups = dao.get_flex_metrics_of_groups([BaselineKey(*KEY[:3]), BaselineKey(*OTHER_KEY[:3])])
+    bulk = dao.get_flex_metrics_bulk([KEY, OTHER_KEY])
+    assert groups.keys() == bulk.keys()
+    for key in [KEY, OTHER_KEY]:
+        np.testing.assert_array_equal(groups[key], bulk[key])
+
+
+def test_flex_metrics_bulk_over_several_queries(session):
+    keys = [KEY._replace(group=str(g)) for g in range(FlexDevicesDao.LOOKUP_CHUNK_SIZE * 2 + 1)]
+    FlexDevicesDao(session).upsert([flex_metric_row(str(i), k, i) for i, k in enumerate(keys)])
+    bulk = FlexDevicesDao(session).get_flex_metrics_bulk(keys)
+    assert [bulk[k][0] for k in keys] == list(range(len(keys)))
+
+
+@pytest.mark.parametrize("dao_type", [FlexDevicesDao, CoreFlexDevicesDao])
+def test_bulk_names_every_missing_key(duplicated_session, dao_type):
+    missing = [KEY._replace(group="x"), KEY._replace(group="y")]
+    with pytest.raises(DataNotFoundException) as e:
+        dao_type(duplicated_session).get_flex_metrics_bulk([KEY] + missing)
+    assert all(str(k) in str(e.value) for k in missing)
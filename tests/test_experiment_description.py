@@ -0,0 +1,58 @@
+import pytest
+
+from experiment.device_type import DeviceType
+from experiment.experiment_description import ExperimentDescription
+
+NAMES = [
+    "pc41234_flexwindowduration12_congestionstart2020-01-04T1700_congestionduration8",
+    "pc41234_flexwindowstart2020-01-06T1100_flexwindowduration12_congestionstart2020-01-06T1700_congestionduration8",
+    "a_b_c_flexwindowstart2020-03-06T1100_flexwindowduration12_congestionstart2020-03-06T1700_congestionduration8",
+    "public-med-50-2030-11-2-17_25-st-4-1600-1700-20-week",
+]
+
+
+@pytest.mark.parametrize("name", NAMES)
+def test_parse_matches_constructor(name):
+    parsed = ExperimentDescription.parse(name, DeviceType.EV)
+    constructed = ExperimentDescription(name, DeviceType.EV)
+    assert parsed == constructed
+    assert parsed.get_baseline_file_name() == constructed.get_baseline_file_name()
+
+
+def test_parse_returns_new_descriptions():
+    first = ExperimentDescription.parse(NAMES[0], DeviceType.EV)
+    second = ExperimentDescription.parse(NAMES[0], DeviceType.EV)
+    assert first == second and first is not second
+    first.group = "modified"
+    first.congestion_duration = 0
+    third = ExperimentDescription.parse(NAMES[0], DeviceType.EV)
+    assert third == ExperimentDescription(NAMES[0], DeviceType.EV)
+
+
+def test_parse_keeps_device_type():
+    assert ExperimentDescription.parse(NAMES[0], DeviceType.HP).device_type is DeviceType.HP
+    assert ExperimentDescription.parse(NAMES[0], DeviceType.EV).device_type is DeviceType.EV
+
+
+@pytest.mark.parametrize("name", ["garbage", "public-med-50-2030-11-2-17_25-none-20-week",
+                                  "pc41234_flexwindowduration12_congestionstart2020-13-04T1700_congestionduration8"])
+def test_parse_rejects_invalid_names(name):
+    with pytest.raises(AssertionError):
+        ExperimentDescription.parse(name, DeviceType.EV)
+
+
+@pytest.mark.parametrize("name", NAMES)
+def test_try_parse_matches_parse(name):
+    assert ExperimentDescription.try_parse(name, DeviceType.EV) == ExperimentDescription.parse(name, DeviceType.EV)
+
+
+@pytest.mark.parametrize("name", ["garbage", "", "pc41234_flexwindowduration12_congestionstart2020-01-04T1700_congestionduration8.csv"])
+def test_try_parse_returns_none_for_other_names(name):
+    assert not ExperimentDescription.validate_name(name)
+    assert ExperimentDescription.try_parse(name, DeviceType.EV) is None
+    assert ExperimentDescription.try_parse(name, DeviceType.EV) is None
+
+
+def test_try_parse_rejects_invalid_experiment_names():
+    with pytest.raises(AssertionError, match="Invalid date and time"):
+        ExperimentDescription.try_parse("pc41234_flexwindowduration12_congestionstart2020-13-04T1700_congestionduration8", DeviceType.EV)
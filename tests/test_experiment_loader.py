@@ -0,0 +1,30 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from benchmark.synthetic_data import SyntheticDataSpec, write_elaad_ev
+from experiment.experiment_description import DataSource
+from experiment.experiment_loader import ExperimentLoader
+
+SPEC = SyntheticDataSpec(ev_source='elaad', ev_groups=2, ev_devices=5)
+
+
+@pytest.fixture
+def ev_dir(tmp_path) -> Path:
+    write_elaad_ev(tmp_path / 'ev', SPEC, np.random.default_rng(SPEC.seed))
+    return tmp_path / 'ev'
+
+
+def loader(ev_dir: Path) -> ExperimentLoader:
+    return ExperimentLoader(ev_dir / 'baselines', ev_dir / 'shifted', DataSource.ELAAD_AGG)
+
+
+def test_iter_experiments_loads_all_experiments(ev_dir):
+    assert len(list(loader(ev_dir).iter_experiments())) == SPEC.ev_experiments()
+
+
+def test_missing_baseline_fails_before_loading(ev_dir):
+    next((ev_dir / 'baselines').glob('*-wknd.csv')).unlink()
+    with pytest.raises(AssertionError, match="2 experiments don't have a baseline"):
+        loader(ev_dir).iter_experiments()
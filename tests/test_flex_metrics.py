@@ -0,0 +1,67 @@
+from datetime import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sqlalchemy.orm import Session
+
+import to_database
+from db.baselines_dao import BaselineDao
+from db.flex_devices_dao import FlexDevicesDao
+from db.lookup_keys import BaselineKey, FlexMetricKey
+from db.profile_cache import ProfileCache
+from db.profile_codec import encode_profile
+from experiment.device_type import DeviceType
+from flex_metric_config import BaseloadConfig, Config, EvConfig, HhpConfig, HouseTypeConfig, HpConfig, PvConfig, SjvConfig
+from flex_metrics import FlexMetrics
+
+FLEXIBLE_KEYS = [FlexMetricKey(DeviceType.EV, "1000", "workday", time(17), d) for d in (4, 8)] + \
+                [FlexMetricKey(DeviceType.EV, "1001", "workday", time(17), d) for d in (4, 8)] + \
+                [FlexMetricKey(DeviceType.HP, "house", m, time(17), d) for m in ("january", "february") for d in (4, 8)]
+OTHER_KEYS = [BaselineKey(DeviceType.HHP, "house", "january_avg"), BaselineKey(DeviceType.PV, "pv", "january"),
+              BaselineKey(DeviceType.SJV, "sjv500", "january_workday"), BaselineKey(DeviceType.SJV, "sjv1000", "january_workday")]
+
+
+@pytest.fixture
+def db_file(engine, monkeypatch) -> Path:
+    '''Random flex metrics and baselines of EV, HP, HHP, PV and SJV, with scenario aggregates'''
+    rng = np.random.default_rng(0)
+    baseline_keys = list(dict.fromkeys([BaselineKey(*k[:3]) for k in FLEXIBLE_KEYS])) + OTHER_KEYS
+    with Session(engine) as session:
+        FlexDevicesDao(session).upsert([dict(id=f"f{i}", device_type=k.device_type, group=k.group, typical_day=k.typical_day, cong_start=k.cong_start,
+                                             cong_duration=k.cong_duration, flex_metric=encode_profile(rng.random(k.cong_duration))) for i, k in enumerate(FLEXIBLE_KEYS)])
+        BaselineDao(session).upsert([dict(id=f"b{i}", device_type=k.device_type, group=k.group, typical_day=k.typical_day,
+                                          mean_power=encode_profile(rng.random(96) * 1000)) for i, k in enumerate(baseline_keys)])
+    monkeypatch.setattr(to_database, "engine", engine)
+    to_database.scenario_aggregates_to_db(DeviceType.EV)
+    to_database.scenario_aggregates_to_db(DeviceType.HP)
+    return Path(engine.url.database)
+
+
+def config(amount: int, month: str, duration: int, total=None) -> Config:
+    return Config(time(17), duration,
+                  ev=[EvConfig("workday", "1000", amount), EvConfig("workday", "1001", 3, total)],
+                  hp=HpConfig(month, [HouseTypeConfig("house", amount + 1)]),
+                  hhp=HhpConfig("january_avg", [HouseTypeConfig("house", 2, total)]),
+                  pv=PvConfig("january", 3000.0),
+                  non_flexible_load=BaseloadConfig("january_workday", [SjvConfig("sjv500", amount), SjvConfig("sjv1000", 7)]))
+
+
+CONFIGS = [config(a, m, d) for a in (1, 5) for m in ("january", "february") for d in (4, 8)] + \
+          [config(2, "january", 4, [100.5, 200.25, 300.0, 400.0]), config(2, "january", 4, [100, 200, 300, 400]),
+           Config(time(17), 8, ev=[EvConfig("workday", "1000", 2), EvConfig("workday", "1000", 6)]),
+           Config(time(17), 4, pv=PvConfig("january", 3000.0), non_flexible_load=BaseloadConfig("january_workday", []))]
+
+
+@pytest.mark.parametrize("use_scenario_aggregates", [True, False])
+def test_many_matches_single(db_file, use_scenario_aggregates):
+    many = FlexMetrics(CONFIGS[0], db_file, ProfileCache(), use_scenario_aggregates).determine_flex_power_many(CONFIGS)
+    for c, m in zip(CONFIGS, many):
+        single = FlexMetrics(c, db_file, ProfileCache(), use_scenario_aggregates).determine_flex_power()
+        assert (m.cong_start, m.cong_duration) == (single.cong_start, single.cong_duration)
+        assert [r.device_type for r in m.results] == [r.device_type for r in single.results]
+        for r, s in zip(m.results, single.results):
+            assert r.baselines.equals(s.baselines) and r.baselines.dtypes.equals(s.baselines.dtypes)
+            assert (r.flex_profiles is None) == (s.flex_profiles is None)
+            if s.flex_profiles is not None:
+                assert r.flex_profiles.equals(s.flex_profiles) and r.flex_profiles.dtypes.equals(s.flex_profiles.dtypes)
@@ -0,0 +1,42 @@
+from datetime import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sqlalchemy.orm import Session
+
+import to_database
+from conftest import KEY, OTHER_KEY, baseline_row, flex_metric_row
+from db.baselines_dao import BaselineDao
+from db.flex_devices_dao import FlexDevicesDao
+from db.profile_cache import ProfileCache
+from db.scenario_aggregates_dao import ScenarioAggregatesDao
+from experiment.device_type import DeviceType
+from flex_metric_config import Config, EvConfig
+from flex_metrics import FlexMetrics
+
+
+@pytest.fixture
+def db_file(engine, monkeypatch):
+    '''KEY has two flex metric rows and two baseline rows, the scenario aggregates are written by to_database.py'''
+    with Session(engine) as session:
+        FlexDevicesDao(session).upsert([flex_metric_row("b", KEY, 0.3), flex_metric_row("a", KEY, 0.6), flex_metric_row("c", OTHER_KEY, 0.5)])
+        BaselineDao(session).upsert([baseline_row("b", KEY, 100.0), baseline_row("a", KEY, 200.0), baseline_row("c", OTHER_KEY, 300.0)])
+    monkeypatch.setattr(to_database, "engine", engine)
+    to_database.scenario_aggregates_to_db(DeviceType.EV)
+    return engine.url.database
+
+
+def test_scenario_profiles_keep_first_row(engine, db_file):
+    with Session(engine) as session:
+        profiles = ScenarioAggregatesDao(session).get_scenario_profiles_bulk([KEY, OTHER_KEY])
+    np.testing.assert_array_equal(profiles[KEY].flex_metric, np.full(4, 0.3))
+    np.testing.assert_array_equal(profiles[KEY].flex_power, np.full(4, 30.0))
+
+
+def test_aggregates_match_flex_metrics_and_baselines(db_file):
+    config = Config(time(17), 4, ev=[EvConfig("workday", KEY.group, 10), EvConfig("workday", OTHER_KEY.group, 5)])
+    with_aggregates = FlexMetrics(config, Path(db_file), ProfileCache())
+    without_aggregates = FlexMetrics(config, Path(db_file), ProfileCache(), use_scenario_aggregates=False)
+    assert with_aggregates.fetch_scenario_profiles() is not None
+    assert with_aggregates.determine_flex_power().to_dict() == without_aggregates.determine_flex_power().to_dict()
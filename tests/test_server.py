@@ -0,0 +1,78 @@
+import json
+import socket
+import threading
+from http.client import HTTPConnection
+from pathlib import Path
+from time import monotonic, sleep
+
+import pytest
+
+from server import FlexMetricsServer
+
+WORKERS = 2
+
+
+@pytest.fixture
+def server(engine):
+    '''Server with a keep-alive timeout far above the timeouts of the tests'''
+    server = FlexMetricsServer(("127.0.0.1", 0), Path(engine.url.database), workers=WORKERS, keep_alive_timeout=60)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def health(connection: HTTPConnection) -> dict:
+    connection.request("GET", "/health")
+    response = connection.getresponse()
+    assert response.status == 200
+    return json.loads(response.read())
+
+
+def test_keep_alive(server):
+    connection = HTTPConnection(*server.server_address, timeout=5)
+    assert [health(connection) for _ in range(3)] == [{"status": "ok"}] * 3
+    connection.close()
+
+
+def test_answers_while_idle_keep_alive_connections_hold_all_workers(server):
+    idle = [HTTPConnection(*server.server_address, timeout=5) for _ in range(WORKERS)]
+    for connection in idle:
+        health(connection)
+    t = monotonic()
+    assert health(HTTPConnection(*server.server_address, timeout=5)) == {"status": "ok"}
+    assert monotonic() - t < 2
+    for connection in idle:
+        connection.close()
+
+
+def test_answers_while_connections_without_request_hold_all_workers(server):
+    idle = [socket.create_connection(server.server_address) for _ in range(WORKERS)]
+    t = monotonic()
+    assert health(HTTPConnection(*server.server_address, timeout=5)) == {"status": "ok"}
+    assert monotonic() - t < 2
+    for s in idle:
+        s.close()
+
+
+def test_answers_first_request_that_arrives_while_connections_wait(server):
+    slow = socket.create_connection(server.server_address, timeout=5)
+    others = [HTTPConnection(*server.server_address, timeout=5) for _ in range(WORKERS)]
+    for connection in others:
+        connection.request("GET", "/health")
+    # The first request of a connection that is handled while other connections wait for a worker
+    sleep(0.2)
+    slow.sendall(b"GET /health HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    assert slow.makefile('rb').readline().startswith(b"HTTP/1.1 200")
+    for connection in others:
+        assert connection.getresponse().status == 200
+        connection.close()
+    slow.close()
+
+
+def test_closes_idle_connection_after_keep_alive_timeout(server):
+    server.keep_alive_timeout = 0.2
+    with socket.create_connection(server.server_address, timeout=5) as s:
+        assert s.recv(1) == b''
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from sqlalchemy.orm import Session
+
+import to_database
+from conftest import KEY, OTHER_KEY, baseline_row, flex_metric_row
+from db.baselines_dao import BaselineDao
+from db.flex_devices_dao import FlexDevicesDao
+from db.lookup_keys import BaselineKey
+from db.scenario_aggregates_dao import ScenarioAggregatesDao
+from db.snapshot import SnapshotFlexMetrics, write_snapshot
+from experiment.device_type import DeviceType
+
+
+@pytest.fixture
+def snapshot(engine, tmp_path, monkeypatch) -> SnapshotFlexMetrics:
+    '''Snapshot of a database in which KEY has two flex metric, baseline and scenario aggregate rows'''
+    with Session(engine) as session:
+        FlexDevicesDao(session).upsert([flex_metric_row("b", KEY, 0.3), flex_metric_row("a", KEY, 0.6), flex_metric_row("c", OTHER_KEY, 0.5)])
+        BaselineDao(session).upsert([baseline_row("b", KEY, 100.0), baseline_row("a", KEY, 200.0), baseline_row("c", OTHER_KEY, 300.0)])
+    monkeypatch.setattr(to_database, "engine", engine)
+    to_database.scenario_aggregates_to_db(DeviceType.EV)
+    write_snapshot(engine, tmp_path / 'snapshot')
+    return SnapshotFlexMetrics(tmp_path / 'snapshot')
+
+
+def test_snapshot_matches_database(engine, snapshot):
+    keys = [KEY, OTHER_KEY]
+    baseline_keys = [BaselineKey(*k[:3]) for k in keys]
+    with Session(engine) as session:
+        flex_dao, baseline_dao, aggregates_dao = FlexDevicesDao(session), BaselineDao(session), ScenarioAggregatesDao(session)
+        expected = [flex_dao.get_flex_metrics_bulk(keys), flex_dao.get_flex_metrics_of_groups(baseline_keys),
+                    baseline_dao.get_baseline_means_bulk(baseline_keys), aggregates_dao.get_scenario_profiles_bulk(keys)]
+    actual = [snapshot.get_flex_metrics_bulk(keys), snapshot.get_flex_metrics_of_groups(baseline_keys),
+              snapshot.get_baseline_means_bulk(baseline_keys), snapshot.get_scenario_profiles_bulk(keys)]
+    for e, a in zip(expected, actual):
+        assert e.keys() == a.keys()
+        for key in e:
+            np.testing.assert_allclose(np.asarray(a[key], dtype=np.float64), np.asarray(e[key], dtype=np.float64), rtol=1e-6)
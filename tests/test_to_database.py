@@ -0,0 +1,77 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, event, func, select, text
+from sqlalchemy.orm import Session
+
+import to_database
+from benchmark.synthetic_data import SyntheticDataSpec, write_elaad_ev
+from db.models import Baseline, FlexMetric
+from db.source_files_dao import SourceFilesDao
+from experiment.experiment_description import DataSource
+from experiment.experiment_loader import ExperimentLoader
+
+SPEC = SyntheticDataSpec(ev_source='elaad', ev_groups=2, ev_devices=5)
+
+
+@pytest.fixture
+def ev_dir(tmp_path, engine, monkeypatch) -> Path:
+    '''Elaad input files that are written to the database once'''
+    write_elaad_ev(tmp_path / 'ev', SPEC, np.random.default_rng(SPEC.seed))
+    monkeypatch.setattr(to_database, "engine", engine)
+    to_database.experiment_files_to_db('ev-elaad', loader(tmp_path / 'ev'))
+    return tmp_path / 'ev'
+
+
+def loader(ev_dir: Path) -> ExperimentLoader:
+    return ExperimentLoader(ev_dir / 'baselines', ev_dir / 'shifted', DataSource.ELAAD_AGG)
+
+
+def database_content(engine):
+    with Session(engine) as session:
+        return (session.scalar(select(func.count()).select_from(FlexMetric)), session.scalar(select(func.count()).select_from(Baseline)),
+                {p: (s.group, s.flex_metric_ids, s.baseline_ids) for p, s in SourceFilesDao(session).get_source_files('ev-elaad').items()})
+
+
+def test_write_all_experiments(engine, ev_dir):
+    flex_metrics, baselines, manifest = database_content(engine)
+    assert flex_metrics == SPEC.ev_experiments()
+    assert baselines == SPEC.ev_groups * 2
+    assert len(manifest) == len(list((ev_dir / 'baselines').iterdir())) + len(list((ev_dir / 'shifted').iterdir()))
+
+
+def test_missing_baseline_keeps_group(engine, ev_dir):
+    before = database_content(engine)
+    next((ev_dir / 'baselines').glob('*-wknd.csv')).unlink()
+    with pytest.raises(AssertionError):
+        to_database.experiment_files_to_db('ev-elaad', loader(ev_dir), force=True)
+    assert database_content(engine) == before
+
+
+def test_failed_manifest_update_keeps_group(engine, ev_dir, monkeypatch):
+    before = database_content(engine)
+
+    def fail(*args):
+        raise OSError("input file removed")
+    monkeypatch.setattr(SourceFilesDao, "to_db_values", fail)
+    with pytest.raises(OSError):
+        to_database.experiment_files_to_db('ev-elaad', loader(ev_dir), force=True)
+    assert database_content(engine) == before
+
+
+def test_finish_load_restores_safe_settings(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'flex-metrics.db'}", echo=False)
+    event.listen(engine, "connect", to_database.set_load_pragmas)
+    monkeypatch.setattr(to_database, "engine", engine)
+    to_database.create_database_tables()
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 0
+    to_database.finish_load()
+    # A new connection of the pool after the load
+    engine.dispose()
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "delete"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 2
+    engine.dispose()
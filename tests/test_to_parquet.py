@@ -0,0 +1,28 @@
+import pytest
+
+from experiment.device_type import DeviceType
+from experiment.experiment_description import ExperimentDescription
+from to_parquet import group_of_file
+
+
+@pytest.mark.parametrize("baseline, experiment", [
+    ("public-med-50-2030-11-2-17_25-none-20-week", "public-med-50-2030-11-2-17_25-st-4-1600-1700-20-week"),
+    ("home-50-2030-11-2-17-none-20-wknd", "home-50-2030-11-2-17-st-1-1700-1800-20-wknd"),
+    ("public-loc-west-50-2030-11-2-17_25-none-20-week", "public-loc-west-50-2030-11-2-17_25-st-4-1600-1700-20-week"),
+])
+def test_elaad_baseline_in_group_of_experiments(baseline, experiment):
+    group = ExperimentDescription.parse(experiment, DeviceType.EV).group
+    assert group_of_file(baseline, DeviceType.EV) == group
+    assert group_of_file(experiment, DeviceType.EV) == group
+    assert ExperimentDescription.parse(experiment, DeviceType.EV).get_baseline_file_name() == baseline
+
+
+def test_elaad_baseline_group():
+    assert ExperimentDescription.elaad_baseline_group("home-50-2030-11-2-17-none-20-wknd") == "home-2030"
+    assert ExperimentDescription.elaad_baseline_group("home-50-2030-11-2-17-st-1-1700-1800-20-wknd") is None
+    assert ExperimentDescription.elaad_baseline_group("baselines+a+b+c") is None
+
+
+def test_go_e_and_hp_groups():
+    assert group_of_file("pc41234_flexwindowduration12_congestionstart2020-01-04T1700_congestionduration8", DeviceType.EV) == "1234"
+    assert group_of_file("baselines+a+b+c", DeviceType.HP) == "a+b+c"